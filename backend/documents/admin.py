@@ -6,21 +6,97 @@ Features:
 - List view shows useful metadata (filename, short id, created date, size, MIME type, language).
 - A compact "Top keywords" preview column renders up to 6 small badges for quick scanning.
 - A "File" column exposes a safe link to view/download the stored file.
-- Admin search has been extended to include a substring search on the JSON `data`
-  (so you can search for keywords) while still using the standard `search_fields`.
-- Read-only fields include metadata that should not be edited manually.
-- The preview code is defensive and supports several possible shapes for `data`:
-  - list of strings (preferred in the current design)
-  - list of dicts (older formats that included counts/percent)
-  - JSON string (serialized list)
+- Read-only fields include metadata that should not be edited manually, and the
+  full extracted text (read through Document.data, never edited in the form).
+
+Built to stay fast on large tables:
+- The changelist loads only the columns it shows (CHANGELIST_COLUMNS); the
+  extracted text and score maps are never read for list pages, and previews
+  come from the stored `keywords` list.
+- Search goes through the indexes: words of fileName / extracted text via the
+  inverted index (documents/search_index.py), exact keywords via the
+  DocumentKeyword table, and a full document id. No substring scans.
+- Row counts come from EstimatedCountPaginator (cached, or the planner's row
+  estimate on big PostgreSQL tables); the unfiltered total is not counted again.
+- language / contentType filter choices are cached instead of read with a
+  SELECT DISTINCT over the table on every page.
 """
 
+import hashlib
+import json
+import uuid
+
+from django.conf import settings
 from django.contrib import admin
-from django.utils.html import format_html, format_html_join
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.db import connections
 from django.db.models import Q
+from django.utils.functional import cached_property
+from django.utils.html import format_html, format_html_join
+
+from .keyword_index import documents_with_keywords
 from .models import Document
-import json
-from typing import Any
+from .search_index import search_documents
+
+# columns read for changelist rows (list_display plus the file link)
+CHANGELIST_COLUMNS = ('id', 'fileName', 'creationDate', 'fileSize', 'contentType', 'language', 'keywords', 'file')
+
+# unfiltered tables at least this large are counted from PostgreSQL's row estimate
+ESTIMATE_MIN_ROWS = 100_000
+
+
+def _count_ttl() -> int:
+    return getattr(settings, 'DOCUMENTS_ADMIN_COUNT_TTL', 60)
+
+
+def _estimated_rows(queryset):
+    """The planner's row estimate for the queryset's table (PostgreSQL only), else None."""
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass",
+                       [queryset.model._meta.db_table])
+        row = cursor.fetchone()
+    return row[0] if row and row[0] >= ESTIMATE_MIN_ROWS else None
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator whose count does not scan the table on every page: counts are
+    cached per query for DOCUMENTS_ADMIN_COUNT_TTL seconds, and an unfiltered
+    count on a large PostgreSQL table uses the planner's estimate instead.
+    """
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        try:
+            sql, params = queryset.query.sql_with_params()
+        except Exception:
+            # e.g. an empty `id__in` list: nothing worth caching
+            return queryset.count()
+        key = 'documents:admin:count:' + hashlib.sha256(f"{sql}|{params}".encode('utf-8')).hexdigest()
+        count = cache.get(key)
+        if count is None:
+            count = _estimated_rows(queryset) if not queryset.query.where else None
+            if count is None:
+                count = queryset.count()
+            cache.set(key, count, _count_ttl())
+        return count
+
+
+class CachedValuesListFilter(admin.AllValuesFieldListFilter):
+    """AllValuesFieldListFilter whose choices (SELECT DISTINCT over the table) are cached."""
+
+    def __init__(self, field, request, params, model, model_admin, field_path):
+        super().__init__(field, request, params, model, model_admin, field_path)
+        key = f'documents:admin:choices:{model._meta.label_lower}:{field_path}'
+        # lookup_choices is still a lazy queryset here; it is only run on a cache miss
+        choices = self.lookup_choices
+        self.lookup_choices = cache.get_or_set(key, lambda: list(choices), _count_ttl())
+
 
 @admin.register(Document)
 class DocumentAdmin(admin.ModelAdmin):
@@ -37,17 +113,40 @@ class DocumentAdmin(admin.ModelAdmin):
     )
 
     # Filters on the right-hand sidebar
-    list_filter = ('creationDate', 'contentType', 'language')
+    list_filter = (
+        'creationDate',
+        ('contentType', CachedValuesListFilter),
+        ('language', CachedValuesListFilter),
+    )
 
-    # Search will use fileName by default; we also override get_search_results()
+    # get_search_results() replaces the default fileName__icontains search
     search_fields = ('fileName',)
+    search_help_text = "Words of the file name or text, an exact keyword, or a document id."
 
-    # Read-only metadata in the admin form
-    readonly_fields = ('id', 'creationDate', 'fileSize', 'contentType', 'language', 'file_link', 'keywords_full')
+    # Read-only metadata in the admin form. The extracted text is shown through
+    # full_text (inlineData only holds a snippet when the text is stored compressed);
+    # editing it here would bypass the search, keyword and similarity indexes.
+    exclude = ('inlineData',)
+    readonly_fields = ('id', 'creationDate', 'fileSize', 'contentType', 'language', 'textCompressed', 'file_link',
+                       'keywords_full', 'full_text')
+
+    # newest first, served by document_created_id_idx
+    ordering = ('-creationDate', '-id')
 
     # How many items per admin page
     list_per_page = 30
 
+    # counts: see EstimatedCountPaginator; the unfiltered total is not counted separately
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+        match = getattr(request, 'resolver_match', None)
+        if match is not None and match.url_name == f'{self.opts.app_label}_{self.opts.model_name}_changelist':
+            queryset = queryset.only(*CHANGELIST_COLUMNS)
+        return queryset
+
     # Optional: make the id column shorter and more readable
     def short_id(self, obj: Document) -> str:
         """Show a truncated ID for readability in list view."""
@@ -69,47 +168,10 @@ class DocumentAdmin(admin.ModelAdmin):
 
     def keywords_preview(self, obj: Document) -> str:
         """
-        Render a compact preview of keywords stored in obj.data.
-        Accepts:
-          - a Python list of strings: ['invoice', 'due date']
-          - a Python list of dicts: [{'word':'invoice','count':4,'percent':1.2}, ...]
-          - a JSON string representing one of the above
-        Shows up to 6 badges; if there's no data, shows a muted hint.
+        Render a compact preview of the stored keywords (obj.keywords, best first).
+        Shows up to 6 badges; if there are none, shows a muted hint.
         """
-        raw = getattr(obj, 'data', None)
-        if not raw:
-            return format_html('<span style="color:#888;">No keywords</span>')
-
-        # Defensive: parse JSON string if necessary
-        parsed = None
-        try:
-            if isinstance(raw, str):
-                # attempt to parse JSON string
-                parsed = json.loads(raw)
-            else:
-                parsed = raw
-        except Exception:
-            parsed = None
-
-        if not parsed or not isinstance(parsed, (list, tuple)):
-            return format_html('<span style="color:#888;">Invalid data</span>')
-
-        # Build labels for up to 6 items. Support both dict and string item shapes.
-        labels = []
-        for item in parsed[:6]:
-            if isinstance(item, dict):
-                # dict may be {word:..., count:..., percent:...} or other
-                word = item.get('word') or item.get('keyword') or item.get('k') or ''
-                pct = item.get('percent')
-                if pct is not None:
-                    label = f"{word} ({pct}%)"
-                else:
-                    label = f"{word}"
-            else:
-                # fallback: treat item as plain string
-                label = str(item)
-            labels.append(label)
-
+        labels = [str(kw) for kw in (obj.keywords or [])[:6] if kw]
         if not labels:
             return format_html('<span style="color:#888;">No keywords</span>')
 
@@ -121,46 +183,46 @@ class DocumentAdmin(admin.ModelAdmin):
         )
         return html
     keywords_preview.short_description = "Top keywords"
-    keywords_preview.allow_tags = True
 
     def keywords_full(self, obj: Document) -> str:
         """
-        Read-only field to show the full JSON of keywords in the detail view.
+        Read-only field to show the keyword stats (word, score, percent) in the detail view.
         This is helpful for inspection when you click into a Document.
         """
-        raw = getattr(obj, 'data', None)
-        if not raw:
+        stats = obj.keywordStats or obj.keywords
+        if not stats:
             return "(empty)"
-        try:
-            # Pretty-print JSON when possible
-            if isinstance(raw, str):
-                parsed = json.loads(raw)
-            else:
-                parsed = raw
-            pretty = json.dumps(parsed, ensure_ascii=False, indent=2)
-            # wrap in <pre> with small styling
-            return format_html('<pre style="max-width:900px; white-space:pre-wrap; font-size:12px;">{}</pre>', pretty)
-        except Exception:
-            # last resort: show str()
-            return format_html('<pre style="font-size:12px;">{}</pre>', str(raw))
+        pretty = json.dumps(stats, ensure_ascii=False, indent=2)
+        # wrap in <pre> with small styling
+        return format_html('<pre style="max-width:900px; white-space:pre-wrap; font-size:12px;">{}</pre>', pretty)
     keywords_full.short_description = "Keywords (full)"
 
+    def full_text(self, obj: Document) -> str:
+        """Read-only field with the full extracted text, wherever it is stored (Document.data)."""
+        text = obj.data
+        if not text:
+            return "(empty)"
+        return format_html('<pre style="max-width:900px; white-space:pre-wrap; font-size:12px;">{}</pre>', text)
+    full_text.short_description = "Extracted text"
+
     def get_search_results(self, request, queryset, search_term):
         """
-        Extend admin search:
-          - keep default behavior for fileName (and other search_fields)
-          - also include documents whose JSON `data` contains the substring `search_term`
-        This allows searching for keywords (simple substring match) without indexing.
+        Index-backed admin search. A document matches when
+          - every word of `search_term` occurs in its file name or text
+            (inverted index; the best DOCUMENTS_ADMIN_SEARCH_LIMIT matches are kept),
+          - or `search_term` is exactly one of its keywords,
+          - or `search_term` is its id.
         """
-        qs, use_distinct = super().get_search_results(request, queryset, search_term)
+        term = search_term.strip()
+        if not term:
+            return queryset, False
 
-        if search_term:
-            try:
-                # data__icontains works for JSON/text backends where Django supports it.
-                extra_qs = queryset.filter(Q(data__icontains=search_term) | Q(fileName__icontains=search_term))
-                qs = (qs | extra_qs).distinct()
-            except Exception:
-                # If the DB backend does not support data__icontains, ignore gracefully.
-                pass
-
-        return qs, use_distinct
+        limit = getattr(settings, 'DOCUMENTS_ADMIN_SEARCH_LIMIT', 1000)
+        ids = [doc_id for doc_id, _ in search_documents(term, mode='and')[:limit]]
+        condition = Q(id__in=ids) | Q(id__in=documents_with_keywords([term]))
+        try:
+            condition |= Q(id=uuid.UUID(term))
+        except ValueError:
+            pass
+        # id lookups only, so no duplicate rows and no DISTINCT
+        return queryset.filter(condition), False
@@ -2,6 +2,8 @@
 """
 AddDocumentAPIView (POST /api/documents/)
 Saves uploaded file, then extracts text and updates the Document record.
+The row is inserted once with its metadata; the extracted text is written by
+one targeted UPDATE.
 """
 
 from rest_framework.views import APIView
@@ -11,6 +13,8 @@ from rest_framework import status
 
 from ..models import Document
 from ..serializers import DocumentSerializer
+from ..search_index import index_document
+from ..uploads import use_hashing_upload_handler, upload_sha256
 from ..utils.extractors import extract_text_from_pdf
 
 
@@ -18,6 +22,8 @@ class AddDocumentAPIView(APIView):
     parser_classes = (MultiPartParser, FormParser)
 
     def post(self, request, format=None):
+        # stream the upload to a temp file, hashing chunks as they are written
+        use_hashing_upload_handler(request)
         upload = request.FILES.get('file')
         if not upload:
             return Response({"detail": "No file provided. Provide a file field in form-data."},
@@ -35,31 +41,32 @@ class AddDocumentAPIView(APIView):
             doc.contentType = getattr(upload, 'content_type', '') or ''
         except Exception:
             doc.contentType = ''
+        doc.contentHash = upload_sha256(upload)
 
-        # Save once to write file to storage so path/size are available
+        # Save once to write file to storage so the path is available
         doc.save()
 
-        # Try to read bytes for extraction
+        # Extract from the stored file; bytes are only read for storages without local paths
         file_bytes = None
         file_path = None
         try:
-            if hasattr(doc.file, 'path'):
-                file_path = doc.file.path
-                with open(file_path, 'rb') as f:
-                    file_bytes = f.read()
-            else:
+            file_path = doc.file.path
+        except NotImplementedError:
+            try:
                 # fallback to uploaded file object
                 uploaded_file = doc.file
                 uploaded_file.open(mode='rb')
                 file_bytes = uploaded_file.read()
                 uploaded_file.close()
-        except Exception:
-            file_bytes = None
+            except Exception:
+                file_bytes = None
 
-        # Extract text and save it
-        extracted = extract_text_from_pdf(file_path=file_path, file_bytes=file_bytes)
+        # Extract text and write only the columns that changed
+        extracted = extract_text_from_pdf(file_path=file_path, file_bytes=file_bytes, content_type=doc.contentType)
         doc.data = extracted or ''
-        doc.save()
+        doc.status = Document.STATUS_DONE
+        doc.save(update_fields=['data', 'status'])
+        index_document(doc.id, doc.fileName, doc.data)
 
         serializer = DocumentSerializer(doc, context={'request': request})
         return Response(serializer.data, status=status.HTTP_201_CREATED)
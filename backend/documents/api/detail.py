@@ -17,15 +17,8 @@ class DocumentDetailAPIView(RetrieveDestroyAPIView):
     lookup_field = 'id'  # model's PK (UUID) is "id"
 
     def perform_destroy(self, instance):
-        # delete file from storage (if any) then delete DB row
-        try:
-            name = instance.file.name
-            if name:
-                instance.file.delete(save=False)
-        except Exception:
-            # swallow errors deleting the file to ensure DB row removal
-            pass
-        instance.delete()
+        # delete the DB row, then the stored file unless another document shares it
+        instance.delete_with_file()
 
     def delete(self, request, *args, **kwargs):
         instance = self.get_object()
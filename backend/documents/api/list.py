@@ -1,17 +1,22 @@
 # documents/api/list.py
 """
-DocumentListAPIView — returns all documents (most recent first).
+DocumentListAPIView — returns all documents (most recent first) as summaries.
 Uses the Document model fields in camelCase (creationDate).
+Supports ?fields=a,b,... like DocumentViewSet.list (see documents/mixins.py).
+Cursor-paginated on (creationDate, id); see documents/pagination.py.
 """
 
 from rest_framework.generics import ListAPIView
+from ..mixins import DocumentListFieldsMixin
 from ..models import Document
+from ..pagination import DocumentCursorPagination
 from ..serializers import DocumentSerializer
 from rest_framework.permissions import AllowAny
 
-class DocumentListAPIView(ListAPIView):
+class DocumentListAPIView(DocumentListFieldsMixin, ListAPIView):
     # Use the actual field name that exists on the model: creationDate
-    queryset = Document.objects.all().order_by('-creationDate')
+    queryset = Document.objects.all().order_by('-creationDate', '-id')
     serializer_class = DocumentSerializer
     permission_classes = [AllowAny]
+    pagination_class = DocumentCursorPagination
 
@@ -0,0 +1,136 @@
+# documents/downloads.py
+"""
+File responses for the download action.
+
+ - ETag is the stored content hash (contentHash), Last-Modified the file's mtime;
+   If-None-Match / If-Modified-Since are answered with 304.
+ - A single `Range: bytes=...` request gets 206 with just that slice (416 when it
+   lies outside the file). `If-Range` is honoured: when its validator no longer
+   matches, the whole file is sent instead. Multi-range requests get the whole file.
+ - With DOCUMENTS_DOWNLOAD_SENDFILE set, the worker only sends headers and lets the
+   front web server stream the file (which then also handles Range requests):
+     'x-sendfile'        -> X-Sendfile: <absolute path>     (Apache mod_xsendfile, lighttpd)
+     'x-accel-redirect'  -> X-Accel-Redirect: <prefix><name> (nginx internal location)
+   Both values are percent-encoded (urllib.parse.quote) so non-ASCII names survive.
+   DOCUMENTS_DOWNLOAD_ACCEL_PREFIX (default '/protected/') is the nginx location
+   that maps to MEDIA_ROOT.
+"""
+
+import os
+import re
+from typing import Optional, Tuple
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import content_disposition_header, http_date, parse_http_date_safe, quote_etag
+
+RANGE_CHUNK_SIZE = 64 * 1024
+
+_RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    Parse a single-range `Range` header into inclusive (start, end) byte offsets.
+    Returns None when the header should be ignored (missing, malformed, several
+    ranges); raises ValueError when the range cannot be satisfied.
+    """
+    match = _RANGE_RE.match((header or '').replace(' ', ''))
+    if not match:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # suffix range: the last N bytes
+        length = int(last)
+        if length == 0:
+            raise ValueError('empty suffix range')
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or (last and int(last) < start):
+        raise ValueError('range not satisfiable')
+    return start, end
+
+
+def _if_range_matches(request, etag: Optional[str], mtime: int) -> bool:
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if not if_range:
+        return True
+    if if_range.startswith('"') or if_range.startswith('W/'):
+        # strong comparison only: weak validators never match If-Range
+        return etag is not None and if_range == etag
+    modified = parse_http_date_safe(if_range)
+    return modified is not None and modified == mtime
+
+
+def _iter_slice(path: str, start: int, length: int):
+    with open(path, 'rb') as f:
+        f.seek(start)
+        remaining = length
+        while remaining > 0:
+            chunk = f.read(min(RANGE_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def _sendfile_response(doc, path: str) -> Optional[HttpResponse]:
+    mode = (getattr(settings, 'DOCUMENTS_DOWNLOAD_SENDFILE', None) or '').lower()
+    if not mode:
+        return None
+    response = HttpResponse()
+    # header values must be ASCII: percent-encode the path (nginx and mod_xsendfile decode it);
+    # legacy uploads kept their original, possibly non-ASCII, names
+    if mode == 'x-sendfile':
+        response['X-Sendfile'] = quote(path)
+    elif mode == 'x-accel-redirect':
+        prefix = getattr(settings, 'DOCUMENTS_DOWNLOAD_ACCEL_PREFIX', '/protected/')
+        response['X-Accel-Redirect'] = quote(prefix.rstrip('/') + '/' + doc.file.name.lstrip('/'))
+    else:
+        raise ValueError(f"Unknown DOCUMENTS_DOWNLOAD_SENDFILE mode: {mode!r}")
+    # the front server fills in the body, its length and any Range handling
+    del response['Content-Type']
+    return response
+
+
+def file_download_response(request, doc, path: str) -> HttpResponse:
+    """Attachment response for `doc`'s stored file at `path` (see module docstring)."""
+    stat = os.stat(path)
+    size = stat.st_size
+    mtime = int(stat.st_mtime)
+    etag = quote_etag(doc.contentHash) if doc.contentHash else None
+
+    response = get_conditional_response(request, etag=etag, last_modified=mtime)
+    if response is None:
+        response = _sendfile_response(doc, path)
+    if response is None:
+        byte_range = None
+        if request.method in ('GET', 'HEAD') and _if_range_matches(request, etag, mtime):
+            try:
+                byte_range = parse_range(request.META.get('HTTP_RANGE'), size)
+            except ValueError:
+                response = HttpResponse(status=416)
+                response['Content-Range'] = f'bytes */{size}'
+        if response is None and byte_range is not None:
+            start, end = byte_range
+            response = StreamingHttpResponse(_iter_slice(path, start, end - start + 1), status=206)
+            response['Content-Range'] = f'bytes {start}-{end}/{size}'
+            response['Content-Length'] = str(end - start + 1)
+        elif response is None:
+            response = FileResponse(open(path, 'rb'))
+            response['Content-Length'] = str(size)
+
+    if response.status_code in (200, 206) or 'X-Sendfile' in response or 'X-Accel-Redirect' in response:
+        if doc.contentType:
+            response['Content-Type'] = doc.contentType
+        response['Content-Disposition'] = content_disposition_header(True, doc.fileName or os.path.basename(path))
+    response['Accept-Ranges'] = 'bytes'
+    if etag:
+        response['ETag'] = etag
+    response['Last-Modified'] = http_date(mtime)
+    return response
@@ -0,0 +1,101 @@
+# documents/extraction_cache.py
+"""
+Content-addressed cache for extraction results.
+
+Re-uploads of the same bytes skip PDF/OCR extraction and YAKE entirely:
+results (data, keywords, keyword_scores, language, diagnostics) are stored under a key
+derived from the file's SHA-256 plus every parameter that affects the output
+(extractor version, max_ngram, top_k, forced language). The table is bounded
+by DOCUMENTS_EXTRACTION_CACHE_SIZE entries (default 5000, 0 disables the
+cache) with least-recently-used eviction; to keep inserts cheap, the size is
+only checked every EVICT_EVERY new entries (at most a tenth of the bound), so
+the table can briefly run that far over it. The text follows
+DOCUMENTS_TEXT_COMPRESSION like document texts do (documents/text_store.py).
+Extractions that produced no text are not cached, so a file is extracted
+again once e.g. OCR becomes available.
+"""
+
+import hashlib
+import logging
+import threading
+from typing import Optional
+
+from django.conf import settings
+from django.utils import timezone
+
+from . import text_store
+from .models import ExtractionCacheEntry
+
+logger = logging.getLogger(__name__)
+
+CACHED_FIELDS = ('data', 'keywords', 'keyword_scores', 'language', 'diagnostics')
+
+# new entries between two eviction sweeps (each sweep counts the table)
+EVICT_EVERY = 100
+
+_inserts = 0
+_inserts_lock = threading.Lock()
+
+
+def max_entries() -> int:
+    return getattr(settings, 'DOCUMENTS_EXTRACTION_CACHE_SIZE', 5000)
+
+
+def cache_key(content_hash: str, extractor_version, max_ngram: int, top_k: int, language: Optional[str] = None) -> str:
+    """Key for one (file content, extraction parameters) combination."""
+    raw = f"{content_hash}|v{extractor_version}|n{max_ngram}|k{top_k}|{language or ''}"
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+def get_cached(key: str) -> Optional[dict]:
+    """Return the cached fields for `key` (marking the entry as recently used), or None."""
+    if max_entries() <= 0:
+        return None
+    entry = ExtractionCacheEntry.objects.filter(key=key).first()
+    if entry is None:
+        return None
+    ExtractionCacheEntry.objects.filter(key=key).update(lastUsed=timezone.now())
+    fields = {name: getattr(entry, name) for name in CACHED_FIELDS}
+    if entry.codec:
+        fields['data'] = text_store.decompress(entry.codec, entry.body)
+    return fields
+
+
+def store(key: str, fields: dict) -> None:
+    """
+    Insert or refresh an entry (unless the extraction found no text); every so
+    many inserts, evict the least recently used entries beyond the size bound.
+    """
+    limit = max_entries()
+    if limit <= 0 or not (fields.get('data') or '').strip():
+        return
+    values = {name: fields[name] for name in CACHED_FIELDS}
+    _, compressed = text_store.encode_text(values['data'])
+    if compressed is not None:
+        values.update(data='', codec=compressed['codec'], body=compressed['body'])
+    else:
+        values.update(codec='', body=None)
+    values['lastUsed'] = timezone.now()
+    _, created = ExtractionCacheEntry.objects.update_or_create(key=key, defaults=values)
+    if created and _sweep_due(limit):
+        _evict(limit)
+
+
+def _sweep_due(limit: int) -> bool:
+    """Count one new entry; True every EVICT_EVERY-th (never more than limit // 10) of them."""
+    global _inserts
+    with _inserts_lock:
+        _inserts += 1
+        if _inserts < max(1, min(EVICT_EVERY, limit // 10)):
+            return False
+        _inserts = 0
+        return True
+
+
+def _evict(limit: int) -> None:
+    excess = ExtractionCacheEntry.objects.count() - limit
+    if excess <= 0:
+        return
+    stale = list(ExtractionCacheEntry.objects.order_by('lastUsed').values_list('key', flat=True)[:excess])
+    ExtractionCacheEntry.objects.filter(key__in=stale).delete()
+    logger.debug("Evicted %d extraction cache entries", len(stale))
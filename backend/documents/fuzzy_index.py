@@ -0,0 +1,107 @@
+# documents/fuzzy_index.py
+"""
+Typo-tolerant term lookup for /api/documents/search/?fuzzy=1.
+
+The vocabulary is every word of document file names and extracted keywords
+(FuzzyTerm), with its character trigrams stored in FuzzyTrigram. Each word is
+padded with two leading spaces and one trailing space, so "tax" gives
+"  t", " ta", "tax", "ax ". A misspelled query word is resolved in two steps:
+
+ 1. candidates: vocabulary terms sharing the most trigrams with the word,
+    one grouped lookup on the (trigram, term) index (no scan of documents);
+ 2. re-ranking: candidates within MAX_EDITS Damerau-Levenshtein edits and a
+    Jaro-Winkler similarity of at least DOCUMENTS_FUZZY_MIN_SIMILARITY
+    (default 0.85) are kept, best first.
+
+The caller (search_index.search_documents) then looks the resolved terms up
+in the inverted index, weighting each by its similarity.
+"""
+
+from typing import Dict, Iterable, List, Set
+
+import jellyfish
+from django.conf import settings
+from django.db.models import Count
+
+from .models import FuzzyTerm, FuzzyTrigram
+
+# shorter words only match exactly: a single edit changes most of their trigrams
+MIN_FUZZY_LENGTH = 3
+
+# trigram candidates fetched per query word before re-ranking
+MAX_CANDIDATES = 50
+
+# resolved terms kept per query word
+MAX_EXPANSIONS = 5
+
+MAX_TERM_LENGTH = FuzzyTerm._meta.get_field('term').max_length
+
+
+def trigrams(word: str) -> Set[str]:
+    padded = f"  {word} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def max_edits(word: str) -> int:
+    return 1 if len(word) <= 5 else 2
+
+
+def add_terms(terms: Iterable[str]) -> int:
+    """Add new words to the vocabulary with their trigrams. Returns the number of new terms."""
+    terms = {t for t in terms if t and len(t) <= MAX_TERM_LENGTH}
+    if not terms:
+        return 0
+    known = set(FuzzyTerm.objects.filter(term__in=terms).values_list('term', flat=True))
+    new = terms - known
+    if not new:
+        return 0
+    FuzzyTerm.objects.bulk_create([FuzzyTerm(term=t) for t in new], ignore_conflicts=True, batch_size=1000)
+    ids = dict(FuzzyTerm.objects.filter(term__in=new).values_list('term', 'id'))
+    FuzzyTrigram.objects.bulk_create(
+        [FuzzyTrigram(trigram=gram, term_id=ids[t]) for t in new if t in ids for gram in trigrams(t)],
+        ignore_conflicts=True, batch_size=1000,
+    )
+    return len(new)
+
+
+def expand_term(word: str) -> Dict[str, float]:
+    """
+    Vocabulary terms matching `word` despite typos, as {term: similarity in (0, 1]}.
+    The word itself is always included with similarity 1.
+    """
+    expansions = {word: 1.0}
+    if len(word) < MIN_FUZZY_LENGTH:
+        return expansions
+
+    grams = trigrams(word)
+    # an edit changes up to 3 padded trigrams, a transposition up to 4 ("tcaks" -> "tacks"),
+    # so a term within max_edits edits keeps at least len(grams) - 4 * max_edits of them
+    min_shared = max(1, len(grams) - 4 * max_edits(word))
+    candidates = (FuzzyTrigram.objects.filter(trigram__in=grams)
+                  .values('term__term')
+                  .annotate(shared=Count('id'))
+                  .filter(shared__gte=min_shared)
+                  .order_by('-shared', 'term__term')[:MAX_CANDIDATES])
+
+    min_similarity = getattr(settings, 'DOCUMENTS_FUZZY_MIN_SIMILARITY', 0.85)
+    scored = []
+    for row in candidates:
+        term = row['term__term']
+        if term == word or jellyfish.damerau_levenshtein_distance(word, term) > max_edits(word):
+            continue
+        similarity = jellyfish.jaro_winkler_similarity(word, term)
+        if similarity >= min_similarity:
+            scored.append((similarity, term))
+    scored.sort(key=lambda x: (-x[0], x[1]))
+    for similarity, term in scored[:MAX_EXPANSIONS - 1]:
+        expansions[term] = similarity
+    return expansions
+
+
+def expand_terms(words: Iterable[str]) -> List[Dict[str, float]]:
+    """expand_term() for each distinct query word, in query order."""
+    seen = []
+    for word in words:
+        if word not in seen:
+            seen.append(word)
+    return [expand_term(word) for word in seen]
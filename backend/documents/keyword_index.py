@@ -0,0 +1,96 @@
+# documents/keyword_index.py
+"""
+Exact keyword lookup over the DocumentKeyword table.
+
+Document.keywords stays the JSON list shown to clients; next to it every
+keyword is stored as one DocumentKeyword row (document, keyword, score, rank)
+so that filtering by keyword is a lookup on the (keyword, document) index
+instead of a substring scan over serialized JSON, and "tax" no longer matches
+"taxi". Keywords are compared after normalize_keyword(): case-folded with
+whitespace collapsed.
+
+Rows are written by the extraction pipeline (one bulk insert per document) and
+by backfill_keywords (one bulk insert per batch).
+"""
+
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from django.db import transaction
+from django.db.models import Count
+
+from . import fuzzy_index
+from .models import DocumentKeyword
+from .search_index import tokenize
+
+MAX_KEYWORD_LENGTH = DocumentKeyword._meta.get_field('keyword').max_length
+
+# facet counts returned when the caller does not ask for a number
+DEFAULT_FACETS = 20
+
+
+def normalize_keyword(keyword: str) -> str:
+    return ' '.join((keyword or '').split()).casefold()
+
+
+def keyword_rows(doc_id, keywords: Sequence[str], keyword_scores: Optional[Dict[str, float]] = None) -> List[DocumentKeyword]:
+    """DocumentKeyword rows for `keywords` (best first); duplicates after normalization keep the first rank."""
+    keyword_scores = keyword_scores or {}
+    rows = []
+    seen = set()
+    for kw in keywords or []:
+        norm = normalize_keyword(kw)
+        if not norm or len(norm) > MAX_KEYWORD_LENGTH or norm in seen:
+            continue
+        seen.add(norm)
+        score = keyword_scores.get(kw)
+        rows.append(DocumentKeyword(document_id=doc_id, keyword=norm,
+                                    score=float(score) if score is not None else None, rank=len(rows) + 1))
+    return rows
+
+
+def index_keywords(doc_id, keywords: Sequence[str], keyword_scores: Optional[Dict[str, float]] = None) -> int:
+    """Replace the keyword rows of one document. Returns the number of rows written."""
+    return index_keywords_bulk([(doc_id, keywords, keyword_scores)])
+
+
+def index_keywords_bulk(items: Iterable[Tuple[object, Sequence[str], Optional[Dict[str, float]]]]) -> int:
+    """
+    Replace the keyword rows of several documents, given as (doc_id, keywords,
+    keyword_scores), with one DELETE and one batched INSERT.
+    """
+    items = list(items)
+    rows = [row for doc_id, keywords, scores in items for row in keyword_rows(doc_id, keywords, scores)]
+    with transaction.atomic():
+        DocumentKeyword.objects.filter(document_id__in=[doc_id for doc_id, _, _ in items]).delete()
+        DocumentKeyword.objects.bulk_create(rows, batch_size=1000)
+        fuzzy_index.add_terms({word for row in rows for word in tokenize(row.keyword)})
+    return len(rows)
+
+
+def documents_with_keywords(keywords: Sequence[str]):
+    """
+    Values queryset of the ids of documents having every one of `keywords`,
+    usable as a subquery (`Document.objects.filter(id__in=...)`).
+    """
+    wanted = sorted({normalize_keyword(k) for k in keywords} - {''})
+    return (DocumentKeyword.objects.filter(keyword__in=wanted)
+            .values('document')
+            .annotate(matched=Count('keyword'))
+            .filter(matched=len(wanted))
+            .values('document'))
+
+
+def keyword_facets(document_ids, limit: int = DEFAULT_FACETS, exclude: Sequence[str] = ()) -> List[dict]:
+    """
+    Most frequent keywords among `document_ids` (a list or id subquery), as
+    [{'keyword', 'count'}] by count desc then keyword. Keywords in `exclude`
+    (typically the active filter) are left out.
+    """
+    qs = DocumentKeyword.objects.filter(document__in=document_ids)
+    skip = [normalize_keyword(k) for k in exclude]
+    if skip:
+        qs = qs.exclude(keyword__in=skip)
+    facets = (qs.values('keyword')
+              .annotate(count=Count('document'))
+              .order_by('-count', 'keyword')[:limit])
+    return [{'keyword': f['keyword'], 'count': f['count']} for f in facets]
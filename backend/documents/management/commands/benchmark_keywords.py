@@ -0,0 +1,56 @@
+import time
+
+from django.core.management.base import BaseCommand
+from documents.models import Document
+from documents.pipeline import KEYWORD_MAX_NGRAM, KEYWORD_TOP_K
+from documents.utils import keywords as kw
+
+
+class Command(BaseCommand):
+    help = ("Benchmark per-document YAKE cost: a fresh KeywordExtractor per call (old behaviour) "
+            "vs pooled extractors and extract_keywords_batch, over stored document text.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=50, help='Number of stored documents to use')
+        parser.add_argument('--max-chars', type=int, default=2000,
+                            help='Truncate each text to this many characters (0 = full text); '
+                                 'short texts are where per-call setup dominates')
+        parser.add_argument('--repeat', type=int, default=3, help='Passes over the sample; best pass is reported')
+
+    def handle(self, *args, **options):
+        import yake
+
+        docs = list(Document.objects.exclude(inlineData='').order_by('-creationDate')
+                    .only('inlineData', 'textCompressed', 'language')
+                    .prefetch_related('compressedText')[:options['limit']])
+        if not docs:
+            self.stdout.write("No documents with extracted text to benchmark.")
+            return
+        max_chars = options['max_chars']
+        texts = [doc.data[:max_chars] if max_chars else doc.data for doc in docs]
+        langs = [doc.language or kw.DEFAULT_LANG for doc in docs]
+
+        def fresh():
+            for text, lang in zip(texts, langs):
+                yake.KeywordExtractor(lan=lang, n=KEYWORD_MAX_NGRAM, top=KEYWORD_TOP_K).extract_keywords(text)
+
+        def pooled():
+            for text, lang in zip(texts, langs):
+                kw.extract_keywords_with_scores(text, KEYWORD_MAX_NGRAM, KEYWORD_TOP_K, lang_hint=lang)
+
+        def batch():
+            kw.extract_keywords_batch(texts, KEYWORD_MAX_NGRAM, KEYWORD_TOP_K, lang_hints=langs)
+
+        self.stdout.write(f"{len(texts)} documents, {sum(map(len, texts))} chars total")
+        baseline = None
+        for name, fn in (('fresh extractor per call', fresh), ('pooled extractor', pooled), ('batch API', batch)):
+            best = min(self._time(fn) for _ in range(max(1, options['repeat'])))
+            per_doc_ms = best / len(texts) * 1000.0
+            baseline = baseline or per_doc_ms
+            self.stdout.write(f"{name:<26} {per_doc_ms:8.2f} ms/doc  ({baseline / per_doc_ms:4.2f}x)")
+
+    @staticmethod
+    def _time(fn):
+        started = time.perf_counter()
+        fn()
+        return time.perf_counter() - started
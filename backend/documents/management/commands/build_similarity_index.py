@@ -0,0 +1,35 @@
+import time
+
+from django.core.management.base import BaseCommand
+from documents import similarity
+from documents.models import Document
+
+
+class Command(BaseCommand):
+    help = ("Write a fresh snapshot of the 'similar documents' matrix (memory-mapped by every server "
+            "process). --recompute first rebuilds all vectors from stored keywords (needed for documents "
+            "extracted before vectors existed, or after changing DOCUMENTS_SIMILARITY_DIMENSIONS).")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recompute', action='store_true', help='Recompute every vector from stored keywords')
+        parser.add_argument('--batch-size', type=int, default=500, help='Documents per vector batch')
+        parser.add_argument('--directory', help='Snapshot directory (default DOCUMENTS_SIMILARITY_DIR, else MEDIA_ROOT/similarity_index)')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        if options.get('recompute'):
+            batch_size = max(1, options['batch_size'])
+            qs = Document.objects.order_by('id').only('id', 'keywords', 'keyword_scores')
+            last_id = None
+            stored = 0
+            while True:
+                page = qs.filter(id__gt=last_id) if last_id else qs
+                batch = list(page[:batch_size])
+                if not batch:
+                    break
+                stored += similarity.store_vectors((doc.id, doc.keywords, doc.keyword_scores) for doc in batch)
+                last_id = batch[-1].id
+            self.stdout.write(f"Stored {stored} vectors.")
+
+        rows = similarity.write_snapshot(options.get('directory'))
+        self.stdout.write(f"Done. Snapshot of {rows} documents written in {time.monotonic() - started:.1f}s.")
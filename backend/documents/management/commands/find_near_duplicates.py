@@ -0,0 +1,54 @@
+from django.core.management.base import BaseCommand
+from documents import minhash
+from documents.models import Document
+
+
+class Command(BaseCommand):
+    help = ("Report clusters of near-duplicate documents (MinHash/LSH over extracted text). "
+            "--index-missing first computes signatures for documents extracted before they existed, "
+            "--rebuild recomputes all of them.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threshold', type=float, default=None,
+                            help='Minimum estimated similarity (default DOCUMENTS_NEAR_DUPLICATE_THRESHOLD)')
+        parser.add_argument('--max-bucket', type=int, default=500,
+                            help='Skip LSH buckets holding more documents than this (boilerplate text)')
+        parser.add_argument('--index-missing', action='store_true',
+                            help='Compute signatures for extracted documents that have none')
+        parser.add_argument('--rebuild', action='store_true',
+                            help='Recompute the signatures of all extracted documents (after the hash permutations changed)')
+        parser.add_argument('--batch-size', type=int, default=200, help='Documents per signature batch')
+
+    def handle(self, *args, **options):
+        if options.get('index_missing') or options.get('rebuild'):
+            self._index_missing(max(1, options['batch_size']), rebuild=options.get('rebuild'))
+
+        clusters, skipped = minhash.duplicate_clusters(options.get('threshold'), max(2, options['max_bucket']))
+        names = {}
+        ids = [doc_id for members in clusters for doc_id in members]
+        for start in range(0, len(ids), 1000):
+            names.update(Document.objects.filter(id__in=ids[start:start + 1000]).values_list('id', 'fileName'))
+
+        for number, members in enumerate(clusters, 1):
+            self.stdout.write(f"Cluster {number} ({len(members)} documents):")
+            for doc_id in members:
+                self.stdout.write(f"  {doc_id}  {names.get(doc_id, '')}")
+        if skipped:
+            self.stdout.write(f"Skipped {skipped} oversized buckets (see --max-bucket).")
+        self.stdout.write(f"Done. {len(clusters)} clusters, {len(ids)} documents.")
+
+    def _index_missing(self, batch_size, rebuild=False):
+        qs = Document.objects.filter(status=Document.STATUS_DONE)
+        if not rebuild:
+            qs = qs.filter(minhash__isnull=True)
+        qs = qs.order_by('id').only('id', 'inlineData', 'textCompressed').prefetch_related('compressedText')
+        last_id = None
+        indexed = 0
+        while True:
+            page = qs.filter(id__gt=last_id) if last_id else qs
+            batch = list(page[:batch_size])
+            if not batch:
+                break
+            indexed += minhash.store_signatures((doc.id, minhash.signature(doc.data)) for doc in batch)
+            last_id = batch[-1].id
+        self.stdout.write(f"Indexed {indexed} signatures.")
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+from documents.models import Document
+from documents.keyword_index import index_keywords
+from documents.search_index import index_document
+
+class Command(BaseCommand):
+    help = ("Rebuild the full-text search index (DocumentTerm posting lists), the keyword table and the "
+            "fuzzy-search vocabulary from stored document text and keywords.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, help='Limit number of documents processed')
+
+    def handle(self, *args, **options):
+        limit = options.get('limit') or None
+        qs = (Document.objects.all().order_by('-creationDate')
+              .only('id', 'fileName', 'inlineData', 'textCompressed', 'keywords', 'keyword_scores')
+              .prefetch_related('compressedText'))
+        if limit:
+            qs = qs[:limit]
+
+        processed = 0
+        for doc in qs.iterator(chunk_size=200):
+            terms = index_document(doc.id, doc.fileName, doc.data)
+            index_keywords(doc.id, doc.keywords, doc.keyword_scores)
+            processed += 1
+            self.stdout.write(f"Indexed {doc.id}: {terms} terms")
+
+        self.stdout.write(f"Done. Indexed {processed} documents.")
@@ -0,0 +1,46 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from documents.models import Document
+from documents.pipeline import process_documents_bulk
+
+
+class Command(BaseCommand):
+    help = ("Re-run extraction for documents still 'pending' or 'running' after --older-than minutes. "
+            "Extraction jobs are queued in the server process, so a restart or crash drops the ones "
+            "not yet finished; run this after a deploy or from a periodic job.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than', type=int, default=15,
+                            help='Only documents uploaded at least this many minutes ago (default 15), '
+                                 'so jobs a live server is still working on are left alone')
+        parser.add_argument('--batch-size', type=int, default=100,
+                            help='Documents extracted together on the bulk process pool')
+        parser.add_argument('--dry-run', action='store_true', help='Only report how many documents are stale')
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(minutes=max(0, options['older_than']))
+        batch_size = max(1, options['batch_size'])
+        qs = (Document.objects.filter(status__in=[Document.STATUS_PENDING, Document.STATUS_RUNNING],
+                                      creationDate__lte=cutoff)
+              .order_by('id').values_list('id', flat=True))
+        if options.get('dry_run'):
+            self.stdout.write(f"{qs.count()} stale documents.")
+            return
+
+        started = time.monotonic()
+        done = 0
+        last_id = None
+        while True:
+            page = qs.filter(id__gt=last_id) if last_id else qs
+            batch = list(page[:batch_size])
+            if not batch:
+                break
+            # never raises; failures end up as status='failed'
+            process_documents_bulk(batch)
+            done += len(batch)
+            last_id = batch[-1]
+            self.stdout.write(f"Re-extracted {done} documents")
+        self.stdout.write(f"Done. {done} stale documents re-extracted in {time.monotonic() - started:.1f}s.")
@@ -0,0 +1,140 @@
+# documents/metrics.py
+"""
+Lightweight in-process metrics for the upload/extraction pipeline, rendered in
+the Prometheus text exposition format by the metrics view (GET /api/metrics/).
+
+Only histograms are needed: every observation is one bisect plus a few integer
+increments under a per-histogram lock, cheap enough to stay on in production.
+Values live in the memory of the process that records them, so each server
+worker exposes its own series (scrape every worker, or run a single one);
+management commands such as backfill_keywords print their own summary.
+
+Recorded series:
+ - documents_stage_duration_seconds{stage, content_type, language}
+   stages: store (upload written to storage), extract (PDF text / OCR),
+   language, keywords, minhash (near-duplicate signature), persist (result
+   rows), index (search index), total
+ - documents_file_bytes{content_type}: size of uploaded / processed files
+ - documents_pages{content_type}: pages (text items) produced by the extractor
+"""
+
+import math
+import re
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Dict, List, Tuple
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+BYTES_BUCKETS = tuple(float(1024 * 4 ** i) for i in range(11))  # 1 KiB .. 1 GiB
+PAGE_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+
+# label combinations kept per histogram; further ones are folded into label value 'other'
+MAX_SERIES = 500
+
+_CONTENT_TYPE_RE = re.compile(r'^[a-z0-9.+-]+/[a-z0-9.+-]+$')
+
+
+def content_type_label(content_type: str) -> str:
+    """Normalize a MIME type for use as a label value (parameters dropped, junk -> 'other')."""
+    ct = (content_type or '').split(';', 1)[0].strip().lower()
+    if not ct:
+        return 'unknown'
+    return ct if _CONTENT_TYPE_RE.match(ct) else 'other'
+
+
+class Histogram:
+    """A labelled cumulative histogram (Prometheus semantics: le buckets, _sum, _count)."""
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = DURATION_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        # label values -> [per-bucket counts (+1 for +Inf), sum]
+        self._series: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = tuple(str(labels.get(name, '')) for name in self.labelnames)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                if len(self._series) >= MAX_SERIES:
+                    key = ('other',) * len(self.labelnames)
+                series = self._series.setdefault(key, [[0] * (len(self.buckets) + 1), 0.0])
+            series[0][index] += 1
+            series[1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the duration of the with-block in seconds."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def snapshot(self) -> Dict[Tuple[str, ...], Tuple[List[int], float]]:
+        with self._lock:
+            return {key: (list(counts), total) for key, (counts, total) in self._series.items()}
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for key, (counts, total) in sorted(self.snapshot().items()):
+            labels = list(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                le = '+Inf' if bound == math.inf else _format_value(bound)
+                lines.append(f"{self.name}_bucket{_format_labels(labels + [('le', le)])} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(labels)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(labels)} {cumulative}")
+        return lines
+
+
+def _format_value(value: float) -> str:
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(labels) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(str(value))}"' for name, value in labels) + '}'
+
+
+STAGE_DURATION = Histogram('documents_stage_duration_seconds',
+                           'Seconds spent per upload/extraction stage.',
+                           ('stage', 'content_type', 'language'))
+FILE_BYTES = Histogram('documents_file_bytes', 'Size of processed files in bytes.',
+                       ('content_type',), buckets=BYTES_BUCKETS)
+PAGES = Histogram('documents_pages', 'Pages (text items) produced by the extractor per file.',
+                  ('content_type',), buckets=PAGE_BUCKETS)
+
+REGISTRY = (STAGE_DURATION, FILE_BYTES, PAGES)
+
+
+def observe_extraction(content_type: str, language: str, diagnostics: dict) -> None:
+    """Record the stage timings and page count of one extraction (see pipeline.compute_document_fields)."""
+    if not diagnostics or diagnostics.get('cached'):
+        return
+    ct = content_type_label(content_type)
+    for stage, seconds in (diagnostics.get('timings') or {}).items():
+        STAGE_DURATION.observe(seconds, stage=stage, content_type=ct, language=language or '')
+    if 'page_chars' in diagnostics:
+        PAGES.observe(len(diagnostics['page_chars']), content_type=ct)
+
+
+def render() -> str:
+    """All metrics in the Prometheus text exposition format (version 0.0.4)."""
+    lines = []
+    for histogram in REGISTRY:
+        lines.extend(histogram.render())
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,65 @@
+# Generated by Django 5.2.5 on 2026-10-17 03:53
+
+from django.db import migrations, models
+
+
+def mark_existing_done(apps, schema_editor):
+    # rows created before the background pipeline were extracted inline
+    Document = apps.get_model("documents", "Document")
+    Document.objects.update(status="done")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("documents", "0007_alter_document_table"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="document",
+            name="keyword_scores",
+            field=models.JSONField(
+                blank=True, default=dict, help_text="Mapping keyword -> extractor score"
+            ),
+        ),
+        migrations.AddField(
+            model_name="document",
+            name="keywords",
+            field=models.JSONField(
+                blank=True, default=list, help_text="List of unique keywords"
+            ),
+        ),
+        migrations.AddField(
+            model_name="document",
+            name="language",
+            field=models.CharField(
+                blank=True,
+                help_text="Language code detected (e.g. en, fr, ar)",
+                max_length=8,
+            ),
+        ),
+        migrations.AddField(
+            model_name="document",
+            name="status",
+            field=models.CharField(
+                choices=[
+                    ("pending", "Pending"),
+                    ("running", "Running"),
+                    ("done", "Done"),
+                    ("failed", "Failed"),
+                ],
+                db_index=True,
+                default="pending",
+                max_length=16,
+            ),
+        ),
+        migrations.AlterField(
+            model_name="document",
+            name="data",
+            field=models.TextField(
+                blank=True, default="", help_text="Extracted raw text"
+            ),
+        ),
+        migrations.RunPython(mark_existing_done, migrations.RunPython.noop),
+    ]
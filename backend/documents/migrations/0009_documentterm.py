@@ -0,0 +1,48 @@
+# Generated by Django 5.2.5 on 2026-10-17 03:54
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("documents", "0008_document_status"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DocumentTerm",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("term", models.CharField(max_length=64)),
+                ("frequency", models.PositiveIntegerField(default=1)),
+                (
+                    "document",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="terms",
+                        to="documents.document",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Document term",
+                "verbose_name_plural": "Document terms",
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("term", "document"),
+                        name="documentterm_term_document_uniq",
+                    )
+                ],
+            },
+        ),
+    ]
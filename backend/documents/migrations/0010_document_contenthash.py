@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-17 03:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("documents", "0009_documentterm"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="document",
+            name="contentHash",
+            field=models.CharField(blank=True, db_index=True, max_length=64),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.5 on 2026-10-17 03:57
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("documents", "0010_document_contenthash"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ExtractionCacheEntry",
+            fields=[
+                (
+                    "key",
+                    models.CharField(max_length=64, primary_key=True, serialize=False),
+                ),
+                ("data", models.TextField(blank=True, default="")),
+                ("keywords", models.JSONField(blank=True, default=list)),
+                ("keyword_scores", models.JSONField(blank=True, default=dict)),
+                ("language", models.CharField(blank=True, max_length=8)),
+                ("created", models.DateTimeField(auto_now_add=True)),
+                (
+                    "lastUsed",
+                    models.DateTimeField(
+                        db_index=True, default=django.utils.timezone.now
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Extraction cache entry",
+                "verbose_name_plural": "Extraction cache entries",
+            },
+        ),
+    ]
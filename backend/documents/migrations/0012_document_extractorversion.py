@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-17 03:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("documents", "0011_extractioncacheentry"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="document",
+            name="extractorVersion",
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+    ]
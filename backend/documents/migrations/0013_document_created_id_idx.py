@@ -0,0 +1,19 @@
+# Generated by Django 5.2.5 on 2026-10-17 04:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("documents", "0012_document_extractorversion"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="document",
+            index=models.Index(
+                fields=["-creationDate", "-id"], name="document_created_id_idx"
+            ),
+        ),
+    ]
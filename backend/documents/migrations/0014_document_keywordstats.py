@@ -0,0 +1,48 @@
+# Generated by Django 5.2.5 on 2026-10-17 04:17
+
+from django.db import migrations, models
+
+_EPS = 1e-12
+
+
+def compute_keyword_stats(apps, schema_editor):
+    # frozen copy of documents.utils.keywords.keyword_stats
+    Document = apps.get_model("documents", "Document")
+    batch = []
+    for doc in Document.objects.only("id", "creationDate", "keyword_scores").iterator(chunk_size=500):
+        invs = [(kw, float(sc or 0.0)) for kw, sc in (doc.keyword_scores or {}).items()]
+        invs = [(kw, sc, 1.0 / (sc + _EPS)) for kw, sc in invs]
+        total_inv = sum(inv for (_, _, inv) in invs) or 1.0
+        stats = [{"word": kw, "score": sc, "percent": round((inv / total_inv) * 100.0, 1)} for kw, sc, inv in invs]
+        stats.sort(key=lambda x: x["percent"], reverse=True)
+        doc.keywordStats = stats
+        doc.keywordsUpdated = doc.creationDate
+        batch.append(doc)
+        if len(batch) >= 500:
+            Document.objects.bulk_update(batch, ["keywordStats", "keywordsUpdated"])
+            batch = []
+    if batch:
+        Document.objects.bulk_update(batch, ["keywordStats", "keywordsUpdated"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("documents", "0013_document_created_id_idx"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="document",
+            name="keywordStats",
+            field=models.JSONField(
+                blank=True, default=list, help_text="Normalized keyword statistics"
+            ),
+        ),
+        migrations.AddField(
+            model_name="document",
+            name="keywordsUpdated",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(compute_keyword_stats, migrations.RunPython.noop),
+    ]
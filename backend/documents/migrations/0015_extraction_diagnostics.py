@@ -0,0 +1,25 @@
+# Generated by Django 5.2.5 on 2026-10-17 04:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("documents", "0014_document_keywordstats"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="document",
+            name="diagnostics",
+            field=models.JSONField(
+                blank=True, default=dict, help_text="Extraction diagnostics"
+            ),
+        ),
+        migrations.AddField(
+            model_name="extractioncacheentry",
+            name="diagnostics",
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
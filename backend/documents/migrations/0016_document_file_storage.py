@@ -0,0 +1,25 @@
+# Generated by Django 5.2.5 on 2026-10-17 04:26
+
+import documents.models
+import documents.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("documents", "0015_extraction_diagnostics"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="document",
+            name="file",
+            field=models.FileField(
+                blank=True,
+                null=True,
+                storage=documents.storage.document_storage,
+                upload_to=documents.models.upload_to_uploads,
+            ),
+        ),
+    ]
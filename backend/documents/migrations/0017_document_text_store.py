@@ -0,0 +1,62 @@
+# Generated by Django 5.2.5 on 2026-10-17 05:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("documents", "0016_document_file_storage"),
+    ]
+
+    operations = [
+        # the model field is renamed; the column stays `data`
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.RenameField(
+                    model_name="document",
+                    old_name="data",
+                    new_name="inlineData",
+                ),
+                migrations.AlterField(
+                    model_name="document",
+                    name="inlineData",
+                    field=models.TextField(
+                        blank=True,
+                        db_column="data",
+                        default="",
+                        help_text="Extracted raw text",
+                    ),
+                ),
+            ],
+            database_operations=[],
+        ),
+        migrations.AddField(
+            model_name="document",
+            name="textCompressed",
+            field=models.BooleanField(default=False),
+        ),
+        migrations.CreateModel(
+            name="DocumentText",
+            fields=[
+                (
+                    "document",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="compressedText",
+                        serialize=False,
+                        to="documents.document",
+                    ),
+                ),
+                ("codec", models.CharField(max_length=8)),
+                ("body", models.BinaryField()),
+                ("chars", models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                "verbose_name": "Document text",
+                "verbose_name_plural": "Document texts",
+            },
+        ),
+    ]
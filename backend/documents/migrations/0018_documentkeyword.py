@@ -0,0 +1,73 @@
+# Generated by Django 5.2.5 on 2026-10-17 05:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def populate_keywords(apps, schema_editor):
+    # frozen copy of documents.keyword_index.keyword_rows
+    Document = apps.get_model("documents", "Document")
+    DocumentKeyword = apps.get_model("documents", "DocumentKeyword")
+    rows = []
+    for doc in Document.objects.only("id", "keywords", "keyword_scores").iterator(chunk_size=500):
+        scores = doc.keyword_scores or {}
+        seen = set()
+        for kw in doc.keywords or []:
+            norm = " ".join((kw or "").split()).casefold()
+            if not norm or len(norm) > 128 or norm in seen:
+                continue
+            seen.add(norm)
+            score = scores.get(kw)
+            rows.append(DocumentKeyword(document_id=doc.id, keyword=norm,
+                                        score=float(score) if score is not None else None, rank=len(seen)))
+        if len(rows) >= 5000:
+            DocumentKeyword.objects.bulk_create(rows, batch_size=1000)
+            rows = []
+    if rows:
+        DocumentKeyword.objects.bulk_create(rows, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("documents", "0017_document_text_store"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DocumentKeyword",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("keyword", models.CharField(max_length=128)),
+                ("score", models.FloatField(blank=True, null=True)),
+                ("rank", models.PositiveSmallIntegerField()),
+                (
+                    "document",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="keywordEntries",
+                        to="documents.document",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Document keyword",
+                "verbose_name_plural": "Document keywords",
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("keyword", "document"),
+                        name="documentkeyword_keyword_document_uniq",
+                    )
+                ],
+            },
+        ),
+        migrations.RunPython(populate_keywords, migrations.RunPython.noop),
+    ]
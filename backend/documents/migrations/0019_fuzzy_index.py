@@ -0,0 +1,65 @@
+# Generated by Django 5.2.5 on 2026-10-17 06:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("documents", "0018_documentkeyword"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="FuzzyTerm",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("term", models.CharField(max_length=64, unique=True)),
+            ],
+            options={
+                "verbose_name": "Fuzzy term",
+                "verbose_name_plural": "Fuzzy terms",
+            },
+        ),
+        migrations.CreateModel(
+            name="FuzzyTrigram",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("trigram", models.CharField(max_length=3)),
+                (
+                    "term",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="trigrams",
+                        to="documents.fuzzyterm",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Fuzzy trigram",
+                "verbose_name_plural": "Fuzzy trigrams",
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("trigram", "term"), name="fuzzytrigram_trigram_term_uniq"
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,67 @@
+# Generated by Django 5.2.5 on 2026-10-17 06:30
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("documents", "0019_fuzzy_index"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DocumentMinHash",
+            fields=[
+                (
+                    "document",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="minhash",
+                        serialize=False,
+                        to="documents.document",
+                    ),
+                ),
+                ("signature", models.BinaryField()),
+            ],
+            options={
+                "verbose_name": "Document MinHash",
+                "verbose_name_plural": "Document MinHashes",
+            },
+        ),
+        migrations.CreateModel(
+            name="MinHashBand",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("band", models.PositiveSmallIntegerField()),
+                ("bucket", models.BigIntegerField()),
+                (
+                    "document",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="minhashBands",
+                        to="documents.document",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "MinHash band",
+                "verbose_name_plural": "MinHash bands",
+                "indexes": [
+                    models.Index(
+                        fields=["band", "bucket"], name="minhashband_band_bucket_idx"
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.5 on 2026-10-17 07:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("documents", "0020_minhash"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DocumentVector",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("vector", models.BinaryField()),
+                (
+                    "document",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="vector",
+                        to="documents.document",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Document vector",
+                "verbose_name_plural": "Document vectors",
+            },
+        ),
+    ]
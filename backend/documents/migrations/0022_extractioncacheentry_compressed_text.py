@@ -0,0 +1,23 @@
+# Generated by Django 5.2.5 on 2026-10-17 09:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("documents", "0021_documentvector"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="extractioncacheentry",
+            name="body",
+            field=models.BinaryField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="extractioncacheentry",
+            name="codec",
+            field=models.CharField(blank=True, default="", max_length=8),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.5 on 2026-10-17 09:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("documents", "0022_extractioncacheentry_compressed_text"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DocumentVectorRemoval",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("documentId", models.UUIDField()),
+            ],
+            options={
+                "verbose_name": "Document vector removal",
+                "verbose_name_plural": "Document vector removals",
+            },
+        ),
+    ]
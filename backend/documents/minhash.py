@@ -0,0 +1,215 @@
+# documents/minhash.py
+"""
+Near-duplicate detection with MinHash + LSH over extracted text.
+
+A document's text is cut into overlapping SHINGLE_WORDS-word shingles (words as
+produced by search_index.tokenize). Its MinHash signature is the minimum of
+NUM_PERM universal hash permutations, (a * x + b) mod p, over those shingles; the share of equal
+positions in two signatures estimates the Jaccard similarity of their shingle
+sets. Signatures are computed with NumPy, chunk by chunk, and stored as
+NUM_PERM uint32 values (512 bytes) in DocumentMinHash.
+
+For lookup, the signature is split into BANDS bands of ROWS values and each band
+is hashed into a bucket (MinHashBand, indexed on (band, bucket)). Two documents
+become candidates when any band matches, which for Jaccard similarity s happens
+with probability 1 - (1 - s^ROWS)^BANDS: about 0.9999 at s = 0.9, 0.06 at s = 0.5,
+with the steepest rise around the threshold (1 / BANDS)^(1 / ROWS), about 0.71.
+Candidates are then checked against their full signatures, so finding the
+duplicates of one document, or all clusters, never compares every pair.
+
+Similarity threshold: DOCUMENTS_NEAR_DUPLICATE_THRESHOLD (default 0.8).
+"""
+
+import hashlib
+import zlib
+from collections import defaultdict
+from itertools import groupby
+from typing import Iterable, List, Optional, Tuple
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+
+from .models import DocumentMinHash, MinHashBand
+from .search_index import tokenize
+
+NUM_PERM = 128
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+SHINGLE_WORDS = 3
+
+# shingles hashed per NumPy step (CHUNK x NUM_PERM uint64 values, 8 MiB)
+CHUNK = 8192
+
+# permutations are h(x) = (a * x + b) mod _PRIME with x, a, b < _PRIME < 2^32, so
+# a * x + b < 2^64 and the uint64 arithmetic below never wraps
+_PRIME = np.uint64(4294967291)  # largest prime below 2^32
+_MAX_HASH = np.uint64(0xFFFFFFFF)
+_SHINGLE_MULTIPLIER = np.uint64(1000003)
+
+# fixed seed: signatures must stay comparable across processes and restarts
+# (changing the permutations means recomputing them: find_near_duplicates --rebuild)
+_rng = np.random.RandomState(1)
+_A = _rng.randint(1, int(_PRIME), size=NUM_PERM, dtype=np.uint64)
+_B = _rng.randint(0, int(_PRIME), size=NUM_PERM, dtype=np.uint64)
+
+
+def default_threshold() -> float:
+    return getattr(settings, 'DOCUMENTS_NEAR_DUPLICATE_THRESHOLD', 0.8)
+
+
+def _shingle_hashes(text: str) -> np.ndarray:
+    """Distinct 32-bit hashes of the word shingles of `text`."""
+    tokens = tokenize(text)
+    if not tokens:
+        return np.empty(0, dtype=np.uint64)
+    vocab, inverse = np.unique(np.array(tokens), return_inverse=True)
+    token_hashes = np.array([zlib.crc32(t.encode('utf-8')) for t in vocab], dtype=np.uint64)[inverse]
+
+    k = min(SHINGLE_WORDS, len(tokens))
+    n = len(tokens) - k + 1
+    hashes = np.zeros(n, dtype=np.uint64)
+    for i in range(k):
+        # uint64 arithmetic wraps around, which is fine for hashing
+        hashes = hashes * _SHINGLE_MULTIPLIER + token_hashes[i:i + n]
+    return np.unique(hashes & _MAX_HASH)
+
+
+def signature(text: str) -> Optional[np.ndarray]:
+    """MinHash signature (NUM_PERM uint32) of `text`, or None when it has no words."""
+    shingles = _shingle_hashes(text or '')
+    if not shingles.size:
+        return None
+    sig = np.full(NUM_PERM, _MAX_HASH, dtype=np.uint64)
+    for start in range(0, shingles.size, CHUNK):
+        chunk = shingles[start:start + CHUNK, None] % _PRIME
+        hashed = (chunk * _A + _B) % _PRIME
+        np.minimum(sig, hashed.min(axis=0), out=sig)
+    return sig.astype(np.uint32)
+
+
+def to_bytes(sig: np.ndarray) -> bytes:
+    return sig.astype('<u4').tobytes()
+
+
+def from_bytes(blob) -> np.ndarray:
+    return np.frombuffer(bytes(blob), dtype='<u4')
+
+
+def band_buckets(sig: np.ndarray) -> List[int]:
+    """The BANDS bucket keys of a signature (signed 64-bit, for BigIntegerField)."""
+    raw = sig.astype('<u4')
+    return [
+        int.from_bytes(hashlib.blake2b(raw[i * ROWS:(i + 1) * ROWS].tobytes(), digest_size=8).digest(),
+                       'big', signed=True)
+        for i in range(BANDS)
+    ]
+
+
+def store_signatures(items: Iterable[Tuple[object, Optional[np.ndarray]]]) -> int:
+    """
+    Replace the signatures and LSH buckets of several documents, given as
+    (doc_id, signature or None), with batched writes. Returns signatures stored.
+    """
+    items = list(items)
+    ids = [doc_id for doc_id, _ in items]
+    present = [(doc_id, sig) for doc_id, sig in items if sig is not None]
+    with transaction.atomic():
+        DocumentMinHash.objects.filter(document_id__in=ids).delete()
+        MinHashBand.objects.filter(document_id__in=ids).delete()
+        DocumentMinHash.objects.bulk_create(
+            [DocumentMinHash(document_id=doc_id, signature=to_bytes(sig)) for doc_id, sig in present],
+            batch_size=500,
+        )
+        MinHashBand.objects.bulk_create(
+            [MinHashBand(document_id=doc_id, band=band, bucket=bucket)
+             for doc_id, sig in present for band, bucket in enumerate(band_buckets(sig))],
+            batch_size=1000,
+        )
+    return len(present)
+
+
+def _load_signatures(doc_ids) -> dict:
+    signatures = {}
+    doc_ids = list(doc_ids)
+    for start in range(0, len(doc_ids), 1000):
+        rows = DocumentMinHash.objects.filter(document_id__in=doc_ids[start:start + 1000])
+        for doc_id, blob in rows.values_list('document_id', 'signature'):
+            signatures[doc_id] = from_bytes(blob)
+    return signatures
+
+
+def near_duplicates(doc_id, threshold: Optional[float] = None) -> Optional[List[Tuple[object, float]]]:
+    """
+    Documents whose estimated text similarity to `doc_id` is at least
+    `threshold`, as [(doc_id, similarity)] best first; None when `doc_id` has
+    no signature (no text extracted yet).
+    """
+    threshold = default_threshold() if threshold is None else threshold
+    own = _load_signatures([doc_id]).get(doc_id)
+    if own is None:
+        return None
+    same_bucket = Q()
+    for band, bucket in enumerate(band_buckets(own)):
+        same_bucket |= Q(band=band, bucket=bucket)
+    candidates = set(MinHashBand.objects.filter(same_bucket).exclude(document_id=doc_id)
+                     .values_list('document_id', flat=True))
+    if not candidates:
+        return []
+
+    signatures = _load_signatures(candidates)
+    ids = list(signatures)
+    similarity = (np.vstack([signatures[i] for i in ids]) == own).mean(axis=1)
+    matches = [(i, round(float(s), 4)) for i, s in zip(ids, similarity) if s >= threshold]
+    matches.sort(key=lambda x: (-x[1], str(x[0])))
+    return matches
+
+
+def duplicate_clusters(threshold: Optional[float] = None, max_bucket: int = 500) -> Tuple[List[List[object]], int]:
+    """
+    Groups of near-duplicate documents across the corpus, largest first.
+    One ordered pass over the bucket index yields candidate pairs (documents
+    sharing a bucket), which are verified on their signatures and merged with
+    union-find. Buckets with more than `max_bucket` documents (typically
+    boilerplate or near-empty texts) are skipped.
+    Returns (clusters, skipped_buckets).
+    """
+    threshold = default_threshold() if threshold is None else threshold
+    pairs = set()
+    skipped = 0
+    rows = (MinHashBand.objects.order_by('band', 'bucket')
+            .values_list('band', 'bucket', 'document_id').iterator(chunk_size=10000))
+    for _, group in groupby(rows, key=lambda r: (r[0], r[1])):
+        members = sorted({r[2] for r in group}, key=str)
+        if len(members) < 2:
+            continue
+        if len(members) > max_bucket:
+            skipped += 1
+            continue
+        for i, a in enumerate(members):
+            for b in members[i + 1:]:
+                pairs.add((a, b))
+
+    signatures = _load_signatures({d for pair in pairs for d in pair})
+    parent = {}
+
+    def find(x):
+        while parent.setdefault(x, x) != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    for a, b in pairs:
+        sig_a, sig_b = signatures.get(a), signatures.get(b)
+        if sig_a is None or sig_b is None:
+            continue
+        if (sig_a == sig_b).mean() >= threshold:
+            parent[find(a)] = find(b)
+
+    clusters = defaultdict(list)
+    for doc_id in parent:
+        clusters[find(doc_id)].append(doc_id)
+    result = [sorted(members, key=str) for members in clusters.values() if len(members) > 1]
+    result.sort(key=lambda members: (-len(members), str(members[0])))
+    return result, skipped
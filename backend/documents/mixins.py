@@ -0,0 +1,75 @@
+# documents/mixins.py
+"""
+Shared behaviour for list-style document endpoints (DocumentViewSet.list/search,
+DocumentListAPIView).
+
+By default they return DocumentSummarySerializer rows built from
+Document.objects.summaries(), so the extracted text and keyword scores are
+neither read from the database nor sent to the client. A client that does need
+heavy fields asks for them explicitly:
+
+    GET /api/documents/?fields=id,fileName,data
+
+which switches to DocumentSerializer restricted to those fields, loading only
+the matching columns. Names DocumentSerializer does not have are answered with 400.
+"""
+
+from rest_framework.exceptions import ValidationError
+
+from .models import Document
+from .serializers import DocumentSerializer, DocumentSummarySerializer
+
+# serializer fields that are computed from differently named model columns
+_FIELD_COLUMNS = {'fileUrl': ('file',), 'data': ('inlineData', 'textCompressed')}
+
+
+class DocumentListFieldsMixin:
+    # viewset actions treated as list-style; plain list views have no `action`
+    summary_actions = ('list', 'search')
+
+    def is_summary_request(self) -> bool:
+        return getattr(self, 'action', 'list') in self.summary_actions
+
+    def requested_fields(self):
+        """Field names from ?fields=a,b,c (always including id), or None; unknown names raise ValidationError."""
+        raw = self.request.query_params.get('fields') if self.request else None
+        if not raw:
+            return None
+        allowed = DocumentSerializer.Meta.fields
+        names = [f.strip() for f in raw.split(',') if f.strip()]
+        unknown = [f for f in names if f not in allowed]
+        if unknown:
+            raise ValidationError({'fields': [f"Unknown field(s): {', '.join(unknown)}. "
+                                              f"Available: {', '.join(allowed)}."]})
+        if 'id' not in names:
+            names.insert(0, 'id')
+        return names
+
+    def list_queryset(self, queryset):
+        fields = self.requested_fields()
+        if fields is None:
+            return queryset.summaries()
+        model_fields = {f.name for f in Document._meta.concrete_fields}
+        columns = {c for name in fields for c in _FIELD_COLUMNS.get(name, (name,))}
+        queryset = queryset.only(*(c for c in columns if c in model_fields))
+        if 'data' in fields:
+            queryset = queryset.prefetch_related('compressedText')
+        return queryset
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.is_summary_request():
+            queryset = self.list_queryset(queryset)
+        return queryset
+
+    def get_serializer_class(self):
+        if self.is_summary_request() and self.requested_fields() is None:
+            return DocumentSummarySerializer
+        return super().get_serializer_class()
+
+    def get_serializer(self, *args, **kwargs):
+        if self.is_summary_request():
+            fields = self.requested_fields()
+            if fields is not None:
+                kwargs['fields'] = fields
+        return super().get_serializer(*args, **kwargs)
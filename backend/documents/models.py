@@ -2,25 +2,69 @@
 import os
 import uuid
 import mimetypes
-from django.db import models
+from django.db import models, transaction
+from django.db.models.functions import Substr
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import text_store
+from .storage import UPLOAD_DIR, content_path, document_storage
 
 
 def upload_to_uploads(instance, filename):
     """
-    Place uploads in MEDIA_ROOT/uploads/<filename>
+    Place uploads in MEDIA_ROOT/uploads/ab/cd/<sha256><ext> when the content hash
+    is known (see documents/storage.py), else in MEDIA_ROOT/uploads/<filename>
     """
-    return os.path.join('uploads', filename)
+    if getattr(instance, 'contentHash', ''):
+        return content_path(instance.contentHash, filename)
+    return os.path.join(UPLOAD_DIR, filename)
+
+
+# list views only need a short prefix of the extracted text
+SNIPPET_CHARS = 200
+
+# columns needed to render a document summary (everything except the heavy text/score columns)
+SUMMARY_COLUMNS = ('id', 'file', 'fileName', 'creationDate', 'fileSize', 'contentType', 'language',
+                   'status', 'keywords')
+
+
+class DocumentQuerySet(models.QuerySet):
+    def summaries(self):
+        """
+        Load only the summary columns, plus `snippet`: the first SNIPPET_CHARS
+        characters of the text, cut by the database so the full text never leaves it
+        (a compressed document keeps exactly that prefix in its row).
+        """
+        return self.only(*SUMMARY_COLUMNS).annotate(snippet=Substr('inlineData', 1, SNIPPET_CHARS))
 
 
 class Document(models.Model):
+    # extraction job states (see documents/pipeline.py)
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_DONE, 'Done'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    objects = DocumentQuerySet.as_manager()
+
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False) # UUID primary key
-    file = models.FileField(upload_to=upload_to_uploads, null=True, blank=True) # uploaded file (FileField)
+    file = models.FileField(upload_to=upload_to_uploads, storage=document_storage, null=True, blank=True) # uploaded file (FileField)
     fileName = models.CharField(max_length=512, blank=True)# original filename (for display)
     creationDate = models.DateTimeField(auto_now_add=True)# timestamp of creation
 
 
-    # store the raw extracted text; default '' avoids migration prompts
-    data = models.TextField(blank=True, default='', help_text="Extracted raw text")
+    # extracted text stored in the row: all of it, or only the first SNIPPET_CHARS characters
+    # when textCompressed (full text in DocumentText). Read and write it through `data`.
+    inlineData = models.TextField(blank=True, default='', db_column='data', help_text="Extracted raw text")
+    textCompressed = models.BooleanField(default=False)
 
     # keywords: JSON list (default empty list)
     keywords = models.JSONField(blank=True, default=list, help_text="List of unique keywords")
@@ -28,14 +72,34 @@ class Document(models.Model):
     # mapping keyword -> score (default empty dict)
     keyword_scores = models.JSONField(blank=True, default=dict, help_text="Mapping keyword -> extractor score")
 
+    # keyword-stats payload ([{word, score, percent}], strongest first), computed whenever keywords are written
+    keywordStats = models.JSONField(blank=True, default=list, help_text="Normalized keyword statistics")
+    # when keywords/keywordStats were last written; Last-Modified/ETag of the keyword-stats endpoint
+    keywordsUpdated = models.DateTimeField(null=True, blank=True)
+
     # detected language code
     language = models.CharField(max_length=8, blank=True, help_text="Language code detected (e.g. en, fr, ar)")
 
+    # how the last extraction went: extractor used, per-page character counts,
+    # seconds per stage, OCR confidence (see pipeline.compute_document_fields)
+    diagnostics = models.JSONField(blank=True, default=dict, help_text="Extraction diagnostics")
+
     fileSize = models.BigIntegerField(null=True, blank=True)
     contentType = models.CharField(max_length=128, blank=True)
+    # hex SHA-256 of the stored file, computed while the upload is streamed to disk
+    contentHash = models.CharField(max_length=64, blank=True, db_index=True)
+    # pipeline.EXTRACTOR_VERSION that produced data/keywords (None = never extracted)
+    extractorVersion = models.PositiveIntegerField(null=True, blank=True)
+
+    # state of the background extraction job for this document
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=STATUS_PENDING, db_index=True)
 
     class Meta:
         ordering = ['-creationDate']
+        # serves the keyset pagination of list endpoints (documents/pagination.py)
+        indexes = [
+            models.Index(fields=['-creationDate', '-id'], name='document_created_id_idx'),
+        ]
         verbose_name = 'Document'
         verbose_name_plural = 'Documents'
 
@@ -54,40 +118,291 @@ class Document(models.Model):
 
     # ensure fileName is set from the file if missing + persist, then fill fileSize and contentType metadata if possible
     def save(self, *args, **kwargs):
-        if self.file and not self.fileName:
-            self.fileName = os.path.basename(self.file.name)
+        # derive the metadata before writing, so a new document costs a single INSERT
+        if self.file:
+            if not self.fileName:
+                self.fileName = os.path.basename(self.file.name)
+            if self.fileSize is None:
+                try:
+                    self.fileSize = self.file.size
+                except Exception:
+                    pass
+            if not self.contentType:
+                self.contentType = _guess_content_type(self.file)
+
+        # text assigned through `data` is split between the row and DocumentText here
+        text = self.__dict__.get('_pending_text')
+        update_fields = kwargs.get('update_fields')
+        compressed = None
+        if text is not None:
+            columns, compressed = text_store.encode_text(text)
+            for name, value in columns.items():
+                setattr(self, name, value)
+        if update_fields is not None and 'data' in update_fields:
+            kwargs['update_fields'] = [f for f in update_fields if f != 'data'] + ['inlineData', 'textCompressed']
 
-        # initial save/write of file if new
         super().save(*args, **kwargs)
 
-        changed = False
+        if text is not None and (update_fields is None or 'data' in update_fields):
+            text_store.save_compressed(self.pk, compressed)
+            del self.__dict__['_pending_text']
+            self.__dict__['_full_text'] = text
 
-        # fileSize from the stored file
-        if self.file and (self.fileSize is None):
+    @property
+    def data(self) -> str:
+        """Full extracted text, loaded lazily from DocumentText when stored compressed."""
+        pending = self.__dict__.get('_pending_text')
+        if pending is not None:
+            return pending
+        if not self.textCompressed:
+            return self.inlineData
+        if '_full_text' not in self.__dict__:
             try:
-                self.fileSize = self.file.size
-                changed = True
-            except Exception:
-                pass
+                entry = self.compressedText
+            except DocumentText.DoesNotExist:
+                entry = None
+            text = text_store.read_text(entry)
+            self.__dict__['_full_text'] = text if text is not None else self.inlineData
+        return self.__dict__['_full_text']
+
+    @data.setter
+    def data(self, value):
+        # persisted by save(); see documents/text_store.py
+        self.__dict__['_pending_text'] = value or ''
+        self.__dict__.pop('_full_text', None)
+
+    def delete_with_file(self):
+        """
+        Delete the row, then its stored file unless another document still
+        references the same blob (identical uploads share one file).
+        """
+        name = self.file.name if self.file else ''
+        storage = self.file.storage
+        with transaction.atomic():
+            if name:
+                # lock every row sharing the blob: of two concurrent deletes of its
+                # last references, the second waits and then sees the first one gone
+                list(Document._blob_references(name, self.contentHash).select_for_update().values_list('id', flat=True))
+            self.delete()
+            if name:
+                Document.release_file(storage, name, self.contentHash)
+
+    @staticmethod
+    def _blob_references(name: str, content_hash: str = ''):
+        others = Document.objects.filter(file=name)
+        if content_hash:
+            others = others.filter(contentHash=content_hash)  # narrows the lookup to the indexed column
+        return others
 
-        # guess MIME type from file path if missing
-        if self.file and not self.contentType:
-            guessed_type = None
+    @staticmethod
+    def release_file(storage, name: str, content_hash: str = ''):
+        """
+        Delete the stored file `name` once the current transaction commits, unless
+        a document references it by then (e.g. an identical upload committed
+        meanwhile). Outside a transaction this runs immediately.
+        """
+        def delete_if_unreferenced():
+            if Document._blob_references(name, content_hash).exists():
+                return
             try:
-                if hasattr(self.file, 'path'):
-                    guessed_type, _ = mimetypes.guess_type(self.file.path)
-                # uploaded file objects sometimes carry content_type
-                if not guessed_type and hasattr(self.file, 'file') and hasattr(self.file.file, 'content_type'):
-                    guessed_type = getattr(self.file.file, 'content_type', None)
-                if guessed_type:
-                    self.contentType = guessed_type
-                    changed = True
+                storage.delete(name)
             except Exception:
+                # the row is gone either way; a leftover file is harmless
                 pass
 
-        if changed:
-            try:
-                # persist only changed metadata fields
-                super().save(update_fields=['fileSize', 'contentType'])
-            except Exception:
-                super().save()
+        transaction.on_commit(delete_if_unreferenced)
+
+def _guess_content_type(field_file) -> str:
+    """MIME type of a FieldFile: the uploaded file's own content_type, else a guess from the name."""
+    try:
+        # an uncommitted upload carries the content type sent by the client
+        uploaded_type = getattr(field_file.file, 'content_type', None) if not field_file._committed else None
+        if uploaded_type:
+            return uploaded_type
+        guessed_type, _ = mimetypes.guess_type(field_file.name)
+        return guessed_type or ''
+    except Exception:
+        return ''
+
+
+class DocumentTerm(models.Model):
+    """
+    One posting of the full-text index: `term` occurs `frequency` times in `document`.
+    Maintained by documents/search_index.py whenever Document.data is written.
+    """
+    document = models.ForeignKey(Document, on_delete=models.CASCADE, related_name='terms')
+    term = models.CharField(max_length=64)
+    frequency = models.PositiveIntegerField(default=1)
+
+    class Meta:
+        # (term, document) doubles as the posting-list index for term lookups
+        constraints = [
+            models.UniqueConstraint(fields=['term', 'document'], name='documentterm_term_document_uniq'),
+        ]
+        verbose_name = 'Document term'
+        verbose_name_plural = 'Document terms'
+
+    def __str__(self):
+        return f"{self.term} -> {self.document_id} ({self.frequency})"
+
+
+class DocumentMinHash(models.Model):
+    """
+    MinHash signature of a document's extracted text (documents/minhash.py):
+    NUM_PERM little-endian uint32 values, used to estimate text similarity.
+    """
+    document = models.OneToOneField(Document, on_delete=models.CASCADE, primary_key=True,
+                                    related_name='minhash')
+    signature = models.BinaryField()
+
+    class Meta:
+        verbose_name = 'Document MinHash'
+        verbose_name_plural = 'Document MinHashes'
+
+
+class MinHashBand(models.Model):
+    """
+    One LSH bucket of a document: the hash of `band`'s slice of its MinHash
+    signature. Documents sharing any (band, bucket) are near-duplicate candidates.
+    """
+    document = models.ForeignKey(Document, on_delete=models.CASCADE, related_name='minhashBands')
+    band = models.PositiveSmallIntegerField()
+    bucket = models.BigIntegerField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['band', 'bucket'], name='minhashband_band_bucket_idx'),
+        ]
+        verbose_name = 'MinHash band'
+        verbose_name_plural = 'MinHash bands'
+
+
+class DocumentVector(models.Model):
+    """
+    Keyword TF-IDF vector of a document for the "similar documents" search
+    (documents/similarity.py): little-endian float32 values, L2-normalized.
+    A rewrite deletes the row and inserts a new one, so `id` only grows and
+    servers pick up changes by reading rows with an id above the last one seen.
+    """
+    document = models.OneToOneField(Document, on_delete=models.CASCADE, related_name='vector')
+    vector = models.BinaryField()
+
+    class Meta:
+        verbose_name = 'Document vector'
+        verbose_name_plural = 'Document vectors'
+
+
+class DocumentVectorRemoval(models.Model):
+    """
+    A document whose vector went away (document deleted, or re-extracted without
+    keywords). Like DocumentVector, `id` only grows, so servers mask these
+    documents in their similarity index by reading rows above the last one seen.
+    Rows already reflected in the current snapshot are pruned when a new one is written.
+    """
+    documentId = models.UUIDField()
+
+    class Meta:
+        verbose_name = 'Document vector removal'
+        verbose_name_plural = 'Document vector removals'
+
+
+@receiver(post_delete, sender=Document)
+def _record_vector_removal(sender, instance, **kwargs):
+    # the vector row goes with the document (CASCADE); let similarity indexes know
+    DocumentVectorRemoval.objects.create(documentId=instance.pk)
+
+
+class FuzzyTerm(models.Model):
+    """
+    A word of the fuzzy-search vocabulary: file name words and keyword words
+    (see documents/fuzzy_index.py). Terms are only added; words no document
+    uses any more simply match nothing.
+    """
+    term = models.CharField(max_length=64, unique=True)
+
+    class Meta:
+        verbose_name = 'Fuzzy term'
+        verbose_name_plural = 'Fuzzy terms'
+
+    def __str__(self):
+        return self.term
+
+
+class FuzzyTrigram(models.Model):
+    """One character trigram of a FuzzyTerm (word padded with spaces, pg_trgm style)."""
+    trigram = models.CharField(max_length=3)
+    term = models.ForeignKey(FuzzyTerm, on_delete=models.CASCADE, related_name='trigrams')
+
+    class Meta:
+        # (trigram, term) doubles as the lookup index for candidate generation
+        constraints = [
+            models.UniqueConstraint(fields=['trigram', 'term'], name='fuzzytrigram_trigram_term_uniq'),
+        ]
+        verbose_name = 'Fuzzy trigram'
+        verbose_name_plural = 'Fuzzy trigrams'
+
+
+class DocumentKeyword(models.Model):
+    """
+    One extracted keyword of a document, normalized by documents/keyword_index.py,
+    with its extractor score and 1-based rank (1 = strongest). Maintained whenever
+    Document.keywords is written; serves exact keyword filters and facet counts.
+    """
+    document = models.ForeignKey(Document, on_delete=models.CASCADE, related_name='keywordEntries')
+    keyword = models.CharField(max_length=128)
+    score = models.FloatField(null=True, blank=True)
+    rank = models.PositiveSmallIntegerField()
+
+    class Meta:
+        # (keyword, document) doubles as the lookup index for keyword filters
+        constraints = [
+            models.UniqueConstraint(fields=['keyword', 'document'], name='documentkeyword_keyword_document_uniq'),
+        ]
+        verbose_name = 'Document keyword'
+        verbose_name_plural = 'Document keywords'
+
+    def __str__(self):
+        return f"{self.keyword} -> {self.document_id} (#{self.rank})"
+
+
+class DocumentText(models.Model):
+    """
+    Compressed full text of a document whose textCompressed flag is set
+    (see documents/text_store.py). Read through Document.data.
+    """
+    document = models.OneToOneField(Document, on_delete=models.CASCADE, primary_key=True,
+                                    related_name='compressedText')
+    codec = models.CharField(max_length=8)
+    body = models.BinaryField()
+    # length of the uncompressed text in characters
+    chars = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        verbose_name = 'Document text'
+        verbose_name_plural = 'Document texts'
+
+
+class ExtractionCacheEntry(models.Model):
+    """
+    Content-addressed cache of extraction results (see documents/extraction_cache.py).
+    `key` hashes the file's SHA-256 together with the extractor version and keyword parameters.
+    """
+    key = models.CharField(max_length=64, primary_key=True)
+    # the text, unless it is stored compressed in `body` (codec set; see documents/text_store.py)
+    data = models.TextField(blank=True, default='')
+    codec = models.CharField(max_length=8, blank=True, default='')
+    body = models.BinaryField(null=True, blank=True)
+    keywords = models.JSONField(blank=True, default=list)
+    keyword_scores = models.JSONField(blank=True, default=dict)
+    language = models.CharField(max_length=8, blank=True)
+    diagnostics = models.JSONField(blank=True, default=dict)
+    created = models.DateTimeField(auto_now_add=True)
+    # bumped on every hit; the least recently used entries are evicted first
+    lastUsed = models.DateTimeField(default=timezone.now, db_index=True)
+
+    class Meta:
+        verbose_name = 'Extraction cache entry'
+        verbose_name_plural = 'Extraction cache entries'
+
+    def __str__(self):
+        return self.key
@@ -0,0 +1,91 @@
+# documents/pagination.py
+"""
+Keyset (cursor) pagination for document listings.
+
+ - DocumentCursorPagination: list endpoints, ordered newest first on
+   (creationDate, id). Each page is a `WHERE creationDate < <cursor>` range read
+   from the document_created_id_idx index, so deep pages cost the same as page 1.
+ - RankedCursorPagination: search results, which are ranked in memory by the
+   inverted index. The cursor is the (score, id) key of the last row shown, and
+   only the ids of the requested page are loaded from the database.
+"""
+
+import base64
+import json
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, CursorPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class DocumentCursorPagination(CursorPagination):
+    ordering = ('-creationDate', '-id')
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+
+class RankedCursorPagination(BasePagination):
+    """
+    Cursor pagination over a pre-ranked list of (id, score) pairs sorted by
+    score desc, then id (as returned by search_index.search_documents).
+    """
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_ranked(self, ranked, request):
+        """Return the ids of the page selected by the request's cursor."""
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        size = self._get_page_size(request)
+        keys = [(-score, str(doc_id)) for doc_id, score in ranked]
+
+        cursor = self._decode_cursor(request)
+        if cursor is None:
+            start, stop = 0, min(size, len(keys))
+        elif cursor['reverse']:
+            stop = bisect_left(keys, cursor['key'])
+            start = max(0, stop - size)
+        else:
+            start = bisect_right(keys, cursor['key'])
+            stop = min(start + size, len(keys))
+
+        self.previous_key = keys[start] if start > 0 else None
+        self.next_key = keys[stop - 1] if stop < len(keys) else None
+        return [doc_id for doc_id, _ in ranked[start:stop]]
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self._link(self.next_key, reverse=False)),
+            ('previous', self._link(self.previous_key, reverse=True)),
+            ('results', data),
+        ]))
+
+    def _get_page_size(self, request):
+        try:
+            size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except (TypeError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def _link(self, key, reverse):
+        if key is None:
+            return None
+        token = base64.urlsafe_b64encode(json.dumps([key[0], key[1], reverse]).encode('utf-8')).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, token)
+
+    def _decode_cursor(self, request):
+        raw = request.query_params.get(self.cursor_query_param)
+        if not raw:
+            return None
+        try:
+            neg_score, doc_id, reverse = json.loads(base64.urlsafe_b64decode(raw.encode('ascii')))
+            return {'key': (float(neg_score), str(doc_id)), 'reverse': bool(reverse)}
+        except (TypeError, ValueError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
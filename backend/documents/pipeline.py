@@ -0,0 +1,354 @@
+# documents/pipeline.py
+"""
+Background extraction pipeline for uploaded documents.
+
+Uploads are stored first and answered immediately; the expensive part
+(text extraction / OCR, language detection, YAKE keywords) runs on a small
+in-process thread pool. Each Document tracks its job through `status`:
+pending -> running -> done | failed. The queue lives in the server process,
+so jobs it had not finished are lost on a restart; `manage.py
+requeue_extractions` re-runs documents left pending or running.
+
+Settings (all optional):
+ - DOCUMENTS_EXTRACTION_WORKERS: size of the worker pool (default 2)
+ - DOCUMENTS_EXTRACTION_ASYNC: set False to run extraction inline (tests, scripts)
+ - DOCUMENTS_PDF_WORKERS: processes used for page-parallel PDF extraction, and again for
+   OCR of scanned pages on a pool of its own (default: CPU count)
+ - DOCUMENTS_PDF_PARALLEL_MIN_PAGES: PDFs with fewer pages are extracted serially (default 64)
+ - DOCUMENTS_PDF_OCR: OCR pages of scanned PDFs that have no selectable text (default True)
+ - DOCUMENTS_PDF_OCR_DPI: rasterization DPI for that OCR fallback (default 300)
+ - DOCUMENTS_KEYWORD_SEGMENT_CHARS: text segment size for streaming YAKE (default 100000)
+ - DOCUMENTS_BULK_WORKERS: processes extracting bulk uploads in parallel (default: CPU count)
+
+Stage timings, file sizes and page counts are recorded in documents/metrics.py.
+"""
+
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from . import extraction_cache, metrics, minhash, similarity, text_store, workers
+from .keyword_index import index_keywords
+from .models import Document
+from .search_index import index_document
+from .utils.extractors import iter_text_from_file
+from .utils.keywords import KEYWORD_SEGMENT_CHARS, KeywordStream, keyword_stats
+
+logger = logging.getLogger(__name__)
+
+# keyword extraction parameters shared by the upload path and backfill
+KEYWORD_MAX_NGRAM = 3
+KEYWORD_TOP_K = 40
+
+# bump whenever extractor/keyword changes would produce different output;
+# it is part of the extraction cache key
+EXTRACTOR_VERSION = 4
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor() -> ThreadPoolExecutor:
+    """Return the process-wide extraction pool, creating it on first use."""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                workers = getattr(settings, 'DOCUMENTS_EXTRACTION_WORKERS', 2)
+                _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='extract')
+    return _executor
+
+
+def _stored_file_path(doc):
+    """Local filesystem path of doc.file, or None when the storage has no paths."""
+    if not doc.file:
+        return None
+    try:
+        return doc.file.path
+    except NotImplementedError:
+        return None
+
+
+def _lap(timings: dict, stage: str, since: float) -> float:
+    """Add the time elapsed since `since` to timings[stage]; returns the new reference point."""
+    now = time.perf_counter()
+    timings[stage] += now - since
+    return now
+
+
+def compute_document_fields(file_path=None, file_bytes=None, content_type=None, lang_hint=None,
+                            pdf_workers=None) -> dict:
+    """
+    Run extraction + language detection + keywords for one file (no DB access).
+    `lang_hint` forces the language instead of detecting it; `pdf_workers`
+    overrides DOCUMENTS_PDF_WORKERS (callers that already run one process per
+    document pass 1).
+    Returns a dict with the Document fields to persist:
+    data, keywords, keyword_scores, language, diagnostics.
+    `diagnostics` records how the text was obtained (see utils/extractors.py),
+    the character count of every page and the seconds spent per stage.
+    """
+    diagnostics = {}
+    pages = iter_text_from_file(
+        file_path=file_path, file_bytes=file_bytes, content_type=content_type,
+        pdf_workers=pdf_workers if pdf_workers is not None else getattr(settings, 'DOCUMENTS_PDF_WORKERS', None),
+        pdf_parallel_min_pages=getattr(settings, 'DOCUMENTS_PDF_PARALLEL_MIN_PAGES', None),
+        pdf_ocr_fallback=getattr(settings, 'DOCUMENTS_PDF_OCR', True),
+        pdf_ocr_dpi=getattr(settings, 'DOCUMENTS_PDF_OCR_DPI', None),
+        diagnostics=diagnostics,
+    )
+
+    # YAKE consumes page text segment by segment as the extractor produces it, so
+    # keyword extraction overlaps with page extraction and its memory stays bounded.
+    # Unless lang_hint is given, every segment votes on the language (see KeywordStream).
+    stream = KeywordStream(max_ngram=KEYWORD_MAX_NGRAM, top_k=KEYWORD_TOP_K, lang_hint=lang_hint,
+                           segment_chars=getattr(settings, 'DOCUMENTS_KEYWORD_SEGMENT_CHARS', KEYWORD_SEGMENT_CHARS))
+    parts = []
+    page_chars = []
+    timings = {'extract': 0.0, 'keywords': 0.0}
+    clock = time.perf_counter()
+    for page_text in pages:
+        clock = _lap(timings, 'extract', clock)
+        page_chars.append(len(page_text or ''))
+        if page_text:
+            parts.append(page_text)
+            stream.feed(page_text)
+        clock = _lap(timings, 'keywords', clock)
+    clock = _lap(timings, 'extract', clock)
+    extracted_text = "\n".join(parts)
+    kw_with_scores = stream.close()
+    _lap(timings, 'keywords', clock)
+    lang = stream.language
+
+    # language detection runs inside the keyword stream; report it separately
+    timings['language'] = stream.language_seconds
+    timings['keywords'] -= stream.language_seconds
+    diagnostics['page_chars'] = page_chars
+    diagnostics['timings'] = {stage: round(seconds, 4) for stage, seconds in timings.items()}
+
+    # Build unique keywords list and scores mapping
+    keywords = []
+    keyword_scores = {}
+    for kw, score in kw_with_scores:
+        if kw not in keyword_scores:
+            keyword_scores[kw] = score
+            keywords.append(kw)
+
+    return {
+        'data': extracted_text,
+        'keywords': keywords,
+        'keyword_scores': keyword_scores,
+        'language': lang or '',
+        'diagnostics': diagnostics,
+    }
+
+
+def extract_document_fields(file_path=None, file_bytes=None, content_type=None,
+                            content_hash=None, lang_hint=None, pdf_workers=None) -> dict:
+    """
+    compute_document_fields() behind the content-addressed extraction cache.
+    Without a content_hash the cache is bypassed.
+    """
+    key = None
+    if content_hash:
+        key = extraction_cache.cache_key(content_hash, EXTRACTOR_VERSION, KEYWORD_MAX_NGRAM, KEYWORD_TOP_K, lang_hint)
+        cached = extraction_cache.get_cached(key)
+        if cached is not None:
+            # diagnostics describe the run that filled the cache entry
+            cached['diagnostics'] = dict(cached['diagnostics'] or {}, cached=True)
+            return cached
+
+    fields = compute_document_fields(file_path=file_path, file_bytes=file_bytes,
+                                     content_type=content_type, lang_hint=lang_hint, pdf_workers=pdf_workers)
+    if key:
+        extraction_cache.store(key, fields)
+    return fields
+
+
+def _save_result(doc, fields: dict, started: Optional[float] = None) -> None:
+    """
+    Persist extraction output for `doc` in one UPDATE, index it and record metrics
+    (the 'total' stage only when the caller knows when this document's job `started`).
+    """
+    fields['status'] = Document.STATUS_DONE
+    fields['extractorVersion'] = EXTRACTOR_VERSION
+    # keyword-stats are served as stored; compute them once here
+    fields['keywordStats'] = keyword_stats(fields['keyword_scores'])
+    fields['keywordsUpdated'] = timezone.now()
+    metrics.observe_extraction(doc.contentType, fields['language'], fields['diagnostics'])
+    labels = {'content_type': metrics.content_type_label(doc.contentType), 'language': fields['language']}
+    text = fields.pop('data')
+    if 'minhash' in fields:
+        signature = fields.pop('minhash')  # computed by a pool worker
+    else:
+        with metrics.STAGE_DURATION.time(stage='minhash', **labels):
+            signature = minhash.signature(text)
+    with metrics.STAGE_DURATION.time(stage='persist', **labels), transaction.atomic():
+        fields.update(text_store.write_text(doc.id, text))
+        Document.objects.filter(id=doc.id).update(**fields)
+        index_keywords(doc.id, fields['keywords'], fields['keyword_scores'])
+        minhash.store_signatures([(doc.id, signature)])
+    with metrics.STAGE_DURATION.time(stage='index', **labels):
+        index_document(doc.id, doc.fileName, text)
+        # vector idf weights are read from the full-text index, so this document's terms go in first
+        similarity.store_vectors([(doc.id, fields['keywords'], fields['keyword_scores'])])
+    if started is not None:
+        metrics.STAGE_DURATION.observe(time.perf_counter() - started, stage='total', **labels)
+
+
+def _mark_failed(doc_id) -> None:
+    try:
+        Document.objects.filter(id=doc_id).update(status=Document.STATUS_FAILED)
+    except Exception:
+        logger.exception("Could not mark document %s as failed", doc_id)
+
+
+def process_document(doc_id) -> None:
+    """
+    Worker entrypoint: extract one stored Document and persist the results.
+    Never raises; failures are logged and recorded as status='failed'.
+    """
+    started = time.perf_counter()
+    try:
+        updated = Document.objects.filter(id=doc_id).update(status=Document.STATUS_RUNNING)
+        if not updated:
+            return  # deleted before the job started
+        doc = Document.objects.only('id', 'file', 'fileName', 'contentType', 'contentHash').get(id=doc_id)
+
+        # extractors stream from the stored file; no full read into memory
+        file_path = _stored_file_path(doc)
+        file_bytes = None
+        if not file_path and doc.file:
+            # storage without local paths (e.g. remote backends)
+            with doc.file.open('rb') as f:
+                file_bytes = f.read()
+
+        fields = extract_document_fields(file_path=file_path, file_bytes=file_bytes,
+                                         content_type=doc.contentType, content_hash=doc.contentHash)
+        _save_result(doc, fields, started)
+    except Exception:
+        logger.exception("Extraction failed for document %s", doc_id)
+        _mark_failed(doc_id)
+
+
+def _run_job(doc_id) -> None:
+    try:
+        process_document(doc_id)
+    finally:
+        # worker threads hold their own DB connections
+        close_old_connections()
+
+
+def schedule_extraction(doc_id) -> None:
+    """
+    Queue extraction for a saved Document once the current transaction commits.
+    Runs inline when DOCUMENTS_EXTRACTION_ASYNC is False.
+    """
+    if not getattr(settings, 'DOCUMENTS_EXTRACTION_ASYNC', True):
+        process_document(doc_id)
+        return
+    transaction.on_commit(lambda: get_executor().submit(_run_job, doc_id))
+
+
+# --- bulk uploads -------------------------------------------------------------
+# Text extraction and YAKE are CPU-bound Python, so threads cannot spread one
+# batch over several cores. Bulk jobs therefore fan the files out to a spawn
+# process pool; the coordinating thread persists each result as it arrives.
+
+_process_pool = None
+_process_pool_lock = threading.Lock()
+
+
+def get_process_pool() -> ProcessPoolExecutor:
+    """Return the process-wide bulk extraction pool (DOCUMENTS_BULK_WORKERS processes)."""
+    global _process_pool
+    if _process_pool is None:
+        with _process_pool_lock:
+            if _process_pool is None:
+                size = getattr(settings, 'DOCUMENTS_BULK_WORKERS', None) or os.cpu_count() or 1
+                _process_pool = ProcessPoolExecutor(max_workers=size, initializer=workers.init_django,
+                                                    mp_context=multiprocessing.get_context('spawn'))
+    return _process_pool
+
+
+def _discard_process_pool(pool) -> None:
+    global _process_pool
+    with _process_pool_lock:
+        if _process_pool is pool:
+            _process_pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def process_documents_bulk(doc_ids) -> None:
+    """
+    Extract many stored Documents on the process pool and persist each result as
+    it completes. Documents without a local file path fall back to process_document().
+    Never raises; per-document failures are recorded as status='failed'.
+    """
+    try:
+        Document.objects.filter(id__in=doc_ids).update(status=Document.STATUS_RUNNING)
+        docs = list(Document.objects.filter(id__in=doc_ids)
+                    .only('id', 'file', 'fileName', 'contentType', 'contentHash'))
+    except Exception:
+        logger.exception("Bulk extraction could not start")
+        for doc_id in doc_ids:
+            _mark_failed(doc_id)
+        return
+
+    local, remote = [], []
+    for doc in docs:
+        (local if _stored_file_path(doc) else remote).append(doc)
+
+    if local:
+        pool = get_process_pool()
+        try:
+            futures = {pool.submit(workers.extract_file, (_stored_file_path(doc), doc.contentType, doc.contentHash)): doc
+                       for doc in local}
+        except BrokenProcessPool:
+            _discard_process_pool(pool)
+            futures = {}
+            remote = local + remote  # extract them here instead
+        for future in as_completed(futures):
+            doc = futures[future]
+            try:
+                _save_result(doc, future.result())
+            except BrokenProcessPool:
+                _discard_process_pool(pool)
+                logger.exception("Bulk extraction pool broke; extracting document %s in-process", doc.id)
+                process_document(doc.id)
+            except Exception:
+                logger.exception("Extraction failed for document %s", doc.id)
+                _mark_failed(doc.id)
+
+    for doc in remote:
+        process_document(doc.id)
+
+
+def _run_bulk_job(doc_ids) -> None:
+    try:
+        process_documents_bulk(doc_ids)
+    finally:
+        close_old_connections()
+
+
+def schedule_bulk_extraction(doc_ids) -> None:
+    """
+    Queue extraction for many saved Documents (see process_documents_bulk) once
+    the current transaction commits. Runs inline when DOCUMENTS_EXTRACTION_ASYNC is False.
+    """
+    doc_ids = list(doc_ids)
+    if not doc_ids:
+        return
+    if not getattr(settings, 'DOCUMENTS_EXTRACTION_ASYNC', True):
+        process_documents_bulk(doc_ids)
+        return
+    transaction.on_commit(lambda: get_executor().submit(_run_bulk_job, doc_ids))
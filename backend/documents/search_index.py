@@ -0,0 +1,129 @@
+# documents/search_index.py
+"""
+Persistent inverted index used by /api/documents/search/.
+
+Every document's fileName and extracted text are tokenized with the same
+`[^\\W_]+` rule the debug action shows, and stored as posting lists in the
+DocumentTerm table (term -> documents, with term frequency). A query only
+reads the posting lists of its own terms, so search cost follows the number
+of matching documents rather than the size of the corpus.
+
+Ranking is classic tf-idf:
+    score(d) = sum_t (1 + ln tf(t, d)) * ln(1 + N / df(t))
+In fuzzy mode each query term t stands for its close spellings t' (with
+similarity w(t') from documents/fuzzy_index.py) and contributes
+max_t' w(t') * (1 + ln tf(t', d)) * ln(1 + N / df(t')).
+"""
+
+import math
+import re
+from collections import Counter
+from typing import Dict, List, Tuple
+
+from django.core.cache import cache
+from django.db import transaction
+
+from . import fuzzy_index
+from .models import Document, DocumentTerm
+
+TOKEN_RE = re.compile(r"[^\W_]+", flags=re.UNICODE)
+
+# longer tokens are almost always OCR noise or encoded blobs
+MAX_TERM_LENGTH = 64
+
+# a term found in the file name counts as this many occurrences
+FILENAME_BOOST = 5
+
+# N (documents in corpus) only feeds the idf weight, so a slightly stale value is fine
+_DOC_COUNT_CACHE_KEY = 'documents:search_index:doc_count'
+_DOC_COUNT_TTL = 300
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase `text` and split it into word tokens."""
+    if not text:
+        return []
+    return TOKEN_RE.findall(text.lower())
+
+
+def _term_counts(file_name: str, text: str) -> Counter:
+    counts = Counter(t for t in tokenize(text) if len(t) <= MAX_TERM_LENGTH)
+    for t in set(tokenize(file_name)):
+        if len(t) <= MAX_TERM_LENGTH:
+            counts[t] += FILENAME_BOOST
+    return counts
+
+
+def index_document(doc_id, file_name: str = '', text: str = '') -> int:
+    """
+    (Re)build the posting lists for one document. Returns the number of distinct terms.
+    """
+    counts = _term_counts(file_name or '', text or '')
+    with transaction.atomic():
+        DocumentTerm.objects.filter(document_id=doc_id).delete()
+        DocumentTerm.objects.bulk_create(
+            [DocumentTerm(document_id=doc_id, term=term, frequency=freq) for term, freq in counts.items()],
+            batch_size=1000,
+        )
+        fuzzy_index.add_terms(tokenize(file_name))
+    return len(counts)
+
+
+def corpus_size() -> int:
+    n = cache.get(_DOC_COUNT_CACHE_KEY)
+    if n is None:
+        n = Document.objects.count()
+        cache.set(_DOC_COUNT_CACHE_KEY, n, _DOC_COUNT_TTL)
+    return max(n, 1)
+
+
+def search_documents(query: str, mode: str = 'and', fuzzy: bool = False) -> List[Tuple[object, float]]:
+    """
+    Look up `query` in the index.
+    - mode='and': documents containing every query term
+    - mode='or': documents containing at least one term
+    - fuzzy=True: each query term also matches close spellings from the
+      fuzzy vocabulary (documents/fuzzy_index.py), scored by their similarity
+    Returns [(document_id, score), ...] best match first.
+    """
+    terms = list(dict.fromkeys(tokenize(query)))
+    if not terms:
+        return []
+    # one group per query term: the index terms standing for it, with their weight
+    groups = fuzzy_index.expand_terms(terms) if fuzzy else [{t: 1.0} for t in terms]
+    return rank_term_groups(groups, mode)
+
+
+def rank_term_groups(groups: List[Dict[str, float]], mode: str) -> List[Tuple[object, float]]:
+    """
+    tf-idf ranking over term groups. A document's score for a group is its best
+    weight * tf-idf among the group's terms; mode='and' requires every group.
+    """
+    weights = {}
+    for i, group in enumerate(groups):
+        for term, weight in group.items():
+            weights.setdefault(term, []).append((i, weight))
+
+    postings = DocumentTerm.objects.filter(term__in=weights).values_list('document_id', 'term', 'frequency')
+
+    by_doc = {}
+    df = Counter()
+    for doc_id, term, freq in postings:
+        by_doc.setdefault(doc_id, {})[term] = freq
+        df[term] += 1
+
+    n = corpus_size()
+    idf = {t: math.log(1.0 + n / df[t]) for t in df}
+    scored = []
+    for doc_id, tfs in by_doc.items():
+        best = {}
+        for term, tf in tfs.items():
+            value = (1.0 + math.log(tf)) * idf[term]
+            for i, weight in weights[term]:
+                best[i] = max(best.get(i, 0.0), weight * value)
+        if mode == 'and' and len(best) < len(groups):
+            continue
+        scored.append((doc_id, sum(best.values())))
+    # ties broken by id so pagination is stable
+    scored.sort(key=lambda x: (-x[1], str(x[0])))
+    return scored
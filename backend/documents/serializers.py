@@ -1,36 +1,83 @@
 # documents/serializers.py
 """
-DRF serializer for Document model.
-Exposes the key metadata and a helper fileUrl built from the request context.
+DRF serializers for Document model.
+ - DocumentSerializer: full representation (retrieve, create); exposes the key
+   metadata and a helper fileUrl built from the request context.
+ - DocumentSummarySerializer: lightweight representation for list/search
+   (no extracted text, top keywords only, short snippet).
 """
 
 from rest_framework import serializers
 from .models import Document
 
 
+def _build_file_url(obj, request):
+    """
+    Build absolute file URL if possible.
+    """
+    if obj.file:
+        try:
+            url = obj.file.url
+            if request:
+                return request.build_absolute_uri(url)
+            return url
+        except Exception:
+            return ''
+    return ''
+
+
 class DocumentSerializer(serializers.ModelSerializer):
     # fileUrl is a convenience computed field that returns absolute URL when request present
     fileUrl = serializers.SerializerMethodField()
+    # Document.data is a property over inlineData / DocumentText, so it is declared explicitly.
+    # Read-only: the text comes from extraction, and the search, keyword and similarity
+    # indexes are only rebuilt by the pipeline (re-extract to change it).
+    data = serializers.CharField(read_only=True)
 
     class Meta:
         model = Document
         fields = [
             'id', 'fileName', 'creationDate', 'data',
             'keywords', 'keyword_scores', 'language',
-            'fileUrl', 'fileSize', 'contentType'
+            'fileUrl', 'fileSize', 'contentType', 'status'
+        ]
+        read_only_fields = ['status']
+
+    def __init__(self, *args, fields=None, **kwargs):
+        """`fields`: optional iterable restricting the output to these field names."""
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+    def get_fileUrl(self, obj):
+        return _build_file_url(obj, self.context.get('request'))
+
+
+class DocumentSummarySerializer(serializers.ModelSerializer):
+    """
+    Summary for list/search responses. Expects instances from
+    Document.objects.summaries() (deferred text columns + `snippet` annotation).
+    """
+    # how many of the stored keywords (best first) are included
+    TOP_KEYWORDS = 8
+
+    fileUrl = serializers.SerializerMethodField()
+    keywords = serializers.SerializerMethodField()
+    snippet = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Document
+        fields = [
+            'id', 'fileName', 'creationDate', 'fileSize', 'contentType',
+            'language', 'status', 'keywords', 'snippet', 'fileUrl'
         ]
 
     def get_fileUrl(self, obj):
-        """
-        Build absolute file URL if possible.
-        """
-        request = self.context.get('request')
-        if obj.file:
-            try:
-                url = obj.file.url
-                if request:
-                    return request.build_absolute_uri(url)
-                return url
-            except Exception:
-                return ''
-        return ''
+        return _build_file_url(obj, self.context.get('request'))
+
+    def get_keywords(self, obj):
+        return (obj.keywords or [])[:self.TOP_KEYWORDS]
+
+    def get_snippet(self, obj):
+        return getattr(obj, 'snippet', None) or ''
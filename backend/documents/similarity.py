@@ -0,0 +1,331 @@
+# documents/similarity.py
+"""
+"Similar documents" search: top-k cosine over keyword TF-IDF vectors.
+
+Vectors. The words of a document's extracted keywords are weighted by the
+keyword's strength (1 / YAKE score, summed when a word occurs in several
+keywords) times its idf in the full-text index, ln(1 + N / df). Words are
+folded into DIMENSIONS signed feature-hashing buckets
+(DOCUMENTS_SIMILARITY_DIMENSIONS, default 256), and the vector is L2-normalized,
+so a dot product is the cosine. Vectors are written with the extraction result
+(DocumentVector rows of float32 values).
+
+Matrix. Each server process keeps a SimilarityIndex:
+ - a snapshot of all vectors, written by `manage.py build_similarity_index`
+   as a .npy matrix under DOCUMENTS_SIMILARITY_DIR (default
+   MEDIA_ROOT/similarity_index) and opened with mmap, so every worker process
+   shares the same pages of the OS cache;
+ - a small in-memory delta of the vectors written since the snapshot, synced
+   incrementally on each query (DocumentVector ids only grow; rows rewritten
+   since the snapshot mask their snapshot copy);
+ - removals: documents whose vector went away (deleted, or re-extracted
+   without keywords) are recorded in DocumentVectorRemoval, whose ids also
+   only grow; each sync masks the ones it has not seen yet.
+A query is one float32 matrix-vector product per part plus an argpartition;
+it is bound by memory bandwidth (300k documents x 256 dimensions is 300 MB,
+about 35 ms on one core), so fewer dimensions make it proportionally faster.
+Results are still resolved against the database, which drops documents
+deleted since the last sync.
+Without a snapshot the index starts from the database alone (slower first query).
+"""
+
+import json
+import os
+import shutil
+import threading
+import uuid
+import zlib
+from collections import defaultdict
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+from django.db.models import Count, Max
+
+from .models import DocumentTerm, DocumentVector, DocumentVectorRemoval
+from .search_index import corpus_size, tokenize
+
+# YAKE scores near 0 are the strongest keywords
+_SCORE_EPS = 1e-6
+
+_POINTER_FILE = 'current.json'
+
+
+def dimensions() -> int:
+    return getattr(settings, 'DOCUMENTS_SIMILARITY_DIMENSIONS', 256)
+
+
+def index_dir() -> str:
+    """DOCUMENTS_SIMILARITY_DIR, else MEDIA_ROOT/similarity_index (never the working directory)."""
+    configured = getattr(settings, 'DOCUMENTS_SIMILARITY_DIR', None)
+    if configured:
+        return str(configured)
+    if not settings.MEDIA_ROOT:
+        raise ImproperlyConfigured("Set DOCUMENTS_SIMILARITY_DIR (or MEDIA_ROOT) for the similarity index snapshots.")
+    return os.path.join(str(settings.MEDIA_ROOT), 'similarity_index')
+
+
+def _bucket(word: str, size: int) -> Tuple[int, float]:
+    h = zlib.crc32(word.encode('utf-8'))
+    return h % size, (1.0 if (h >> 31) & 1 else -1.0)
+
+
+def keyword_weights(keywords: Sequence[str], keyword_scores: Optional[dict]) -> dict:
+    """{word: summed keyword strength} for the words of `keywords`."""
+    keyword_scores = keyword_scores or {}
+    weights = defaultdict(float)
+    for kw in keywords or []:
+        score = keyword_scores.get(kw)
+        strength = 1.0 / ((float(score) if score is not None else 1.0) + _SCORE_EPS)
+        for word in set(tokenize(kw)):
+            weights[word] += strength
+    return weights
+
+
+def _idf(words: Iterable[str]) -> dict:
+    """idf of `words` from the full-text index (one grouped query)."""
+    words = list(words)
+    n = corpus_size()
+    df = dict(DocumentTerm.objects.filter(term__in=words).values('term')
+              .annotate(df=Count('document')).values_list('term', 'df'))
+    return {w: float(np.log(1.0 + n / max(df.get(w, 0), 1))) for w in words}
+
+
+def vector(weights: dict, idf: dict) -> Optional[np.ndarray]:
+    """Hashed, L2-normalized float32 TF-IDF vector, or None when there are no words."""
+    vec = np.zeros(dimensions(), dtype=np.float32)
+    for word, weight in weights.items():
+        index, sign = _bucket(word, vec.size)
+        vec[index] += sign * weight * idf.get(word, 1.0)
+    norm = float(np.linalg.norm(vec))
+    if norm == 0.0:
+        return None
+    return vec / norm
+
+
+def store_vectors(items: Iterable[Tuple[object, Sequence[str], Optional[dict]]]) -> int:
+    """
+    (Re)write the vectors of several documents, given as (doc_id, keywords,
+    keyword_scores): one idf query, one DELETE and one batched INSERT.
+    Returns the number of vectors stored.
+    """
+    items = list(items)
+    weights = {doc_id: keyword_weights(keywords, scores) for doc_id, keywords, scores in items}
+    idf = _idf({w for per_doc in weights.values() for w in per_doc})
+    rows = []
+    for doc_id, per_doc in weights.items():
+        vec = vector(per_doc, idf)
+        if vec is not None:
+            rows.append(DocumentVector(document_id=doc_id, vector=vec.astype('<f4').tobytes()))
+    with transaction.atomic():
+        had_vector = set(DocumentVector.objects.filter(document_id__in=list(weights))
+                         .values_list('document_id', flat=True))
+        DocumentVector.objects.filter(document_id__in=list(weights)).delete()
+        DocumentVector.objects.bulk_create(rows, batch_size=1000)
+        DocumentVectorRemoval.objects.bulk_create(
+            [DocumentVectorRemoval(documentId=doc_id) for doc_id in had_vector - {row.document_id for row in rows}],
+            batch_size=1000,
+        )
+    return len(rows)
+
+
+def write_snapshot(directory: Optional[str] = None, chunk_size: int = 10000) -> int:
+    """
+    Write every stored vector to a new snapshot under `directory` and point
+    current.json at it; older snapshots and the removals they reflect are
+    removed. Documents removed while the snapshot is written are left out.
+    Returns the number of rows.
+    """
+    directory = directory or index_dir()
+    dims = dimensions()
+    # removals up to here are reflected in the rows read below
+    max_removal_id = _max_removal_id()
+    max_id = DocumentVector.objects.aggregate(m=Max('id'))['m'] or 0
+    qs = DocumentVector.objects.filter(id__lte=max_id).order_by('id')
+    count = qs.count()
+
+    name = f'snapshot-{max_id}-{uuid.uuid4().hex[:8]}'
+    path = os.path.join(directory, name)
+    os.makedirs(path)
+    matrix = np.lib.format.open_memmap(os.path.join(path, 'vectors.npy'), mode='w+', dtype=np.float32,
+                                       shape=(count, dims))
+    ids = np.zeros((count, 16), dtype=np.uint8)
+    row = 0
+    for doc_id, blob in qs.values_list('document_id', 'vector').iterator(chunk_size=chunk_size):
+        vec = np.frombuffer(bytes(blob), dtype='<f4')
+        if row >= count or vec.size != dims:
+            continue  # written concurrently, or before a DIMENSIONS change
+        matrix[row] = vec
+        ids[row] = np.frombuffer(doc_id.bytes, dtype=np.uint8)
+        row += 1
+    # drop documents removed during the (chunked) read, compacting rows in place
+    removed = set(DocumentVectorRemoval.objects.filter(id__gt=max_removal_id).values_list('documentId', flat=True))
+    if removed:
+        keep = np.array([uuid.UUID(bytes=b.tobytes()) not in removed for b in ids[:row]], dtype=bool)
+        for dst, src in enumerate(np.flatnonzero(keep)):
+            if dst != src:
+                matrix[dst] = matrix[src]
+                ids[dst] = ids[src]
+        row = int(keep.sum())
+    matrix.flush()
+    del matrix
+    np.save(os.path.join(path, 'ids.npy'), ids[:row])
+    with open(os.path.join(path, 'meta.json'), 'w') as f:
+        json.dump({'dimensions': dims, 'rows': row, 'max_vector_id': max_id,
+                   'max_removal_id': max_removal_id}, f)
+
+    pointer = os.path.join(directory, _POINTER_FILE)
+    with open(pointer + '.tmp', 'w') as f:
+        json.dump({'snapshot': name}, f)
+    os.replace(pointer + '.tmp', pointer)
+    for entry in os.listdir(directory):
+        if entry.startswith('snapshot-') and entry != name:
+            # processes still mapping an old snapshot keep their (unlinked) files
+            shutil.rmtree(os.path.join(directory, entry), ignore_errors=True)
+    # a process reloads the new snapshot before it next reads removals
+    DocumentVectorRemoval.objects.filter(id__lte=max_removal_id).delete()
+    return row
+
+
+def _max_removal_id() -> int:
+    return DocumentVectorRemoval.objects.aggregate(m=Max('id'))['m'] or 0
+
+
+class SimilarityIndex:
+    """Snapshot matrix (mmap) + incrementally synced delta; see the module docstring."""
+
+    def __init__(self, directory: Optional[str] = None):
+        self.directory = directory or index_dir()
+        self.dims = dimensions()
+        self._lock = threading.Lock()
+        self._pointer_mtime = None
+        self._load_snapshot()
+
+    def _load_snapshot(self):
+        pointer = os.path.join(self.directory, _POINTER_FILE)
+        self._pointer_mtime = os.path.getmtime(pointer) if os.path.exists(pointer) else None
+        self.base = np.zeros((0, self.dims), dtype=np.float32)
+        self.base_ids: List[uuid.UUID] = []
+        last_id = 0
+        # without a snapshot every vector is read from the database, so older removals do not matter
+        last_removal_id = _max_removal_id()
+        if self._pointer_mtime is not None:
+            with open(pointer) as f:
+                path = os.path.join(self.directory, json.load(f)['snapshot'])
+            with open(os.path.join(path, 'meta.json')) as f:
+                meta = json.load(f)
+            if meta['dimensions'] == self.dims:
+                self.base = np.load(os.path.join(path, 'vectors.npy'), mmap_mode='r')[:meta['rows']]
+                self.base_ids = [uuid.UUID(bytes=b.tobytes()) for b in np.load(os.path.join(path, 'ids.npy'))]
+                last_id = meta['max_vector_id']
+                last_removal_id = meta.get('max_removal_id', 0)
+        self.base_rows = {doc_id: row for row, doc_id in enumerate(self.base_ids)}
+        self.base_alive = np.ones(len(self.base_ids), dtype=bool)
+
+        self.delta = np.zeros((64, self.dims), dtype=np.float32)
+        self.delta_ids: List[uuid.UUID] = []
+        self.delta_rows = {}
+        self.delta_alive = np.zeros(64, dtype=bool)
+        self.last_vector_id = last_id
+        self.last_removal_id = last_removal_id
+
+    def _snapshot_changed(self) -> bool:
+        pointer = os.path.join(self.directory, _POINTER_FILE)
+        mtime = os.path.getmtime(pointer) if os.path.exists(pointer) else None
+        return mtime != self._pointer_mtime
+
+    def sync(self):
+        """Pick up a newer snapshot, then vectors written and removed after the last ones seen."""
+        if self._snapshot_changed():
+            self._load_snapshot()
+        removals = list(DocumentVectorRemoval.objects.filter(id__gt=self.last_removal_id).order_by('id')
+                        .values_list('id', 'documentId'))
+        rows = (DocumentVector.objects.filter(id__gt=self.last_vector_id).order_by('id')
+                .values_list('id', 'document_id', 'vector'))
+        for vector_id, doc_id, blob in rows.iterator(chunk_size=2000):
+            self.last_vector_id = vector_id
+            vec = np.frombuffer(bytes(blob), dtype='<f4')
+            if vec.size != self.dims:
+                continue
+            if doc_id in self.base_rows:
+                self.base_alive[self.base_rows[doc_id]] = False
+            row = self.delta_rows.get(doc_id)
+            if row is None:
+                row = len(self.delta_ids)
+                if row == len(self.delta):
+                    self.delta = np.vstack([self.delta, np.zeros_like(self.delta)])
+                    self.delta_alive = np.concatenate([self.delta_alive, np.zeros_like(self.delta_alive)])
+                self.delta_ids.append(doc_id)
+                self.delta_rows[doc_id] = row
+            self.delta[row] = vec
+            self.delta_alive[row] = True
+
+        if removals:
+            self.last_removal_id = removals[-1][0]
+            removed = {doc_id for _, doc_id in removals}
+            # a document may have a new vector again (re-extracted after the removal)
+            removed -= set(DocumentVector.objects.filter(document_id__in=list(removed))
+                           .values_list('document_id', flat=True))
+            for doc_id in removed:
+                self._mask(doc_id)
+
+    def _vector_of(self, doc_id) -> Optional[np.ndarray]:
+        row = self.delta_rows.get(doc_id)
+        if row is not None and self.delta_alive[row]:
+            return np.array(self.delta[row])
+        row = self.base_rows.get(doc_id)
+        if row is not None and self.base_alive[row]:
+            return np.array(self.base[row])
+        return None
+
+    def _mask(self, doc_id):
+        if doc_id in self.base_rows:
+            self.base_alive[self.base_rows[doc_id]] = False
+        if doc_id in self.delta_rows:
+            self.delta_alive[self.delta_rows[doc_id]] = False
+
+    def discard(self, doc_id):
+        """Stop returning `doc_id` (its document was deleted)."""
+        with self._lock:
+            self._mask(doc_id)
+
+    def most_similar(self, doc_id, k: int) -> Optional[List[Tuple[uuid.UUID, float]]]:
+        """Up to `k` (doc_id, cosine) pairs best first; None when `doc_id` has no vector."""
+        with self._lock:
+            self.sync()
+            query = self._vector_of(doc_id)
+            if query is None:
+                return None
+            base_ids, delta_ids = self.base_ids, self.delta_ids
+            n_base, n_delta = len(base_ids), len(delta_ids)
+            scores = np.empty(n_base + n_delta, dtype=np.float32)
+            if n_base:
+                np.copyto(scores[:n_base], np.where(self.base_alive, self.base @ query, -np.inf))
+            np.copyto(scores[n_base:], np.where(self.delta_alive[:n_delta], self.delta[:n_delta] @ query, -np.inf))
+            if doc_id in self.base_rows:
+                scores[self.base_rows[doc_id]] = -np.inf
+            if doc_id in self.delta_rows:
+                scores[n_base + self.delta_rows[doc_id]] = -np.inf
+
+        k = min(k, int(np.isfinite(scores).sum()))
+        if k <= 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind='stable')]
+        return [(base_ids[i] if i < n_base else delta_ids[i - n_base], round(float(scores[i]), 4)) for i in top]
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_index() -> SimilarityIndex:
+    """Return the process-wide SimilarityIndex, loading it on first use."""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = SimilarityIndex()
+    return _index
@@ -0,0 +1,92 @@
+# documents/storage.py
+"""
+Content-addressed storage for uploaded files.
+
+Files whose SHA-256 is known are stored as
+
+    MEDIA_ROOT/uploads/<h[0:2]>/<h[2:4]>/<sha256><ext>
+
+so no directory grows beyond 256 entries, a path is derived from the hash
+without probing the filesystem for a free name, and identical uploads share
+one file on disk. The lower-cased extension of the original name is kept so
+type detection by file name keeps working. The display name lives in
+Document.fileName; Document.delete_with_file() removes a blob only when no
+other document references it.
+
+Files without a known hash (legacy rows, storages fed by other code) keep
+the flat uploads/<filename> layout and Django's usual collision suffixes.
+"""
+
+import os
+import re
+import uuid
+
+from django.core.files.move import file_move_safe
+from django.core.files.storage import FileSystemStorage, Storage
+from django.utils.deconstruct import deconstructible
+
+UPLOAD_DIR = 'uploads'
+
+_CONTENT_NAME_RE = re.compile(r'^' + UPLOAD_DIR + r'/[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}(\.[0-9a-z]{1,10})?$')
+_EXTENSION_RE = re.compile(r'^\.[0-9a-z]{1,10}$')
+
+
+def content_path(content_hash: str, filename: str = '') -> str:
+    """Storage name for a file with hex SHA-256 `content_hash` (original name only supplies the extension)."""
+    h = content_hash.lower()
+    ext = os.path.splitext(filename or '')[1].lower()
+    if not _EXTENSION_RE.match(ext):
+        ext = ''
+    return f"{UPLOAD_DIR}/{h[0:2]}/{h[2:4]}/{h}{ext}"
+
+
+def is_content_path(name: str) -> bool:
+    return bool(_CONTENT_NAME_RE.match((name or '').replace('\\', '/')))
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    FileSystemStorage that treats content-addressed names (see content_path) as
+    immutable blobs: saving one that already exists is a no-op, and the name is
+    never suffixed. Other names behave exactly like FileSystemStorage.
+    """
+
+    def get_available_name(self, name, max_length=None):
+        if is_content_path(name):
+            return name
+        return super().get_available_name(name, max_length=max_length)
+
+    def _save(self, name, content):
+        if not is_content_path(name):
+            return super()._save(name, content)
+
+        full_path = self.path(name)
+        if os.path.exists(full_path):
+            return name  # same bytes are already stored
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+
+        # a racing upload of the same bytes can only replace the blob with an identical one
+        if hasattr(content, 'temporary_file_path'):
+            file_move_safe(content.temporary_file_path(), full_path, allow_overwrite=True)
+        else:
+            tmp_path = f"{full_path}.{uuid.uuid4().hex}.tmp"
+            try:
+                with open(tmp_path, 'wb') as f:
+                    for chunk in content.chunks():
+                        f.write(chunk)
+                os.replace(tmp_path, full_path)
+            finally:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+        if self.file_permissions_mode is not None:
+            os.chmod(full_path, self.file_permissions_mode)
+        return name
+
+
+_default_storage = ContentAddressedStorage()
+
+
+def document_storage() -> Storage:
+    """Storage of Document.file (passed as a callable, so migrations only reference it)."""
+    return _default_storage
@@ -1,3 +1,1244 @@
-from django.test import TestCase
+# documents/tests.py
+"""
+Tests for the documents app: the REST API, the extraction pipeline and the
+indexes behind search, keywords and similarity.
 
-# Create your tests here.
+Background work never leaves the test process: the extraction pools are
+replaced by InlineExecutor (or patched out), and uploaded files go to a
+temporary MEDIA_ROOT. PDFs are built on the fly with make_pdf().
+"""
+
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import timedelta
+import hashlib
+import io
+from io import StringIO
+import os
+import shutil
+import sys
+import tempfile
+import types
+from unittest import mock
+from urllib.parse import quote
+import zipfile
+
+import numpy as np
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from . import extraction_cache, metrics, minhash, pipeline, similarity, text_store
+from .downloads import parse_range
+from .fuzzy_index import add_terms, expand_term
+from .keyword_index import index_keywords
+from .models import SNIPPET_CHARS, Document, DocumentTerm, DocumentText, ExtractionCacheEntry
+from .search_index import index_document, search_documents
+from .storage import content_path
+from .management.commands import backfill_keywords
+from .utils import extractors, keywords
+from .utils.hashing import sha256_of_file
+
+
+def make_pdf(pages) -> bytes:
+    """A minimal PDF with one page of Helvetica text per entry of `pages`."""
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", b"", b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for text in pages:
+        lines = [text[i:i + 90] for i in range(0, len(text), 90)] or ['']
+        body = "\n".join(
+            "BT /F1 10 Tf 40 %d Td (%s) Tj ET" % (780 - 14 * n, line.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)'))
+            for n, line in enumerate(lines)
+        ).encode('latin-1')
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(body), body))
+        objects.append(b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents %d 0 R "
+                       b"/Resources << /Font << /F1 3 0 R >> >> >>" % len(objects))
+        kids.append(len(objects))
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (b" ".join(b"%d 0 R" % k for k in kids), len(kids))
+
+    out, offsets = b"%PDF-1.4\n", []
+    for number, obj in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n%s\nendobj\n" % (number, obj)
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return out
+
+
+class InlineExecutor:
+    """Stands in for the extraction pools: runs each job at once, in this process."""
+
+    def submit(self, fn, *args, **kwargs):
+        future = Future()
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except BaseException as exc:
+            future.set_exception(exc)
+        return future
+
+
+class TempMediaMixin:
+    """Stores uploaded files in a temporary MEDIA_ROOT removed after each test."""
+
+    def setUp(self):
+        super().setUp()
+        self.media_root = tempfile.mkdtemp()
+        media = override_settings(MEDIA_ROOT=self.media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+
+
+INVOICE_TEXT = ("The invoice lists the tax owed by the customer. Invoice payment is due within thirty days, "
+                "and the tax office receives the invoice total. ")
+
+
+@mock.patch('documents.pipeline.get_process_pool', InlineExecutor)
+@mock.patch('documents.pipeline.get_executor', InlineExecutor)
+class ExtractionJobTests(TempMediaMixin, TestCase):
+    def _upload(self, name='invoice.pdf', content=None):
+        content = make_pdf([INVOICE_TEXT * 3]) if content is None else content
+        return self.client.post('/api/documents/', {'file': ContentFile(content, name=name)})
+
+    def _status(self, doc_id):
+        return self.client.get(f'/api/documents/{doc_id}/status/').json()['status']
+
+    def test_upload_is_accepted_pending_then_done(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            res = self._upload()
+        self.assertEqual(res.status_code, 202)
+        doc_id = res.json()['id']
+        self.assertEqual(res.json()['status'], Document.STATUS_PENDING)
+        self.assertEqual(self._status(doc_id), Document.STATUS_PENDING)
+
+        # the job is queued once the upload commits
+        self.assertEqual(len(callbacks), 1)
+        callbacks[0]()
+        self.assertEqual(self._status(doc_id), Document.STATUS_DONE)
+        doc = Document.objects.get(id=doc_id)
+        self.assertIn('invoice', doc.data.lower())
+        self.assertTrue(doc.keywords)
+        search = self.client.get('/api/documents/search/', {'q': 'invoice'}).json()
+        self.assertEqual([r['id'] for r in search['results']], [doc_id])
+
+    def test_failed_extraction_is_recorded(self):
+        with mock.patch('documents.pipeline.extract_document_fields', side_effect=RuntimeError('boom')), \
+                self.assertLogs('documents.pipeline', 'ERROR'), self.captureOnCommitCallbacks(execute=True):
+            res = self._upload()
+        self.assertEqual(self._status(res.json()['id']), Document.STATUS_FAILED)
+
+    def test_unknown_document_status_is_404(self):
+        res = self.client.get('/api/documents/00000000-0000-0000-0000-000000000000/status/')
+        self.assertEqual(res.status_code, 404)
+
+
+@mock.patch('documents.pipeline.get_process_pool', InlineExecutor)
+class RequeueExtractionsTests(TempMediaMixin, TestCase):
+    def _doc(self, status, minutes_ago):
+        doc = Document(status=status)
+        doc.file.save('invoice.pdf', ContentFile(make_pdf([INVOICE_TEXT])), save=False)
+        doc.save()
+        Document.objects.filter(id=doc.id).update(creationDate=doc.creationDate - timedelta(minutes=minutes_ago))
+        return doc
+
+    def _statuses(self, *docs):
+        return [Document.objects.get(id=doc.id).status for doc in docs]
+
+    def test_only_stale_jobs_are_rerun(self):
+        lost = self._doc(Document.STATUS_PENDING, 60)
+        stuck = self._doc(Document.STATUS_RUNNING, 60)
+        recent = self._doc(Document.STATUS_PENDING, 1)
+        failed = self._doc(Document.STATUS_FAILED, 60)
+
+        out = StringIO()
+        call_command('requeue_extractions', '--older-than', '15', '--batch-size', '1', stdout=out)
+        self.assertIn('2 stale documents re-extracted', out.getvalue())
+        self.assertEqual(self._statuses(lost, stuck, recent, failed),
+                         [Document.STATUS_DONE, Document.STATUS_DONE, Document.STATUS_PENDING, Document.STATUS_FAILED])
+        self.assertTrue(Document.objects.get(id=lost.id).keywords)
+
+    def test_dry_run_changes_nothing(self):
+        lost = self._doc(Document.STATUS_PENDING, 60)
+        out = StringIO()
+        call_command('requeue_extractions', '--dry-run', stdout=out)
+        self.assertIn('1 stale documents', out.getvalue())
+        self.assertEqual(self._statuses(lost), [Document.STATUS_PENDING])
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        cache.clear()  # corpus size is cached
+
+    def _doc(self, name, text):
+        doc = Document.objects.create(fileName=name, status=Document.STATUS_DONE)
+        index_document(doc.id, name, text)
+        return doc
+
+    def test_ranked_by_term_frequency_and_rarity(self):
+        often = self._doc('a.pdf', 'invoice ' * 10 + 'tax')
+        once = self._doc('b.pdf', 'invoice and a receipt')
+        self._doc('c.pdf', 'unrelated text')
+
+        res = self.client.get('/api/documents/search/', {'q': 'invoice'})
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual([r['id'] for r in res.json()['results']], [str(often.id), str(once.id)])
+
+    def test_and_or_modes(self):
+        both = self._doc('a.pdf', 'invoice tax')
+        one = self._doc('b.pdf', 'invoice only')
+
+        ids = lambda op: {r['id'] for r in self.client.get('/api/documents/search/',
+                                                            {'q': 'invoice tax', 'op': op}).json()['results']}
+        self.assertEqual(ids('and'), {str(both.id)})
+        self.assertEqual(ids('or'), {str(both.id), str(one.id)})
+
+    def test_file_name_words_match(self):
+        doc = self._doc('Quarterly_Report.pdf', 'numbers')
+        self.assertEqual([doc_id for doc_id, _ in search_documents('quarterly')], [doc.id])
+
+    def test_reindexing_replaces_postings(self):
+        doc = self._doc('a.pdf', 'invoice')
+        index_document(doc.id, 'a.pdf', 'receipt')
+        self.assertEqual(search_documents('invoice'), [])
+        self.assertEqual(list(DocumentTerm.objects.filter(document=doc).values_list('term', flat=True).order_by('term')),
+                         ['a', 'pdf', 'receipt'])
+
+    def test_query_required_and_op_validated(self):
+        self.assertEqual(self.client.get('/api/documents/search/').status_code, 400)
+        self.assertEqual(self.client.get('/api/documents/search/', {'q': 'x', 'op': 'xor'}).status_code, 400)
+
+
+class PageParallelPdfTests(TestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        self.path = os.path.join(directory, 'pages.pdf')
+        with open(self.path, 'wb') as f:
+            f.write(make_pdf([f'page number {i}' for i in range(1, 8)]))
+
+    def test_pages_come_back_in_order(self):
+        pool = ThreadPoolExecutor(max_workers=3)
+        self.addCleanup(pool.shutdown)
+        diagnostics = {}
+        with mock.patch.object(extractors, '_get_page_pool', return_value=pool):
+            pages = list(extractors.iter_pdf_page_texts(self.path, None, workers=3, parallel_min_pages=2,
+                                                        ocr_fallback=False, diagnostics=diagnostics))
+        self.assertEqual([p.strip() for p in pages], [f'page number {i}' for i in range(1, 8)])
+        self.assertTrue(diagnostics['pdf_parallel'])
+
+    def test_small_documents_stay_serial(self):
+        with mock.patch.object(extractors, '_get_page_pool') as get_pool:
+            pages = list(extractors.iter_pdf_page_texts(self.path, None, workers=3, parallel_min_pages=64,
+                                                        ocr_fallback=False))
+        self.assertEqual(len(pages), 7)
+        get_pool.assert_not_called()
+
+    @mock.patch.object(extractors, 'ProcessPoolExecutor')
+    def test_pools_per_worker_count_are_never_shut_down(self, executor):
+        executor.side_effect = lambda **kwargs: mock.Mock(name=f"pool{kwargs['max_workers']}")
+        self.addCleanup(extractors._page_pools.clear)
+        two = extractors._get_page_pool(2)
+        four = extractors._get_page_pool(4)
+        self.assertIsNot(two, four)
+        # a caller still mapping over the first pool keeps a live pool
+        self.assertIs(extractors._get_page_pool(2), two)
+        two.shutdown.assert_not_called()
+
+        extractors._discard_page_pool(two)
+        self.assertIsNot(extractors._get_page_pool(2), two)
+        self.assertIs(extractors._get_page_pool(4), four)
+
+
+@mock.patch('documents.pipeline.get_executor', InlineExecutor)
+class HashingUploadTests(TempMediaMixin, TestCase):
+    def test_hash_is_computed_while_streaming(self):
+        # several upload chunks (64 KiB each), so the digest spans chunk boundaries
+        content = bytes(range(256)) * 1000 + b'tail'
+        with mock.patch('documents.views.schedule_extraction'):
+            res = self.client.post('/api/documents/', {'file': ContentFile(content, name='data.bin')})
+        doc = Document.objects.get(id=res.json()['id'])
+        self.assertEqual(doc.contentHash, hashlib.sha256(content).hexdigest())
+        self.assertEqual(sha256_of_file(doc.file.path), doc.contentHash)
+        self.assertEqual(doc.fileSize, len(content))
+
+    def test_identical_uploads_are_extracted_once(self):
+        content = make_pdf([INVOICE_TEXT])
+        with mock.patch('documents.pipeline.compute_document_fields', wraps=pipeline.compute_document_fields) as compute:
+            for name in ('first.pdf', 'second.pdf'):
+                with self.captureOnCommitCallbacks(execute=True):
+                    self.client.post('/api/documents/', {'file': ContentFile(content, name=name)})
+        self.assertEqual(compute.call_count, 1)
+        first, second = Document.objects.order_by('creationDate')
+        self.assertEqual(first.contentHash, second.contentHash)
+        self.assertEqual((second.status, second.keywords), (Document.STATUS_DONE, first.keywords))
+        self.assertTrue(second.diagnostics['cached'])
+
+
+class ExtractionCacheTests(TempMediaMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.path = os.path.join(self.media_root, 'invoice.pdf')
+        with open(self.path, 'wb') as f:
+            f.write(make_pdf([INVOICE_TEXT]))
+        self.content_hash = sha256_of_file(self.path)
+        self.addCleanup(setattr, extraction_cache, '_inserts', 0)
+
+    def _extract(self):
+        return pipeline.extract_document_fields(file_path=self.path, content_type='application/pdf',
+                                                content_hash=self.content_hash)
+
+    def _fields(self, text='some text'):
+        return {'data': text, 'keywords': ['text'], 'keyword_scores': {'text': 0.1}, 'language': 'en', 'diagnostics': {}}
+
+    def test_hit_skips_extraction(self):
+        first = self._extract()
+        with mock.patch('documents.pipeline.compute_document_fields') as compute:
+            second = self._extract()
+        compute.assert_not_called()
+        self.assertEqual((second['data'], second['keywords']), (first['data'], first['keywords']))
+        self.assertTrue(second['diagnostics']['cached'])
+
+    def test_extractor_version_bump_invalidates(self):
+        self._extract()
+        with mock.patch.object(pipeline, 'EXTRACTOR_VERSION', pipeline.EXTRACTOR_VERSION + 1), \
+                mock.patch('documents.pipeline.compute_document_fields', wraps=pipeline.compute_document_fields) as compute:
+            self.assertNotIn('cached', self._extract()['diagnostics'])
+        compute.assert_called_once()
+        self.assertEqual(ExtractionCacheEntry.objects.count(), 2)
+
+    def test_empty_text_is_not_cached(self):
+        extraction_cache.store('k', self._fields(text='  '))
+        self.assertIsNone(extraction_cache.get_cached('k'))
+
+    @override_settings(DOCUMENTS_TEXT_COMPRESSION=True, DOCUMENTS_TEXT_COMPRESSION_MIN_CHARS=10)
+    def test_long_text_is_stored_compressed(self):
+        text = 'invoice tax ' * 200
+        extraction_cache.store('k', self._fields(text=text))
+        entry = ExtractionCacheEntry.objects.get(key='k')
+        self.assertEqual((entry.codec, entry.data), ('zlib', ''))
+        self.assertEqual(extraction_cache.get_cached('k')['data'], text)
+
+    @override_settings(DOCUMENTS_EXTRACTION_CACHE_SIZE=3)
+    def test_least_recently_used_entries_are_evicted(self):
+        for key in 'abc':
+            extraction_cache.store(key, self._fields())
+        extraction_cache.get_cached('a')
+        extraction_cache.store('d', self._fields())
+        self.assertEqual(set(ExtractionCacheEntry.objects.values_list('key', flat=True)), {'a', 'c', 'd'})
+
+    @override_settings(DOCUMENTS_EXTRACTION_CACHE_SIZE=5000)
+    def test_size_is_only_checked_every_so_many_inserts(self):
+        counts = 0
+        for i in range(extraction_cache.EVICT_EVERY):
+            with CaptureQueriesContext(connection) as queries:
+                extraction_cache.store(f'key{i}', self._fields())
+            counts += sum('COUNT(' in q['sql'] for q in queries.captured_queries)
+        self.assertEqual(counts, 1)
+        # refreshing an existing entry never sweeps
+        with CaptureQueriesContext(connection) as queries:
+            extraction_cache.store('key0', self._fields())
+        self.assertFalse(any('COUNT(' in q['sql'] for q in queries.captured_queries))
+
+
+class BackfillKeywordsTests(TempMediaMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.docs = []
+        for i in range(3):
+            doc = Document(status=Document.STATUS_PENDING)
+            doc.file.save(f'{i}.pdf', ContentFile(make_pdf([f'{INVOICE_TEXT} Copy number {i}.'])), save=False)
+            doc.save()
+            self.docs.append(doc)
+        self.docs.sort(key=lambda d: d.id)  # batches follow primary key order
+        self.checkpoint = os.path.join(self.media_root, 'backfill.checkpoint')
+
+    def _backfill(self, *args):
+        out = StringIO()
+        call_command('backfill_keywords', '--batch-size', '1', '--checkpoint', self.checkpoint, *args, stdout=out)
+        return out.getvalue()
+
+    def _stamps(self):
+        return dict(Document.objects.values_list('id', 'keywordsUpdated'))
+
+    def test_resume_after_interruption_then_skip_unchanged(self):
+        calls = []
+        backfill_file = backfill_keywords.backfill_file
+
+        def interrupt_second_batch(task):
+            calls.append(task[0])
+            if len(calls) == 2:
+                raise KeyboardInterrupt
+            return backfill_file(task)
+
+        with mock.patch.object(backfill_keywords, 'backfill_file', interrupt_second_batch):
+            with self.assertRaises(KeyboardInterrupt):
+                self._backfill()
+        first = self.docs[0]
+        with open(self.checkpoint) as f:
+            self.assertEqual(f.read(), str(first.id))
+        stamps = self._stamps()
+        self.assertIsNotNone(stamps[first.id])
+        self.assertEqual([Document.objects.get(id=d.id).status for d in self.docs[1:]], [Document.STATUS_PENDING] * 2)
+
+        # --resume starts after the checkpoint: the first document is not even looked at again
+        with mock.patch.object(backfill_keywords, 'backfill_file', side_effect=backfill_file) as task:
+            self._backfill('--resume')
+        self.assertEqual([call.args[0][0] for call in task.call_args_list], [d.id for d in self.docs[1:]])
+        self.assertEqual(self._stamps()[first.id], stamps[first.id])
+        self.assertTrue(all(Document.objects.get(id=d.id).keywords for d in self.docs))
+        # a finished run leaves no checkpoint behind
+        self.assertFalse(os.path.exists(self.checkpoint))
+
+        # unchanged files (same hash and extractor version) are skipped without writing their rows
+        stamps = self._stamps()
+        out = self._backfill()
+        self.assertIn('skipped 3 unchanged', out)
+        self.assertEqual(self._stamps(), stamps)
+
+    def test_force_reprocesses_unchanged_files(self):
+        self._backfill()
+        stamps = self._stamps()
+        self.assertIn('Processed 3 documents', self._backfill('--force'))
+        self.assertTrue(all(self._stamps()[doc_id] > stamp for doc_id, stamp in stamps.items()))
+
+    def test_batch_text_indexed_before_vectors_are_stored(self):
+        indexed_first = []
+        store_vectors = similarity.store_vectors
+
+        def record_store_vectors(items):
+            items = list(items)
+            indexed_first.append(all(DocumentTerm.objects.filter(document_id=doc_id).exists() for doc_id, _, _ in items))
+            return store_vectors(items)
+
+        with mock.patch.object(similarity, 'store_vectors', record_store_vectors):
+            self._backfill()
+        self.assertEqual(indexed_first, [True] * len(self.docs))
+
+
+FRENCH_TEXT = ("La facture indique le montant de la taxe due par le client. Le paiement de la facture "
+               "est attendu sous trente jours, et le service des impôts reçoit le total de la facture. ")
+
+
+class KeywordBatchTests(TestCase):
+    def test_batch_matches_one_document_at_a_time(self):
+        texts = [INVOICE_TEXT * 2, FRENCH_TEXT * 2, '', 'Shipment delivery to the warehouse was late. ' * 3]
+        expected = [keywords.extract_keywords_with_scores(text, max_ngram=2, top_k=10) for text in texts]
+        self.assertEqual(keywords.extract_keywords_batch(texts, max_ngram=2, top_k=10), expected)
+        self.assertTrue(expected[1])
+        self.assertEqual(expected[2], [])
+
+    def test_language_hints_are_used(self):
+        texts = [FRENCH_TEXT, INVOICE_TEXT]
+        hinted = keywords.extract_keywords_batch(texts, lang_hints=['en', None])
+        self.assertEqual(hinted[0], keywords.extract_keywords_with_scores(FRENCH_TEXT, lang_hint='en'))
+        self.assertEqual(hinted[1], keywords.extract_keywords_with_scores(INVOICE_TEXT))
+
+    def test_extractors_are_reused_but_never_shared(self):
+        with keywords._keyword_extractor('en', 2, 7) as first:
+            with keywords._keyword_extractor('en', 2, 7) as concurrent:
+                self.assertIsNot(first, concurrent)
+        with keywords._keyword_extractor('en', 2, 7) as again:
+            self.assertIn(again, (first, concurrent))
+
+
+class DetectLanguageTests(TestCase):
+    def test_sample_spans_the_document(self):
+        # a French opening section followed by a much longer English body
+        text = FRENCH_TEXT * 30 + INVOICE_TEXT * 200
+        self.assertEqual(keywords.detect_language(FRENCH_TEXT * 30), 'fr')
+        self.assertEqual(keywords.detect_language(text), 'en')
+
+    def test_only_bounded_windows_are_examined(self):
+        text = INVOICE_TEXT * 2000
+        with mock.patch('documents.utils.keywords.detect_langs', wraps=keywords.detect_langs) as detect:
+            self.assertEqual(keywords.detect_language(text, regions=5), 'en')
+        # two agreeing windows are enough; the other three are never looked at
+        self.assertEqual(detect.call_count, keywords.LANG_MIN_WINDOWS)
+        self.assertTrue(all(len(call.args[0]) <= keywords.LANG_SAMPLE_CHARS // 5 for call in detect.call_args_list))
+
+    def test_undetectable_text(self):
+        self.assertIsNone(keywords.detect_language(''))
+        self.assertIsNone(keywords.detect_language('1234 5678 ---'))
+
+
+class KeywordStreamTests(TestCase):
+    SHIPPING_TEXT = ("The shipment left the warehouse late, so the delivery to the customer slipped. "
+                     "Warehouse staff rescheduled the shipment and the carrier confirmed the delivery date. ")
+
+    def _stream(self, pieces, **kwargs):
+        stream = keywords.KeywordStream(max_ngram=2, top_k=10, **kwargs)
+        for piece in pieces:
+            stream.feed(piece)
+        return stream, stream.close()
+
+    def test_one_segment_matches_one_shot_extraction(self):
+        text = INVOICE_TEXT * 5
+        pieces = [text[i:i + 100] for i in range(0, len(text), 100)]
+        stream, merged = self._stream(pieces, segment_chars=len(text) + 1)
+        # pieces are joined with newlines, which YAKE treats like spaces
+        self.assertEqual(merged, keywords.extract_keywords_with_scores("\n".join(pieces), max_ngram=2, top_k=10))
+        self.assertEqual(stream.language, 'en')
+
+    def test_segments_merge_by_best_score_over_occurrences(self):
+        first, second = INVOICE_TEXT * 4, self.SHIPPING_TEXT * 4
+        stream, merged = self._stream([first, second], segment_chars=min(len(first), len(second)))
+
+        per_segment = [dict(keywords.extract_keywords_with_scores(text, max_ngram=2, top_k=20, lang_hint='en'))
+                       for text in (first, second)]
+        expected = {}
+        for scores in per_segment:
+            for kw, score in scores.items():
+                best, seen = expected.get(kw, (score, 0))
+                expected[kw] = (min(best, score), seen + 1)
+        ranking = sorted(((kw, best / seen) for kw, (best, seen) in expected.items()), key=lambda x: x[1])[:10]
+        self.assertEqual(merged, ranking)
+        self.assertTrue({kw for kw, _ in merged} & set(per_segment[0]))
+        self.assertTrue({kw for kw, _ in merged} & set(per_segment[1]))
+
+    def test_language_is_voted_over_segments(self):
+        segment = len(FRENCH_TEXT) * 3
+        pieces = [FRENCH_TEXT * 3] + [(INVOICE_TEXT * 4)[:segment]] * 3
+        self.assertEqual(self._stream(pieces, segment_chars=segment)[0].language, 'en')
+
+    def test_detection_is_retried_after_an_undetectable_segment(self):
+        stream, _ = self._stream(['1234 5678 ' * 20, INVOICE_TEXT * 2], segment_chars=150)
+        self.assertEqual(stream.language, 'en')
+
+    def test_hint_skips_detection(self):
+        with mock.patch('documents.utils.keywords.detect_language') as detect:
+            stream, _ = self._stream([INVOICE_TEXT], lang_hint='fr')
+        detect.assert_not_called()
+        self.assertEqual(stream.language, 'fr')
+
+
+class OcrFallbackTests(TestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        self.path = os.path.join(directory, 'scan.pdf')
+        # pages 2, 4 and 5 have no selectable text, as in a partly scanned document
+        with open(self.path, 'wb') as f:
+            f.write(make_pdf(['typed cover page text', '', 'typed summary page text', '', '']))
+        for probe in (extractors._ocr_available, extractors._tesseract_available):
+            probe.cache_clear()
+            self.addCleanup(probe.cache_clear)
+
+    def _fake_ocr_modules(self, tesseract_error=None):
+        pytesseract = types.ModuleType('pytesseract')
+        pytesseract.get_tesseract_version = mock.Mock(side_effect=tesseract_error, return_value='5.3.0')
+        return mock.patch.dict(sys.modules, {'pdf2image': types.ModuleType('pdf2image'), 'pytesseract': pytesseract})
+
+    def test_probe_needs_pdftoppm_and_tesseract(self):
+        with self._fake_ocr_modules(), mock.patch('shutil.which', return_value='/usr/bin/pdftoppm'):
+            self.assertTrue(extractors._ocr_available())
+        extractors._ocr_available.cache_clear()
+        extractors._tesseract_available.cache_clear()
+        with self._fake_ocr_modules(), mock.patch('shutil.which', return_value=None):
+            self.assertFalse(extractors._ocr_available())
+        extractors._ocr_available.cache_clear()
+        with self._fake_ocr_modules(tesseract_error=OSError('tesseract not found')), \
+                mock.patch('shutil.which', return_value='/usr/bin/pdftoppm'):
+            self.assertFalse(extractors._ocr_available())
+
+    def test_probe_runs_once(self):
+        with self._fake_ocr_modules(), mock.patch('shutil.which', return_value='/usr/bin/pdftoppm') as which:
+            extractors._ocr_available()
+            extractors._ocr_available()
+        which.assert_called_once()
+
+    def _pages(self, workers, ocr_available=True, **kwargs):
+        diagnostics = {}
+        with mock.patch.object(extractors, '_ocr_available', return_value=ocr_available):
+            pages = list(extractors.iter_pdf_page_texts(self.path, None, workers=workers, diagnostics=diagnostics, **kwargs))
+        return [p.strip() for p in pages], diagnostics
+
+    @mock.patch.object(extractors, '_ocr_pdf_page_worker', side_effect=lambda path, page, dpi: (f'scanned page {page}', 90.0))
+    def test_pages_without_text_are_ocrd(self, ocr):
+        pages, diagnostics = self._pages(workers=1)
+        self.assertEqual(pages, ['typed cover page text', 'scanned page 2', 'typed summary page text',
+                                 'scanned page 4', 'scanned page 5'])
+        self.assertEqual([call.args[1] for call in ocr.call_args_list], [2, 4, 5])
+        self.assertEqual(diagnostics['extractor'], 'pdf_text+ocr')
+        self.assertEqual(diagnostics['ocr_confidence'], 90.0)
+        self.assertEqual([p['page'] for p in diagnostics['ocr_pages'] if p['used']], [2, 4, 5])
+
+    @mock.patch.object(extractors, '_ocr_pdf_page_worker', side_effect=lambda path, page, dpi: (f'scanned page {page}', 90.0))
+    def test_later_scanned_pages_go_to_the_ocr_pool(self, ocr):
+        pool = ThreadPoolExecutor(max_workers=2)
+        self.addCleanup(pool.shutdown)
+        with mock.patch.object(extractors, '_get_ocr_pool', return_value=pool) as get_ocr_pool, \
+                mock.patch.object(pool, 'submit', wraps=pool.submit) as submit, \
+                mock.patch.object(extractors, '_get_page_pool') as get_page_pool:
+            pages, _ = self._pages(workers=2)
+        self.assertEqual([pages[1], pages[3], pages[4]], ['scanned page 2', 'scanned page 4', 'scanned page 5'])
+        # the first OCR pages run here; from PDF_OCR_PARALLEL_MIN_PAGES on they go to the OCR pool
+        get_ocr_pool.assert_called_once_with(2)
+        self.assertEqual([call.args[2] for call in submit.call_args_list], [5])
+        get_page_pool.assert_not_called()  # small PDF: page text is extracted serially
+
+    @mock.patch.object(extractors, '_ocr_pdf_page_worker')
+    def test_no_fallback_without_ocr_tools_or_when_disabled(self, ocr):
+        self.assertEqual(self._pages(workers=1, ocr_available=False)[0][1], '')
+        pages, diagnostics = self._pages(workers=1, ocr_fallback=False)
+        self.assertEqual((pages[1], diagnostics['extractor']), ('', 'pdf_text'))
+        ocr.assert_not_called()
+
+    @mock.patch.object(extractors, '_ocr_pdf_page_worker', side_effect=RuntimeError('pdftoppm crashed'))
+    def test_failed_ocr_keeps_the_selectable_text(self, ocr):
+        with self.assertLogs('documents.utils.extractors', 'ERROR'):
+            pages, diagnostics = self._pages(workers=1)
+        self.assertEqual(pages[0], 'typed cover page text')
+        self.assertEqual((pages[1], diagnostics['extractor']), ('', 'pdf_text'))
+
+
+class SummaryFieldsTests(TestCase):
+    SUMMARY_KEYS = {'id', 'fileName', 'creationDate', 'fileSize', 'contentType', 'language', 'status',
+                    'keywords', 'snippet', 'fileUrl'}
+
+    def setUp(self):
+        self.doc = Document.objects.create(fileName='a.pdf', data='x' * 500,
+                                           keywords=[f'kw{i}' for i in range(12)], keyword_scores={'kw0': 0.1})
+        index_document(self.doc.id, self.doc.fileName, self.doc.data)
+
+    def test_list_returns_summaries(self):
+        for url in ('/api/documents/', '/api/documents/search/?q=a'):
+            row = self.client.get(url).json()['results'][0]
+            self.assertEqual(set(row), self.SUMMARY_KEYS, url)
+            self.assertEqual(row['snippet'], 'x' * 200)
+            self.assertEqual(row['keywords'], [f'kw{i}' for i in range(8)])
+
+    def test_detail_returns_the_full_document(self):
+        row = self.client.get(f'/api/documents/{self.doc.id}/').json()
+        self.assertEqual(row['data'], 'x' * 500)
+        self.assertEqual(len(row['keywords']), 12)
+        self.assertEqual(row['keyword_scores'], {'kw0': 0.1})
+
+    def test_requested_fields_only(self):
+        row = self.client.get('/api/documents/', {'fields': 'id,fileName'}).json()['results'][0]
+        self.assertEqual(row, {'id': str(self.doc.id), 'fileName': 'a.pdf'})
+        # id is always included; heavy fields only when asked for
+        row = self.client.get('/api/documents/', {'fields': 'data'}).json()['results'][0]
+        self.assertEqual(row, {'id': str(self.doc.id), 'data': 'x' * 500})
+
+    def test_unknown_field_is_rejected(self):
+        res = self.client.get('/api/documents/', {'fields': 'id,fileName,bogus'})
+        self.assertEqual(res.status_code, 400)
+        self.assertIn('bogus', res.json()['fields'][0])
+
+
+class CursorPaginationTests(TestCase):
+    def setUp(self):
+        cache.clear()  # corpus size is cached
+
+    def test_list_pages_newest_first(self):
+        docs = [Document.objects.create(fileName=f'{i}.pdf', data=f'text of document {i}') for i in range(5)]
+        expected = [str(d.id) for d in sorted(docs, key=lambda d: (d.creationDate, d.id), reverse=True)]
+
+        first = self.client.get('/api/documents/', {'page_size': 3}).json()
+        second = self.client.get(first['next']).json()
+        self.assertIsNone(second['next'])
+        self.assertEqual([r['id'] for r in first['results'] + second['results']], expected)
+        back = self.client.get(second['previous']).json()
+        self.assertEqual([r['id'] for r in back['results']], expected[:3])
+
+    def test_list_page_cost_does_not_grow_with_depth(self):
+        for i in range(30):
+            Document.objects.create(fileName=f'{i}.pdf')
+        page = self.client.get('/api/documents/', {'page_size': 10}).json()
+        deep = self.client.get(page['next']).json()
+        # keyset pages: no COUNT and no OFFSET, one range query per page
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(deep['next'])
+        sql = ' '.join(q['sql'] for q in queries.captured_queries).upper()
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn('OFFSET', sql)
+        self.assertNotIn('COUNT(', sql)
+
+    def test_search_pages_cover_the_ranking_once(self):
+        for i in range(25):
+            doc = Document.objects.create(fileName=f'{i}.pdf')
+            index_document(doc.id, doc.fileName, 'report ' * (i % 5 + 1))
+        expected = [str(doc_id) for doc_id, _ in search_documents('report')]
+
+        seen = []
+        url, params = '/api/documents/search/', {'q': 'report', 'page_size': 10}
+        while url:
+            page = self.client.get(url, params).json()
+            self.assertLessEqual(len(page['results']), 10)
+            seen += [r['id'] for r in page['results']]
+            url, params = page['next'], None
+        self.assertEqual(seen, expected)
+
+        # and back again from the second page
+        first = self.client.get('/api/documents/search/', {'q': 'report', 'page_size': 10}).json()
+        second = self.client.get(first['next']).json()
+        back = self.client.get(second['previous']).json()
+        self.assertEqual([r['id'] for r in back['results']], expected[:10])
+
+    def test_invalid_cursor_is_404(self):
+        self.assertEqual(self.client.get('/api/documents/search/', {'q': 'report', 'cursor': 'garbage'}).status_code, 404)
+        self.assertEqual(self.client.get('/api/documents/', {'cursor': 'garbage'}).status_code, 404)
+
+
+class KeywordStatsTests(TestCase):
+    def setUp(self):
+        self.doc = Document.objects.create(
+            fileName='a.pdf', keywordStats=[{'word': 'tax', 'score': 0.1, 'percent': 100.0}],
+            keywordsUpdated=timezone.now(),
+        )
+        self.url = f'/api/documents/{self.doc.id}/keyword-stats/'
+
+    def test_etag_and_last_modified_revalidation(self):
+        res = self.client.get(self.url)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.json(), self.doc.keywordStats)
+        etag, last_modified = res['ETag'], res['Last-Modified']
+
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertEqual(self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+
+        Document.objects.filter(id=self.doc.id).update(keywordsUpdated=self.doc.keywordsUpdated + timedelta(seconds=5))
+        res = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, 200)
+        self.assertNotEqual(res['ETag'], etag)
+
+    def test_batch(self):
+        other = Document.objects.create(fileName='b.pdf', keywordsUpdated=timezone.now())
+        url = '/api/documents/keyword-stats/'
+        res = self.client.get(url, {'ids': f'{self.doc.id},{other.id}'})
+        self.assertEqual(res.json(), {str(self.doc.id): self.doc.keywordStats, str(other.id): []})
+        # the validator does not depend on the order ids are given in
+        self.assertEqual(self.client.get(url, {'ids': f'{other.id},{self.doc.id}'},
+                                         HTTP_IF_NONE_MATCH=res['ETag']).status_code, 304)
+        self.assertEqual(self.client.get(url, {'ids': 'not-an-id'}).status_code, 400)
+        self.assertEqual(self.client.get(url).status_code, 400)
+
+    def test_percentages_follow_inverse_scores(self):
+        stats = keywords.keyword_stats({'tax': 0.1, 'invoice': 0.3})
+        self.assertEqual([s['word'] for s in stats], ['tax', 'invoice'])
+        self.assertEqual(sum(s['percent'] for s in stats), 100.0)
+
+
+class DebugActionTests(TempMediaMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        with mock.patch('documents.pipeline.get_executor', InlineExecutor), self.captureOnCommitCallbacks(execute=True):
+            res = self.client.post('/api/documents/', {'file': ContentFile(make_pdf([INVOICE_TEXT, '']), name='a.pdf')})
+        self.doc = Document.objects.get(id=res.json()['id'])
+        self.url = f'/api/documents/{self.doc.id}/debug/'
+
+    def test_stored_diagnostics_are_served_without_extracting(self):
+        with mock.patch('documents.views.compute_document_fields') as compute:
+            body = self.client.get(self.url).json()
+        compute.assert_not_called()
+        self.assertFalse(body['reextracted'])
+        self.assertEqual(body['extracted_text_length'], len(self.doc.data))
+        self.assertTrue(body['sample_text'].startswith('The invoice'))
+        self.assertEqual(body['stored_keywords'], self.doc.keywords)
+        diagnostics = body['diagnostics']
+        self.assertEqual(diagnostics['extractor'], 'pdf_text')
+        self.assertEqual(len(diagnostics['page_chars']), 2)
+        self.assertGreater(diagnostics['page_chars'][0], 100)
+        self.assertEqual(diagnostics['page_chars'][1], 0)
+        self.assertEqual(set(diagnostics['timings']), {'extract', 'keywords', 'language'})
+
+    def test_ocr_flags_are_reported(self):
+        ocr = {'extractor': 'pdf_text+ocr', 'ocr_confidence': 91.5,
+               'ocr_pages': [{'page': 2, 'confidence': 91.5, 'used': True}]}
+        Document.objects.filter(id=self.doc.id).update(diagnostics=dict(self.doc.diagnostics, **ocr))
+        diagnostics = self.client.get(self.url).json()['diagnostics']
+        self.assertEqual({key: diagnostics[key] for key in ocr}, ocr)
+
+    def test_reextract_runs_again_without_saving(self):
+        stored = self.doc.diagnostics
+        with mock.patch('documents.views.compute_document_fields', wraps=pipeline.compute_document_fields) as compute:
+            body = self.client.get(self.url, {'reextract': '1'}).json()
+        self.assertEqual(compute.call_args.kwargs['file_path'], self.doc.file.path)
+        self.assertTrue(body['reextracted'])
+        self.assertEqual(body['extracted_text_length'], len(self.doc.data))
+        self.assertIn('timings', body['diagnostics'])
+        self.assertEqual(Document.objects.get(id=self.doc.id).diagnostics, stored)
+
+
+class MetricsTests(TempMediaMixin, TestCase):
+    def test_local_clients_by_default(self):
+        self.assertEqual(self.client.get('/api/metrics/').status_code, 200)
+        self.assertEqual(self.client.get('/api/metrics/', REMOTE_ADDR='10.0.0.1').status_code, 404)
+
+    @override_settings(DOCUMENTS_METRICS_TOKEN='s3cret')
+    def test_bearer_token(self):
+        self.assertEqual(self.client.get('/api/metrics/').status_code, 404)
+        self.assertEqual(self.client.get('/api/metrics/', HTTP_AUTHORIZATION='Bearer wrong').status_code, 404)
+        res = self.client.get('/api/metrics/', HTTP_AUTHORIZATION='Bearer s3cret', REMOTE_ADDR='10.0.0.1')
+        self.assertEqual(res.status_code, 200)
+
+    @mock.patch('documents.pipeline.get_executor', InlineExecutor)
+    def test_pipeline_stages_are_recorded(self):
+        def stage_count(stage):
+            return sum(sum(counts) for (name, *_), (counts, _) in metrics.STAGE_DURATION.snapshot().items()
+                       if name == stage)
+
+        stages = ('store', 'extract', 'keywords', 'language', 'minhash', 'persist', 'index', 'total')
+        before = {stage: stage_count(stage) for stage in stages}
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/api/documents/', {'file': ContentFile(make_pdf([INVOICE_TEXT]), name='a.pdf')})
+        self.assertEqual({stage: stage_count(stage) - before[stage] for stage in stages}, dict.fromkeys(stages, 1))
+
+        body = self.client.get('/api/metrics/').content.decode()
+        self.assertIn('# TYPE documents_stage_duration_seconds histogram', body)
+        self.assertIn('documents_stage_duration_seconds_count{stage="extract",content_type="application/pdf",language="en"}', body)
+
+
+@mock.patch('documents.views.schedule_bulk_extraction')
+@mock.patch('documents.views.schedule_extraction')
+class BulkUploadTests(TempMediaMixin, TestCase):
+    def _zip(self, members):
+        buf = io.BytesIO()
+        with zipfile.ZipFile(buf, 'w', zipfile.ZIP_DEFLATED) as archive:
+            for name, data in members:
+                archive.writestr(name, data)
+        return ContentFile(buf.getvalue(), name='batch.zip')
+
+    def test_bulk_upload_unpacks_archives(self, schedule_extraction, schedule_bulk_extraction):
+        res = self.client.post('/api/documents/bulk/', {'files': [self._zip([('a.txt', b'one'), ('b.txt', b'two')])]})
+        self.assertEqual(res.status_code, 202)
+        self.assertEqual([r['fileName'] for r in res.json()['results']], ['a.txt', 'b.txt'])
+        self.assertEqual(len(schedule_bulk_extraction.call_args[0][0]), 2)
+
+    @override_settings(DOCUMENTS_BULK_MAX_BYTES=1000)
+    def test_bulk_upload_rejects_archives_over_the_size_limit(self, *_):
+        archive = self._zip([('a.txt', b'a' * 600), ('b.txt', b'b' * 600)])
+        res = self.client.post('/api/documents/bulk/', {'files': [archive]})
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(Document.objects.count(), 0)
+
+    @override_settings(DOCUMENTS_BULK_MAX_MEMBERS=3)
+    def test_bulk_upload_rejects_archives_with_too_many_entries(self, *_):
+        archive = self._zip([(f'dir{i}/', b'') for i in range(5)])
+        self.assertEqual(self.client.post('/api/documents/bulk/', {'files': [archive]}).status_code, 400)
+
+
+@mock.patch('documents.views.schedule_extraction')
+class UploadQueryTests(TempMediaMixin, TestCase):
+    def test_upload_is_one_insert(self, schedule_extraction):
+        with self.assertNumQueries(1):
+            res = self.client.post('/api/documents/', {'file': ContentFile(b'plain text', name='notes.txt')})
+        self.assertEqual(res.status_code, 202)
+
+        doc = Document.objects.get(id=res.json()['id'])
+        self.assertEqual((doc.fileName, doc.fileSize, doc.status), ('notes.txt', 10, Document.STATUS_PENDING))
+        self.assertEqual(doc.contentType, 'text/plain')
+        schedule_extraction.assert_called_once_with(doc.id)
+
+
+class ParseRangeTests(TestCase):
+    def test_ranges(self):
+        self.assertEqual(parse_range('bytes=0-99', 1000), (0, 99))
+        self.assertEqual(parse_range('bytes=900-', 1000), (900, 999))
+        self.assertEqual(parse_range('bytes=-100', 1000), (900, 999))
+        self.assertEqual(parse_range('bytes=-5000', 1000), (0, 999))
+        self.assertEqual(parse_range('bytes=990-5000', 1000), (990, 999))
+
+    def test_ignored_headers(self):
+        for header in (None, '', 'items=0-1', 'bytes=0-1,5-6', 'bytes=-', 'bytes=a-b'):
+            self.assertIsNone(parse_range(header, 1000), header)
+
+    def test_unsatisfiable(self):
+        for header in ('bytes=1000-', 'bytes=5-4', 'bytes=-0'):
+            with self.assertRaises(ValueError):
+                parse_range(header, 1000)
+
+
+@mock.patch('documents.views.schedule_extraction')
+class DownloadTests(TempMediaMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        res = self.client.post('/api/documents/', {'file': ContentFile(bytes(range(256)) * 4, name='data.bin')})
+        self.doc = Document.objects.get(id=res.json()['id'])
+        self.url = f'/api/documents/{self.doc.id}/download/'
+
+    def test_partial_content(self, _):
+        res = self.client.get(self.url, HTTP_RANGE='bytes=10-19')
+        self.assertEqual(res.status_code, 206)
+        self.assertEqual(res['Content-Range'], 'bytes 10-19/1024')
+        self.assertEqual(b''.join(res.streaming_content), bytes(range(10, 20)))
+
+    def test_unsatisfiable_range(self, _):
+        res = self.client.get(self.url, HTTP_RANGE='bytes=5000-')
+        self.assertEqual(res.status_code, 416)
+        self.assertEqual(res['Content-Range'], 'bytes */1024')
+
+    def test_etag_and_stale_if_range(self, _):
+        full = self.client.get(self.url)
+        self.assertEqual(full['ETag'], f'"{self.doc.contentHash}"')
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=full['ETag']).status_code, 304)
+        # a Range for another version of the file gets the whole file
+        res = self.client.get(self.url, HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"other"')
+        self.assertEqual(res.status_code, 200)
+
+    def _legacy_file(self, name='legacy/résumé.bin'):
+        # uploads from before content addressing kept their original names
+        path = os.path.join(self.media_root, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(b'old bytes')
+        Document.objects.filter(id=self.doc.id).update(file=name)
+        return path
+
+    @override_settings(DOCUMENTS_DOWNLOAD_SENDFILE='x-sendfile')
+    def test_x_sendfile_path_is_percent_encoded(self, _):
+        path = self._legacy_file()
+        res = self.client.get(self.url)
+        self.assertEqual(res['X-Sendfile'], quote(path))
+        self.assertIn('r%C3%A9sum%C3%A9.bin', res['X-Sendfile'])
+
+    @override_settings(DOCUMENTS_DOWNLOAD_SENDFILE='x-accel-redirect', DOCUMENTS_DOWNLOAD_ACCEL_PREFIX='/protected/')
+    def test_x_accel_redirect_is_percent_encoded(self, _):
+        self._legacy_file()
+        res = self.client.get(self.url)
+        self.assertEqual(res['X-Accel-Redirect'], '/protected/legacy/r%C3%A9sum%C3%A9.bin')
+
+
+@mock.patch('documents.views.schedule_bulk_extraction')
+@mock.patch('documents.views.schedule_extraction')
+class SharedFileTests(TempMediaMixin, TestCase):
+    def _upload(self, name, content=b'same bytes'):
+        res = self.client.post('/api/documents/', {'file': ContentFile(content, name=name)})
+        self.assertEqual(res.status_code, 202)
+        return Document.objects.get(id=res.json()['id'])
+
+    def test_identical_uploads_share_one_file(self, *_):
+        a, b = self._upload('a.txt'), self._upload('b.txt')
+        self.assertEqual(a.file.name, b.file.name)
+        self.assertEqual((a.fileName, b.fileName), ('a.txt', 'b.txt'))
+        digest = hashlib.sha256(b'same bytes').hexdigest()
+        self.assertEqual(a.file.name, f'uploads/{digest[:2]}/{digest[2:4]}/{digest}.txt')
+        self.assertEqual(a.file.name, content_path(digest, 'a.txt'))
+
+    def test_file_deleted_with_its_last_document(self, *_):
+        a, b = self._upload('a.txt'), self._upload('b.txt')
+        storage, name = a.file.storage, a.file.name
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.client.delete(f'/api/documents/{a.id}/').status_code, 204)
+        self.assertTrue(storage.exists(name))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.client.delete(f'/api/documents/{b.id}/').status_code, 204)
+        self.assertFalse(storage.exists(name))
+
+    def test_failed_bulk_upload_keeps_shared_files(self, *_):
+        existing = self._upload('a.txt')
+        storage = existing.file.storage
+        files = [ContentFile(b'same bytes', name='again.txt'), ContentFile(b'new bytes', name='new.txt')]
+        with mock.patch.object(Document.objects, 'bulk_create', side_effect=RuntimeError('insert failed')):
+            with self.assertRaises(RuntimeError), self.captureOnCommitCallbacks(execute=True):
+                self.client.post('/api/documents/bulk/', {'files': files})
+
+        self.assertTrue(storage.exists(existing.file.name))
+        self.assertEqual(Document.objects.count(), 1)
+        self.assertFalse(storage.exists(content_path(hashlib.sha256(b'new bytes').hexdigest(), 'new.txt')))
+
+
+@override_settings(DOCUMENTS_TEXT_COMPRESSION=True, DOCUMENTS_TEXT_COMPRESSION_MIN_CHARS=100)
+class TextStoreTests(TestCase):
+    LONG_TEXT = INVOICE_TEXT * 40
+
+    def _saved(self, text):
+        doc = Document(fileName='long.txt')
+        doc.data = text
+        doc.save()
+        return Document.objects.get(id=doc.id)
+
+    def test_round_trip_through_data_with_each_codec(self):
+        for codec in ('zlib', 'zstd'):
+            with self.subTest(codec=codec), override_settings(DOCUMENTS_TEXT_CODEC=codec):
+                doc = self._saved(self.LONG_TEXT)
+                self.assertTrue(doc.textCompressed)
+                self.assertEqual(doc.inlineData, self.LONG_TEXT[:SNIPPET_CHARS])
+                self.assertEqual(doc.data, self.LONG_TEXT)
+                # without zstandard installed the zstd setting falls back to zlib
+                expected = codec if codec == 'zlib' or text_store._zstd() is not None else 'zlib'
+                self.assertEqual(DocumentText.objects.get(document=doc).codec, expected)
+
+    def test_short_text_stays_inline(self):
+        doc = self._saved('short text')
+        self.assertFalse(doc.textCompressed)
+        self.assertEqual(doc.data, 'short text')
+        self.assertFalse(DocumentText.objects.filter(document=doc).exists())
+
+    def test_rewriting_short_text_drops_the_compressed_copy(self):
+        doc = self._saved(self.LONG_TEXT)
+        doc.data = 'short text'
+        doc.save(update_fields=['data'])
+        doc = Document.objects.get(id=doc.id)
+        self.assertEqual((doc.textCompressed, doc.data), (False, 'short text'))
+        self.assertFalse(DocumentText.objects.filter(document=doc).exists())
+
+
+class TextEditingTests(TestCase):
+    def setUp(self):
+        self.doc = Document(fileName='notes.txt', status=Document.STATUS_DONE)
+        self.doc.data = 'extracted text'
+        self.doc.save()
+
+    def test_api_ignores_written_text(self):
+        res = self.client.patch(f'/api/documents/{self.doc.id}/', {'data': 'edited'}, content_type='application/json')
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.json()['data'], 'extracted text')
+        self.assertEqual(Document.objects.get(id=self.doc.id).data, 'extracted text')
+
+    @override_settings(DOCUMENTS_TEXT_COMPRESSION=True, DOCUMENTS_TEXT_COMPRESSION_MIN_CHARS=100)
+    def test_admin_shows_full_text_read_only(self):
+        self.doc.data = INVOICE_TEXT * 40 + 'closing words'
+        self.doc.save()
+        user = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'pw')
+        self.client.force_login(user)
+        res = self.client.get(reverse('admin:documents_document_change', args=[self.doc.id]))
+        self.assertEqual(res.status_code, 200)
+        self.assertContains(res, 'closing words')
+        self.assertNotContains(res, 'name="inlineData"')
+
+
+class ByKeywordTests(TestCase):
+    def _doc(self, name, keywords):
+        doc = Document.objects.create(fileName=name, keywords=keywords)
+        index_keywords(doc.id, keywords)
+        return doc
+
+    def test_every_keyword_required_with_facets(self):
+        a = self._doc('a.pdf', ['Tax', 'invoice', 'germany'])
+        b = self._doc('b.pdf', ['tax', 'invoice'])
+        self._doc('c.pdf', ['tax'])
+
+        res = self.client.get('/api/documents/by-keyword/', {'keyword': ['TAX', 'invoice']}).json()
+        self.assertEqual({r['id'] for r in res['results']}, {str(a.id), str(b.id)})
+        self.assertEqual(res['facets'], [{'keyword': 'germany', 'count': 1}])
+
+    def test_validation(self):
+        self.assertEqual(self.client.get('/api/documents/by-keyword/').status_code, 400)
+        self.assertEqual(self.client.get('/api/documents/by-keyword/', {'keyword': 'x', 'facets': 'many'}).status_code, 400)
+
+
+class AdminChangelistTests(TestCase):
+    def setUp(self):
+        cache.clear()  # counts and filter choices are cached
+        user = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'pw')
+        self.client.force_login(user)
+        self.url = reverse('admin:documents_document_changelist')
+
+    def _doc(self, name, text='', keywords=(), language='en'):
+        doc = Document(fileName=name, contentType='application/pdf', language=language, keywords=list(keywords))
+        doc.data = text
+        doc.save()
+        index_document(doc.id, name, text)
+        index_keywords(doc.id, list(keywords))
+        return doc
+
+    def _changelist(self, **params):
+        with CaptureQueriesContext(connection) as ctx:
+            res = self.client.get(self.url, params)
+        self.assertEqual(res.status_code, 200)
+        return res, [q['sql'] for q in ctx.captured_queries]
+
+    def test_query_count_does_not_grow_with_rows(self):
+        for i in range(3):
+            self._doc(f'{i}.pdf', keywords=['tax'])
+        _, first = self._changelist()
+        for i in range(3, 20):
+            self._doc(f'{i}.pdf', keywords=['tax'])
+        cache.clear()
+        res, second = self._changelist()
+        self.assertEqual(len(first), len(second))
+        self.assertEqual(len(res.context['cl'].result_list), 20)
+        # rows load only the listed columns, never the extracted text
+        rows = [sql for sql in second if sql.startswith('SELECT "documents_document"."id"')]
+        self.assertEqual(len(rows), 1, second)
+        self.assertNotIn('"documents_document"."data"', rows[0])
+
+    def test_search_uses_the_indexes(self):
+        invoice = self._doc('invoice.pdf', text=INVOICE_TEXT, keywords=['invoice'])
+        tagged = self._doc('scan.pdf', text='unrelated words', keywords=['germany'])
+        self._doc('other.pdf', text='nothing relevant here')
+
+        def found(term):
+            res, queries = self._changelist(q=term)
+            self.assertFalse([sql for sql in queries if 'LIKE' in sql.upper()])
+            return {doc.id for doc in res.context['cl'].result_list}
+
+        self.assertEqual(found('invoice tax'), {invoice.id})
+        self.assertEqual(found('germany'), {tagged.id})
+        self.assertEqual(found(str(tagged.id)), {tagged.id})
+
+    def test_counts_and_filter_choices_are_cached(self):
+        self._doc('a.pdf', language='en')
+        self._doc('b.pdf', language='de')
+        res, first = self._changelist()
+        self.assertEqual(res.context['cl'].result_count, 2)
+        self.assertTrue([sql for sql in first if 'COUNT(' in sql.upper()])
+        self.assertTrue([sql for sql in first if 'DISTINCT' in sql.upper()])
+
+        self._doc('c.pdf', language='fr')
+        res, second = self._changelist()
+        self.assertFalse([sql for sql in second if 'COUNT(' in sql.upper() or 'DISTINCT' in sql.upper()])
+        # the cached count and choices are served until DOCUMENTS_ADMIN_COUNT_TTL expires
+        self.assertEqual(res.context['cl'].result_count, 2)
+        language_filter = next(f for f in res.context['cl'].filter_specs if f.field_path == 'language')
+        self.assertEqual(sorted(language_filter.lookup_choices), ['de', 'en'])
+
+
+class FuzzyTests(TestCase):
+    def setUp(self):
+        cache.clear()  # corpus size is cached
+
+    def test_typos_and_transpositions(self):
+        add_terms(['tacks', 'invoice'])
+        self.assertIn('tacks', expand_term('tcaks'))
+        self.assertIn('invoice', expand_term('invoise'))
+        self.assertEqual(expand_term('zzzzz'), {'zzzzz': 1.0})
+
+    def test_fuzzy_search(self):
+        doc = Document.objects.create(fileName='invoice.pdf', status=Document.STATUS_DONE)
+        index_document(doc.id, 'invoice.pdf', INVOICE_TEXT)
+
+        exact = self.client.get('/api/documents/search/', {'q': 'invoise'}).json()
+        self.assertEqual(exact['results'], [])
+
+        res = self.client.get('/api/documents/search/', {'q': 'invoise', 'fuzzy': '1'}).json()
+        self.assertEqual([r['id'] for r in res['results']], [str(doc.id)])
+        self.assertIn('invoice', res['terms']['invoise'])
+
+
+def make_text(seed, words=300):
+    """Deterministic prose-like text over a vocabulary that depends on `seed`."""
+    rng = np.random.RandomState(seed)
+    vocab = [f"{stem}{suffix}" for stem in ('tax', 'file', 'note', 'plan', 'road', 'lamp', 'wind', 'gold')
+             for suffix in ('er', 'ing', 'ed', 'ly', 'ion', 'ous', 'ment', 'ness')]
+    return ' '.join(vocab[i] + ('abcdefgh'[seed % 8] * 2) for i in rng.randint(0, len(vocab), size=words))
+
+
+class MinHashTests(TestCase):
+    def setUp(self):
+        self.base = make_text(1)
+        words = self.base.split()
+        words[100] = words[200] = 'changed'
+        self.near = ' '.join(words)
+        self.unrelated = make_text(2)
+
+    def _doc(self, name, text):
+        doc = Document(fileName=name, status=Document.STATUS_DONE)
+        doc.data = text
+        doc.save()
+        return doc
+
+    def test_signature_matches_exact_arithmetic(self):
+        shingles = minhash._shingle_hashes(self.base)
+        sig = minhash.signature(self.base)
+        p = int(minhash._PRIME)
+        for i in (0, 1, minhash.NUM_PERM - 1):
+            a, b = int(minhash._A[i]), int(minhash._B[i])
+            self.assertEqual(int(sig[i]), min((a * (int(x) % p) + b) % p for x in shingles))
+
+    def test_near_identical_texts_share_buckets(self):
+        base, near, unrelated = (minhash.signature(t) for t in (self.base, self.near, self.unrelated))
+        self.assertGreaterEqual((base == near).mean(), 0.8)
+        self.assertTrue(set(minhash.band_buckets(base)) & set(minhash.band_buckets(near)))
+        self.assertLess((base == unrelated).mean(), 0.2)
+        self.assertFalse(set(minhash.band_buckets(base)) & set(minhash.band_buckets(unrelated)))
+        self.assertIsNone(minhash.signature(''))
+
+    def test_near_duplicates_endpoint(self):
+        base, near, unrelated = self._doc('a.pdf', self.base), self._doc('b.pdf', self.near), self._doc('c.pdf', self.unrelated)
+        pending = Document.objects.create(fileName='d.pdf')
+        minhash.store_signatures([(d.id, minhash.signature(d.data)) for d in (base, near, unrelated)])
+
+        res = self.client.get(f'/api/documents/{base.id}/near-duplicates/').json()
+        self.assertTrue(res['indexed'])
+        self.assertEqual([r['id'] for r in res['results']], [str(near.id)])
+        self.assertGreaterEqual(res['results'][0]['similarity'], 0.8)
+
+        self.assertFalse(self.client.get(f'/api/documents/{pending.id}/near-duplicates/').json()['indexed'])
+        url = f'/api/documents/{base.id}/near-duplicates/'
+        self.assertEqual(self.client.get(url, {'threshold': '2'}).status_code, 400)
+
+    def test_find_near_duplicates_command(self):
+        base, near = self._doc('a.pdf', self.base), self._doc('b.pdf', self.near)
+        self._doc('c.pdf', self.unrelated)
+        out = StringIO()
+        call_command('find_near_duplicates', '--index-missing', stdout=out)
+        output = out.getvalue()
+        self.assertIn('Indexed 3 signatures.', output)
+        self.assertIn('Cluster 1 (2 documents):', output)
+        self.assertEqual(minhash.duplicate_clusters()[0], [sorted([base.id, near.id], key=str)])
+
+        out = StringIO()
+        call_command('find_near_duplicates', '--rebuild', stdout=out)
+        self.assertIn('Indexed 3 signatures.', out.getvalue())
+        self.assertIn('Done. 1 clusters, 2 documents.', out.getvalue())
+
+
+class SimilarTests(TestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        index_dir = override_settings(DOCUMENTS_SIMILARITY_DIR=directory)
+        index_dir.enable()
+        self.addCleanup(index_dir.disable)
+        similarity._index = None
+        self.addCleanup(setattr, similarity, '_index', None)
+
+    def _doc(self, name, keywords):
+        doc = Document.objects.create(fileName=name, keywords=keywords)
+        similarity.store_vectors([(doc.id, keywords, None)])
+        return doc
+
+    def _similar(self, doc):
+        return [r['id'] for r in self.client.get(f'/api/documents/{doc.id}/similar/').json()['results']]
+
+    def test_closest_first_and_deleted_documents_dropped(self):
+        base = self._doc('a.pdf', ['tax invoice', 'vat return'])
+        close = self._doc('b.pdf', ['tax invoice', 'vat return', 'receipt'])
+        far = self._doc('c.pdf', ['holiday photos', 'beach'])
+        similarity.write_snapshot()
+
+        self.assertEqual(self._similar(base), [str(close.id), str(far.id)])
+        close.delete()
+        # the index itself masks the removed row, not only the view's database check
+        self.assertEqual([doc_id for doc_id, _ in similarity.get_index().most_similar(base.id, 10)], [far.id])
+        self.assertEqual(self._similar(base), [str(far.id)])
+
+    def test_document_without_keywords_is_not_indexed(self):
+        doc = Document.objects.create(fileName='empty.pdf')
+        res = self.client.get(f'/api/documents/{doc.id}/similar/').json()
+        self.assertEqual((res['indexed'], res['results']), (False, []))
+
+    def test_index_dir_defaults_to_media_root(self):
+        with override_settings(DOCUMENTS_SIMILARITY_DIR=None, MEDIA_ROOT='/srv/media'):
+            self.assertEqual(similarity.index_dir(), os.path.join('/srv/media', 'similarity_index'))
+        with override_settings(DOCUMENTS_SIMILARITY_DIR=None, MEDIA_ROOT=''):
+            with self.assertRaises(ImproperlyConfigured):
+                similarity.index_dir()
+
+    def test_text_indexed_before_vectors_are_stored(self):
+        # vector idf weights are read from the full-text index
+        doc = Document.objects.create(fileName='a.pdf', status=Document.STATUS_RUNNING)
+        fields = {'data': INVOICE_TEXT, 'keywords': ['invoice', 'tax'], 'keyword_scores': {'invoice': 0.1, 'tax': 0.2},
+                  'language': 'en', 'diagnostics': {}, 'minhash': None}
+        calls = []
+        store_vectors = similarity.store_vectors
+
+        def record_store_vectors(items):
+            calls.append(('vectors', DocumentTerm.objects.filter(document_id=doc.id).exists()))
+            return store_vectors(items)
+
+        with mock.patch.object(similarity, 'store_vectors', record_store_vectors):
+            pipeline._save_result(doc, fields)
+        self.assertEqual(calls, [('vectors', True)])
@@ -0,0 +1,110 @@
+# documents/text_store.py
+"""
+Optional compressed storage for extracted text.
+
+With DOCUMENTS_TEXT_COMPRESSION enabled, texts of at least
+DOCUMENTS_TEXT_COMPRESSION_MIN_CHARS characters (default 1024) are written
+compressed to the DocumentText side table instead of the document row. The
+row then keeps only the first SNIPPET_CHARS characters (enough for list
+snippets) and textCompressed=True. Document.data reads the full text
+lazily from either place, so callers do not need to know where it lives.
+
+Codecs: 'zlib' (default, standard library) or 'zstd' when
+DOCUMENTS_TEXT_CODEC = 'zstd' and the optional `zstandard` package is
+installed (falls back to zlib otherwise). The codec is recorded per row, so
+changing the setting never breaks reading older rows.
+"""
+
+import logging
+import zlib
+from typing import Optional, Tuple
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+ZLIB_LEVEL = 6
+ZSTD_LEVEL = 10
+
+
+def compression_enabled() -> bool:
+    return getattr(settings, 'DOCUMENTS_TEXT_COMPRESSION', False)
+
+
+def _zstd():
+    try:
+        import zstandard
+        return zstandard
+    except ImportError:
+        return None
+
+
+def _codec() -> str:
+    codec = getattr(settings, 'DOCUMENTS_TEXT_CODEC', 'zlib')
+    if codec == 'zstd' and _zstd() is None:
+        logger.warning("DOCUMENTS_TEXT_CODEC='zstd' but zstandard is not installed; using zlib")
+        return 'zlib'
+    return 'zstd' if codec == 'zstd' else 'zlib'
+
+
+def compress(text: str) -> Tuple[str, bytes]:
+    """Compress `text` with the configured codec. Returns (codec, blob)."""
+    raw = text.encode('utf-8')
+    codec = _codec()
+    if codec == 'zstd':
+        return codec, _zstd().ZstdCompressor(level=ZSTD_LEVEL).compress(raw)
+    return codec, zlib.compress(raw, ZLIB_LEVEL)
+
+
+def decompress(codec: str, blob: bytes) -> str:
+    blob = bytes(blob)  # some backends return memoryview
+    if codec == 'zstd':
+        zstandard = _zstd()
+        if zstandard is None:
+            raise RuntimeError("Text was stored with zstd; install zstandard to read it")
+        return zstandard.ZstdDecompressor().decompress(blob).decode('utf-8')
+    return zlib.decompress(blob).decode('utf-8')
+
+
+def encode_text(text: str):
+    """
+    Decide where `text` goes. Returns (columns, compressed): the Document column
+    values {'inlineData', 'textCompressed'} and, when the text is compressed,
+    the DocumentText values {'codec', 'body', 'chars'} (else None).
+    """
+    from .models import SNIPPET_CHARS
+
+    text = text or ''
+    min_chars = getattr(settings, 'DOCUMENTS_TEXT_COMPRESSION_MIN_CHARS', 1024)
+    if not compression_enabled() or len(text) < min_chars:
+        return {'inlineData': text, 'textCompressed': False}, None
+    codec, blob = compress(text)
+    return {'inlineData': text[:SNIPPET_CHARS], 'textCompressed': True}, {'codec': codec, 'body': blob, 'chars': len(text)}
+
+
+def save_compressed(doc_id, compressed: Optional[dict]) -> None:
+    """Write (or, for None, remove) the DocumentText row of an existing document."""
+    from .models import DocumentText
+
+    if compressed is None:
+        DocumentText.objects.filter(document_id=doc_id).delete()
+    else:
+        DocumentText.objects.update_or_create(document_id=doc_id, defaults=compressed)
+
+
+def write_text(doc_id, text: str) -> dict:
+    """
+    Store the extracted text of an existing document and return the Document
+    column values to write with it ({'inlineData', 'textCompressed'}); the
+    caller writes those (update, bulk_update).
+    """
+    columns, compressed = encode_text(text)
+    save_compressed(doc_id, compressed)
+    return columns
+
+
+def read_text(entry) -> Optional[str]:
+    """Full text from a DocumentText row, or None when there is none."""
+    if entry is None:
+        return None
+    return decompress(entry.codec, entry.body)
@@ -0,0 +1,155 @@
+# documents/uploads.py
+"""
+Upload handling that keeps memory flat regardless of file size.
+
+HashingFileUploadHandler streams every upload straight to a temporary file
+(no in-memory buffering for small files) and feeds each chunk to SHA-256 as
+it is written, so the content hash is ready when parsing finishes without a
+second pass over the bytes. Saving the resulting TemporaryUploadedFile to
+FileSystemStorage is a rename, not a copy.
+
+iter_archive_uploads() does the same for the members of a zip/tar upload:
+each member is streamed into its own hashed temporary upload file. The bytes
+actually unpacked (not the sizes an archive declares) and the number of
+entries are capped, so a small archive cannot expand into an unbounded amount
+of disk (ArchiveLimitExceeded).
+"""
+
+import hashlib
+import mimetypes
+import os
+import tarfile
+import zipfile
+from typing import Iterator
+
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+
+ARCHIVE_SUFFIXES = ('.zip', '.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tbz2', '.tar.xz', '.txz')
+_COPY_CHUNK_SIZE = 1024 * 1024
+
+
+class HashingFileUploadHandler(TemporaryFileUploadHandler):
+    """Temporary-file upload handler that sets `.sha256` on each completed file."""
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self._hasher = hashlib.sha256()
+
+    def receive_data_chunk(self, raw_data, start):
+        self._hasher.update(raw_data)
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        upload = super().file_complete(file_size)
+        upload.sha256 = self._hasher.hexdigest()
+        return upload
+
+
+def use_hashing_upload_handler(request):
+    """
+    Install HashingFileUploadHandler on a (DRF or Django) request.
+    Must be called before request.FILES / request.data is first accessed.
+    """
+    request.upload_handlers = [HashingFileUploadHandler(request)]
+
+
+def upload_sha256(upload) -> str:
+    """Content hash recorded by HashingFileUploadHandler, or '' when unavailable."""
+    return getattr(upload, 'sha256', '') or ''
+
+
+def is_archive(upload) -> bool:
+    """True for uploads that iter_archive_uploads() can unpack (judged by file name)."""
+    return (upload.name or '').lower().endswith(ARCHIVE_SUFFIXES)
+
+
+class ArchiveLimitExceeded(ValueError):
+    """An archive unpacks to more bytes or entries than the caller allows."""
+
+
+def _hashed_temporary_upload(name: str, stream, max_bytes: int) -> TemporaryUploadedFile:
+    content_type = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+    upload = TemporaryUploadedFile(name, content_type, 0, None)
+    hasher = hashlib.sha256()
+    size = 0
+    for chunk in iter(lambda: stream.read(_COPY_CHUNK_SIZE), b''):
+        size += len(chunk)
+        if size > max_bytes:
+            upload.close()  # removes the temporary file
+            raise ArchiveLimitExceeded(f"{name} unpacks to more than {max_bytes} bytes")
+        hasher.update(chunk)
+        upload.write(chunk)
+    upload.seek(0)
+    upload.size = size
+    upload.sha256 = hasher.hexdigest()
+    return upload
+
+
+def _skip_member(name: str) -> bool:
+    base = os.path.basename(name)
+    # directories, hidden files and macOS resource forks are not documents
+    return not base or base.startswith('.') or '__MACOSX/' in name
+
+
+def iter_archive_uploads(upload, max_files: int, max_bytes: int, max_members: int) -> Iterator[TemporaryUploadedFile]:
+    """
+    Yield every regular file of a zip/tar upload as a TemporaryUploadedFile named
+    after the member's base name, with `.sha256` set like HashingFileUploadHandler.
+    Members are unpacked one at a time. Raises ValueError for archives that
+    cannot be read, or on reaching member number max_files + 1 (files already
+    yielded stay valid). Raises ArchiveLimitExceeded when the yielded files
+    together unpack to more than `max_bytes`, or the archive has more than
+    `max_members` entries of any kind.
+    """
+    source = upload.temporary_file_path() if hasattr(upload, 'temporary_file_path') else upload
+    count = 0
+    entries = 0
+    remaining = max_bytes
+
+    def check_entries():
+        nonlocal entries
+        entries += 1
+        if entries > max_members:
+            raise ArchiveLimitExceeded(f"Archive {upload.name} has more than {max_members} entries")
+
+    def unpack(name, stream, declared_size=None):
+        nonlocal remaining
+        too_big = ArchiveLimitExceeded(f"Archive {upload.name} unpacks to more than {max_bytes} bytes")
+        if declared_size is not None and declared_size > remaining:
+            raise too_big
+        try:
+            unpacked = _hashed_temporary_upload(os.path.basename(name), stream, remaining)
+        except ArchiveLimitExceeded:
+            raise too_big from None
+        remaining -= unpacked.size
+        return unpacked
+
+    try:
+        if upload.name.lower().endswith('.zip'):
+            with zipfile.ZipFile(source) as archive:
+                for info in archive.infolist():
+                    check_entries()
+                    if info.is_dir() or _skip_member(info.filename):
+                        continue
+                    if count >= max_files:
+                        raise ValueError(f"Archive {upload.name} holds more than {max_files} files")
+                    # the declared size fails fast; the bytes actually read are what is enforced
+                    with archive.open(info) as member:
+                        unpacked = unpack(info.filename, member, info.file_size)
+                    yield unpacked
+                    count += 1
+        else:
+            tar_args = {'name': source} if isinstance(source, str) else {'fileobj': source}
+            # streaming mode: members are read in order without seeking back
+            with tarfile.open(mode='r|*', **tar_args) as archive:
+                for info in archive:
+                    check_entries()
+                    if not info.isfile() or _skip_member(info.name):
+                        continue
+                    if count >= max_files:
+                        raise ValueError(f"Archive {upload.name} holds more than {max_files} files")
+                    yield unpack(info.name, archive.extractfile(info), info.size)
+                    count += 1
+    except (zipfile.BadZipFile, tarfile.TarError, EOFError) as exc:
+        raise ValueError(f"Cannot read archive {upload.name}: {exc}") from exc
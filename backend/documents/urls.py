@@ -6,16 +6,20 @@ This registers DocumentViewSet and automatically exposes:
   - /api/documents/          (list, create)
   - /api/documents/{id}/     (retrieve, update, partial_update, destroy)
   - /api/documents/search/   (custom action defined with @action(detail=False))
+plus /api/metrics/ (pipeline metrics for a local Prometheus scraper).
 """
 
+from django.urls import path
 from rest_framework.routers import DefaultRouter
-from .views import DocumentViewSet
+from .views import DocumentViewSet, metrics_view
 
 router = DefaultRouter()
 # registers endpoints for the viewset under the 'documents' prefix
 router.register(r'documents', DocumentViewSet, basename='documents')
 
 # router.urls is a list of URL patterns generated by DRF
-urlpatterns = router.urls
+urlpatterns = router.urls + [
+    path('metrics/', metrics_view, name='metrics'),
+]
 
 
@@ -1,107 +1,416 @@
 # documents/utils/extractors.py
 """
 Unified extractor for:
- - selectable PDFs (uses PyPDF2 to extract text)
+ - selectable PDFs (uses PyPDF2 to extract text; large PDFs are split across a process pool)
+ - scanned PDFs: pages without selectable text are rasterized (pdf2image) and OCR'd in parallel
  - image files (JPG/PNG/TIFF/etc) using pytesseract OCR (Pillow)
+
+The streaming entrypoints accept an optional `diagnostics` dict that is filled
+with what the extraction did: `extractor` ('pdf_text', 'pdf_text+ocr',
+'image_ocr'), `pdf_parallel`, `ocr_pages` ([{page, confidence, used}]) and
+`ocr_confidence` (mean Tesseract word confidence, 0-100).
 """
 import os
 import re
-import traceback
-from typing import Optional
+import shutil
+import logging
+import threading
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import lru_cache
+from typing import Iterator, List, Optional, Tuple
 import io
 
-#Extract text from a PDF using PyPDF2. --> Returns empty string on errors or when no text is found.
-def _try_pdf_text(file_path: Optional[str], file_bytes: Optional[bytes]) -> str:
+logger = logging.getLogger(__name__)
+
+# Page-parallel PDF extraction: documents with fewer pages than this stay on the serial
+# loop (process start-up and per-worker PDF parsing cost more than they save).
+PDF_PARALLEL_MIN_PAGES = 64
+# default worker count for the page pool
+PDF_PARALLEL_WORKERS = os.cpu_count() or 1
+
+# OCR fallback for scanned PDFs: pages whose selectable text is shorter than this are
+# rasterized (pdf2image, needs Poppler) at PDF_OCR_DPI and OCR'd on a process pool of their own.
+PDF_OCR_MIN_CHARS = 16
+PDF_OCR_DPI = 300
+# the first pages needing OCR run in this process; the pool is only started from this many on
+PDF_OCR_PARALLEL_MIN_PAGES = 3
+
+# worker count -> process pool; see _get_page_pool / _get_ocr_pool
+_page_pools = {}
+_ocr_pools = {}
+_page_pool_lock = threading.Lock()
+
+
+def _extract_pages(reader, start: int, stop: int) -> List[str]:
+    """Text of pages [start, stop) of an open PdfReader; '' for pages that fail."""
+    texts = []
+    for i in range(start, stop):
+        try:
+            t = reader.pages[i].extract_text() or ''
+        except Exception:
+            t = ''
+        texts.append(t)
+    return texts
+
+
+#Process-pool task: each worker opens the PDF itself and extracts one contiguous page range.
+def _pdf_page_range_worker(file_path: str, start: int, stop: int) -> List[str]:
+    from PyPDF2 import PdfReader
+    with open(file_path, 'rb') as f:
+        return _extract_pages(PdfReader(f), start, stop)
+
+
+def _pool_from(pools: dict, workers: int) -> ProcessPoolExecutor:
+    with _page_pool_lock:
+        pool = pools.get(workers)
+        if pool is None:
+            # spawn: the pool is created from threaded web/worker processes, where fork is unsafe
+            pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+            pools[workers] = pool
+        return pool
+
+
+def _get_page_pool(workers: int) -> ProcessPoolExecutor:
+    """
+    Shared process pool for page extraction with `workers` processes. Callers asking
+    for different counts (pipeline, backfill --workers, debug re-extract) get separate
+    pools: a live pool may be in use by another thread, so it is never shut down here.
+    """
+    return _pool_from(_page_pools, workers)
+
+
+def _get_ocr_pool(workers: int) -> ProcessPoolExecutor:
+    """
+    Shared process pool for page OCR, like _get_page_pool. Kept apart from the page
+    pool: pool.map() queues every page range up front, so OCR jobs submitted behind
+    them would only start once text extraction had drained.
+    """
+    return _pool_from(_ocr_pools, workers)
+
+
+def _discard_page_pool(pool: ProcessPoolExecutor) -> None:
+    """Forget a broken pool (page or OCR) so the next call starts a fresh one."""
+    with _page_pool_lock:
+        for pools in (_page_pools, _ocr_pools):
+            for workers, live in list(pools.items()):
+                if live is pool:
+                    del pools[workers]
+
+
+def _split_page_ranges(num_pages: int, parts: int) -> List[Tuple[int, int]]:
+    """Split [0, num_pages) into `parts` contiguous, near-equal ranges."""
+    parts = max(1, min(parts, num_pages))
+    size, extra = divmod(num_pages, parts)
+    ranges, start = [], 0
+    for i in range(parts):
+        stop = start + size + (1 if i < extra else 0)
+        ranges.append((start, stop))
+        start = stop
+    return ranges
+
+
+def _pdf_pages_parallel(file_path: str, num_pages: int, workers: int) -> Iterator[str]:
+    """Yield page texts in order while later ranges are still being extracted by the pool."""
+    # two ranges per worker keeps cores busy when some pages are much heavier than others
+    ranges = _split_page_ranges(num_pages, workers * 2)
+    pool = _get_page_pool(workers)
+    starts, stops = zip(*ranges)
+    try:
+        # map() yields range results in submission order, so pages stay in document order
+        for chunk in pool.map(_pdf_page_range_worker, [file_path] * len(ranges), starts, stops):
+            yield from chunk
+    except BrokenProcessPool:
+        _discard_page_pool(pool)
+        raise
+
+
+#Process-pool task: rasterize one PDF page (1-based page_number) and OCR it. Returns (text, confidence).
+def _ocr_pdf_page_worker(file_path: str, page_number: int, dpi: int) -> Tuple[str, Optional[float]]:
+    from pdf2image import convert_from_path
+    images = convert_from_path(file_path, dpi=dpi, first_page=page_number, last_page=page_number)
+    if not images:
+        return '', None
+    return _ocr_image(images[0])
+
+
+@lru_cache(maxsize=None)
+def _tesseract_available() -> bool:
+    """pytesseract is installed and can run the tesseract binary (checked once per process)."""
+    try:
+        import pytesseract
+        pytesseract.get_tesseract_version()
+        return True
+    except Exception:
+        return False
+
+
+@lru_cache(maxsize=None)
+def _ocr_available() -> bool:
+    """PDF page OCR works: pdf2image with Poppler's pdftoppm, plus Tesseract (checked once per process)."""
+    try:
+        import pdf2image  # noqa: F401
+    except Exception:
+        return False
+    return shutil.which('pdftoppm') is not None and _tesseract_available()
+
+
+def _with_ocr_fallback(file_path: str, page_texts: Iterator[str], dpi: int, workers: int,
+                       min_chars: int, diagnostics: Optional[dict] = None) -> Iterator[str]:
+    """
+    Pass page texts through, replacing pages without (enough) selectable text by OCR
+    output. From the PDF_OCR_PARALLEL_MIN_PAGES-th such page on, OCR jobs run on the
+    OCR process pool while text extraction continues; pages are still yielded strictly in order.
+    """
+    pool = None
+    ocr_jobs = 0
+    pending = deque()  # (page_number, selectable_text, job) per page, in page order
+    ocr_pages = []
+
+    def ready(job):
+        # a job is a Future on the pool, or a callable run here when its page comes up
+        return job is None or callable(job) or job.done()
+
+    def resolve(item):
+        page_number, text, job = item
+        if job is None:
+            return text
+        try:
+            ocr_text, confidence = job() if callable(job) else job.result()
+        except Exception:
+            logger.exception("OCR failed for page %d of %s", page_number, file_path)
+            return text
+        # keep whichever is longer: a stray page number should not hide real OCR text and vice versa
+        used = len((ocr_text or '').strip()) > len(text.strip())
+        ocr_pages.append({'page': page_number, 'confidence': confidence, 'used': used})
+        return ocr_text if used else text
+
+    for page_number, text in enumerate(page_texts, start=1):
+        if len(text.strip()) >= min_chars:
+            pending.append((page_number, text, None))
+        else:
+            ocr_jobs += 1
+            # one or two scanned pages are not worth starting worker processes for
+            if pool is None and workers > 1 and ocr_jobs >= PDF_OCR_PARALLEL_MIN_PAGES:
+                pool = _get_ocr_pool(workers)
+            if pool is not None:
+                pending.append((page_number, text, pool.submit(_ocr_pdf_page_worker, file_path, page_number, dpi)))
+            else:
+                pending.append((page_number, text, lambda n=page_number: _ocr_pdf_page_worker(file_path, n, dpi)))
+        # hand out every finished page at the front without waiting on later ones
+        while pending and ready(pending[0][2]):
+            yield resolve(pending.popleft())
+    while pending:
+        yield resolve(pending.popleft())
+
+    if diagnostics is not None and ocr_pages:
+        diagnostics['ocr_pages'] = ocr_pages
+        confidences = [p['confidence'] for p in ocr_pages if p['used'] and p['confidence'] is not None]
+        if any(p['used'] for p in ocr_pages):
+            diagnostics['extractor'] = 'pdf_text+ocr'
+        if confidences:
+            diagnostics['ocr_confidence'] = round(sum(confidences) / len(confidences), 1)
+
+
+#Yield the text of every PDF page in order ('' for pages without selectable text).
+#Large PDFs on disk are split across a process pool (see PDF_PARALLEL_MIN_PAGES / PDF_PARALLEL_WORKERS);
+#pages are yielded as soon as their range is done, so consumers can work while later pages are extracted.
+#With ocr_fallback, pages without selectable text are OCR'd in parallel (see _with_ocr_fallback).
+def iter_pdf_page_texts(file_path: Optional[str], file_bytes: Optional[bytes],
+                        workers: Optional[int] = None, parallel_min_pages: Optional[int] = None,
+                        ocr_fallback: bool = True, ocr_dpi: Optional[int] = None,
+                        ocr_min_chars: Optional[int] = None, diagnostics: Optional[dict] = None) -> Iterator[str]:
+    workers = PDF_PARALLEL_WORKERS if workers is None else workers
+    if diagnostics is not None:
+        diagnostics['extractor'] = 'pdf_text'
+    pages = _iter_pdf_selectable_texts(file_path, file_bytes, workers, parallel_min_pages, diagnostics)
+    # OCR workers rasterize from the stored file, so the fallback needs a path
+    if ocr_fallback and file_path and os.path.exists(file_path) and _ocr_available():
+        pages = _with_ocr_fallback(file_path, pages,
+                                   dpi=PDF_OCR_DPI if ocr_dpi is None else ocr_dpi,
+                                   workers=workers,
+                                   min_chars=PDF_OCR_MIN_CHARS if ocr_min_chars is None else ocr_min_chars,
+                                   diagnostics=diagnostics)
+    yield from pages
+
+
+def _iter_pdf_selectable_texts(file_path: Optional[str], file_bytes: Optional[bytes],
+                               workers: int, parallel_min_pages: Optional[int],
+                               diagnostics: Optional[dict] = None) -> Iterator[str]:
     try:
         from PyPDF2 import PdfReader
     except Exception:
-        return ''  # PyPDF2 not available
+        return  # PyPDF2 not available
+
+    parallel_min_pages = PDF_PARALLEL_MIN_PAGES if parallel_min_pages is None else parallel_min_pages
 
     try:
-        reader = None
-        if file_bytes:
-            stream = io.BytesIO(file_bytes)
-            reader = PdfReader(stream)
-        elif file_path:
+        # prefer the stored file: pool workers can only share a path, not our bytes
+        if file_path and os.path.exists(file_path):
             with open(file_path, 'rb') as f:
                 reader = PdfReader(f)
-        else:
-            return ''
-
-        text_parts = []
-        for page in reader.pages:
-            try:
-                t = page.extract_text() or ''
-            except Exception:
-                t = ''
-            if t:
-                text_parts.append(t)
-        return "\n".join(text_parts)
+                num_pages = len(reader.pages)
+                done = 0
+                if workers > 1 and num_pages >= parallel_min_pages:
+                    if diagnostics is not None:
+                        diagnostics['pdf_parallel'] = True
+                    try:
+                        for t in _pdf_pages_parallel(file_path, num_pages, workers):
+                            done += 1
+                            yield t
+                    except Exception:
+                        # broken pool etc. -> serial for the remaining pages
+                        logger.exception("Parallel page extraction failed for %s", file_path)
+                for i in range(done, num_pages):
+                    yield _extract_pages(reader, i, i + 1)[0]
+        elif file_bytes:
+            reader = PdfReader(io.BytesIO(file_bytes))
+            for i in range(len(reader.pages)):
+                yield _extract_pages(reader, i, i + 1)[0]
     except Exception:
-        return ''
+        return
 
 
-#OCR an image from bytes using pytesseract + Pillow. --> If `lang` provided and tesseract has the language data installed, pass it to pytesseract.
-def _image_bytes_to_text_pytesseract(img_bytes: bytes, lang: Optional[str] = None) -> str:
+#Extract text from a PDF using PyPDF2. --> Returns empty string on errors or when no text is found.
+def _try_pdf_text(file_path: Optional[str], file_bytes: Optional[bytes],
+                  workers: Optional[int] = None, parallel_min_pages: Optional[int] = None) -> str:
+    return "\n".join(t for t in iter_pdf_page_texts(file_path, file_bytes, workers, parallel_min_pages) if t)
+
+
+#OCR an image (file path or file-like object) using pytesseract + Pillow. Pillow decodes lazily from disk,
+#so the encoded file is never held in memory as a whole. --> If `lang` provided and tesseract has the language data installed, pass it to pytesseract.
+def _image_to_text_pytesseract(source, lang: Optional[str] = None) -> str:
+    return _ocr_image_source(source, lang=lang)[0]
+
+
+#Like _image_to_text_pytesseract, also returning the mean word confidence (or None).
+def _ocr_image_source(source, lang: Optional[str] = None) -> Tuple[str, Optional[float]]:
     try:
         from PIL import Image
-        import pytesseract
     except Exception:
-        return ''
+        return '', None
+    if not _tesseract_available():
+        return '', None
 
     try:
-        img = Image.open(io.BytesIO(img_bytes)).convert('RGB')
+        with Image.open(source) as im:
+            img = im.convert('RGB')
     except Exception:
-        return ''
+        return '', None
 
-    try:
-        if lang:
-            return pytesseract.image_to_string(img, lang=lang)
-        return pytesseract.image_to_string(img)
+    return _ocr_image(img, lang=lang)
 
+
+#OCR an already decoded PIL image (e.g. a rasterized PDF page).
+def _image_to_text_pytesseract_image(img, lang: Optional[str] = None) -> str:
+    return _ocr_image(img, lang=lang)[0]
+
+
+#OCR a PIL image -> (text, mean word confidence 0-100 or None). A single Tesseract run
+#produces both the plain text and the TSV word table the confidence is read from.
+def _ocr_image(img, lang: Optional[str] = None) -> Tuple[str, Optional[float]]:
+    try:
+        import pytesseract
     except Exception:
-        traceback.print_exc()
-        return ''
+        return '', None
+    try:
+        img = img.convert('RGB')
+        text, tsv = pytesseract.run_and_get_multiple_output(img, extensions=['txt', 'tsv'], lang=lang)
+        return text, _mean_word_confidence(tsv)
+    except Exception:
+        logger.exception("Tesseract OCR failed")
+        return '', None
+
+
+#Mean `conf` over the word rows of Tesseract TSV output (rows with text; -1 marks non-word rows).
+def _mean_word_confidence(tsv: str) -> Optional[float]:
+    confidences = []
+    for line in tsv.splitlines()[1:]:
+        cols = line.split('\t')
+        if len(cols) < 12 or not cols[11].strip():
+            continue
+        try:
+            conf = float(cols[10])
+        except ValueError:
+            continue
+        if conf >= 0:
+            confidences.append(conf)
+    return round(sum(confidences) / len(confidences), 1) if confidences else None
+
+
+#OCR an image from bytes (kept for callers that only have the bytes).
+def _image_bytes_to_text_pytesseract(img_bytes: bytes, lang: Optional[str] = None) -> str:
+    return _image_to_text_pytesseract(io.BytesIO(img_bytes), lang=lang)
+
+
+def iter_text_from_file(file_path: Optional[str] = None,
+                        file_bytes: Optional[bytes] = None,
+                        content_type: Optional[str] = None,
+                        use_ocr_for_images: bool = True,
+                        pdf_workers: Optional[int] = None,
+                        pdf_parallel_min_pages: Optional[int] = None,
+                        pdf_ocr_fallback: bool = True,
+                        pdf_ocr_dpi: Optional[int] = None,
+                        diagnostics: Optional[dict] = None) -> Iterator[str]:
+    """
+    Streaming form of extract_text_from_file(): yields text piece by piece
+    (one item per PDF page, a single item for OCR'd images). Items may be ''.
+    `diagnostics`, if given, is filled in as described in the module docstring.
+    """
+    ct = (content_type or '').lower()
+    path_lower = (file_path or '').lower()
+
+    is_pdf = ct.endswith('pdf') or path_lower.endswith('.pdf')
+    is_image = ct.startswith('image/') or any(path_lower.endswith(ext) for ext in ['.png', '.jpg', '.jpeg', '.tiff', '.bmp', '.gif'])
+
+    if is_image and not is_pdf and use_ocr_for_images:
+        # Prefer the stored file: Pillow reads it from disk on demand
+        source = None
+        if file_path and os.path.exists(file_path):
+            source = file_path
+        elif file_bytes:
+            source = io.BytesIO(file_bytes)
+        if source is not None:
+            text, confidence = _ocr_image_source(source)
+            if diagnostics is not None:
+                diagnostics['extractor'] = 'image_ocr'
+                diagnostics['ocr_confidence'] = confidence
+            yield text
+            return
+
+    # PDFs: fast selectable-text extraction. Anything else: PDF extraction as a last resort.
+    yield from iter_pdf_page_texts(file_path, file_bytes, workers=pdf_workers, parallel_min_pages=pdf_parallel_min_pages,
+                                   ocr_fallback=pdf_ocr_fallback, ocr_dpi=pdf_ocr_dpi, diagnostics=diagnostics)
 
 
 def extract_text_from_file(file_path: Optional[str] = None,
                            file_bytes: Optional[bytes] = None,
                            content_type: Optional[str] = None,
-                           use_ocr_for_images: bool = True) -> str:
+                           use_ocr_for_images: bool = True,
+                           pdf_workers: Optional[int] = None,
+                           pdf_parallel_min_pages: Optional[int] = None,
+                           pdf_ocr_fallback: bool = True,
+                           pdf_ocr_dpi: Optional[int] = None) -> str:
     """
-    Unified extractor entrypoint used by views:
-    - If file is a PDF, attempt PyPDF2 extraction.
+    Unified extractor entrypoint used by views.
+    Pass `file_path` whenever the file is on disk: extraction then streams from
+    the stored file; `file_bytes` is only a fallback for non-filesystem storage.
+    - If file is a PDF, attempt PyPDF2 extraction (page-parallel for large PDFs,
+      tuned by pdf_workers / pdf_parallel_min_pages). Pages without selectable
+      text are rasterized at pdf_ocr_dpi and OCR'd unless pdf_ocr_fallback is False.
     - If file is an image, use pytesseract OCR on the image bytes.
     - If unknown, try PDF text extraction as a last resort.
     Returns '' if no text could be extracted.
     """
-    ct = (content_type or '').lower()
-    path_lower = (file_path or '').lower()
-
-    is_pdf = ct.endswith('pdf') or path_lower.endswith('.pdf')
-    is_image = ct.startswith('image/') or any(path_lower.endswith(ext) for ext in ['.png', '.jpg', '.jpeg', '.tiff', '.bmp', '.gif'])
+    parts = iter_text_from_file(file_path=file_path, file_bytes=file_bytes, content_type=content_type,
+                                use_ocr_for_images=use_ocr_for_images, pdf_workers=pdf_workers,
+                                pdf_parallel_min_pages=pdf_parallel_min_pages,
+                                pdf_ocr_fallback=pdf_ocr_fallback, pdf_ocr_dpi=pdf_ocr_dpi)
+    return "\n".join(t for t in parts if t)
 
-    if is_pdf:
-        # Try fast selectable-text extraction
-        text = _try_pdf_text(file_path=file_path, file_bytes=file_bytes)
-        return text or ''
 
-    if is_image and use_ocr_for_images:
-        # Prefer bytes if available (upload flow reads them)
-        if file_bytes:
-            return _image_bytes_to_text_pytesseract(file_bytes)
-        if file_path:
-            try:
-                with open(file_path, 'rb') as f:
-                    bytes_ = f.read()
-                return _image_bytes_to_text_pytesseract(bytes_)
-            except Exception:
-                traceback.print_exc()
-                return ''
-
-    # Last resort: try PDF text extraction
-    text = _try_pdf_text(file_path=file_path, file_bytes=file_bytes)
-    return text or ''
 def _extract_title_from_pdf_metadata(file_path: Optional[str], file_bytes: Optional[bytes]) -> str:
     """
     Try to read PDF Title metadata via PyPDF2. Returns '' when not found.
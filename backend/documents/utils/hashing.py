@@ -0,0 +1,17 @@
+# documents/utils/hashing.py
+"""
+Streaming content hashes for stored files (never reads a whole file into memory).
+"""
+import hashlib
+
+# 1 MiB reads: large enough to keep syscalls cheap, small enough to bound memory
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def sha256_of_file(file_path: str, chunk_size: int = HASH_CHUNK_SIZE) -> str:
+    """Hex SHA-256 of the file at `file_path`, read in fixed-size chunks."""
+    h = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            h.update(chunk)
+    return h.hexdigest()
@@ -3,8 +3,12 @@
 Wrapper around YAKE and langdetect.
 """
 
-from typing import List, Tuple, Optional
-from langdetect import detect, DetectorFactory
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Iterable, List, Tuple, Optional
+from langdetect import detect_langs, DetectorFactory
 
 # Make langdetect deterministic for reproducible results
 DetectorFactory.seed = 0
@@ -12,13 +16,97 @@ DetectorFactory.seed = 0
 # YAKE supports many languages--> we default to english if detection is uncertain
 DEFAULT_LANG = 'en'
 
+# Pool of ready-made YAKE extractors keyed by (lan, n, top). Building one loads the
+# stopword list from disk, so we reuse them. An instance keeps per-call caches and is
+# not safe to share between threads: callers check one out exclusively.
+MAX_EXTRACTOR_KEYS = 16        # distinct (lan, n, top) combinations kept
+MAX_IDLE_PER_KEY = 4           # idle instances kept per combination
+_extractor_pool = OrderedDict()  # key -> list of idle extractors, least recently used first
+_extractor_pool_lock = threading.Lock()
 
-#Use langdetect to guess the language. Returns None on error.
-def detect_language(text: str) -> Optional[str]:
+
+@contextmanager
+def _keyword_extractor(lan: str, n: int, top: int):
+    """Check out a yake.KeywordExtractor for (lan, n, top), returning it to the pool afterwards."""
+    import yake
+
+    key = (lan, n, top)
+    extractor = None
+    with _extractor_pool_lock:
+        idle = _extractor_pool.get(key)
+        if idle:
+            extractor = idle.pop()
+            _extractor_pool.move_to_end(key)
+    if extractor is None:
+        extractor = yake.KeywordExtractor(lan=lan, n=n, top=top)
     try:
-        return detect(text)
-    except Exception:
+        yield extractor
+    finally:
+        with _extractor_pool_lock:
+            idle = _extractor_pool.setdefault(key, [])
+            _extractor_pool.move_to_end(key)
+            if len(idle) < MAX_IDLE_PER_KEY:
+                idle.append(extractor)
+            while len(_extractor_pool) > MAX_EXTRACTOR_KEYS:
+                _extractor_pool.popitem(last=False)
+
+
+def _clean(raw) -> List[Tuple[str, float]]:
+    # Lowercase and strip keywords for consistency
+    return [(kw.strip().lower(), float(score)) for kw, score in raw if kw and kw.strip()]
+
+
+# Language detection only looks at a bounded sample: langdetect normalizes and scans
+# everything it is given, which is wasted work on multi-megabyte documents.
+LANG_SAMPLE_CHARS = 6000      # total characters inspected at most
+LANG_SAMPLE_REGIONS = 3       # windows spread evenly over the text
+LANG_MIN_CONFIDENCE = 0.9     # stop sampling once the leading language is this likely...
+LANG_MIN_WINDOWS = 2          # ...over at least this many windows (one region, e.g. a foreign abstract, never decides alone)
+
+
+def _sample_regions(text: str, sample_chars: int, regions: int) -> List[str]:
+    """`regions` windows of ~sample_chars/regions chars, spread evenly over `text`."""
+    if len(text) <= sample_chars or regions <= 1:
+        return [text[:sample_chars]]
+    size = sample_chars // regions
+    step = (len(text) - size) / (regions - 1)
+    windows = []
+    for i in range(regions):
+        start = int(i * step)
+        # start on a word boundary so the window doesn't begin with a partial word
+        space = text.find(' ', start, start + 64)
+        if space != -1:
+            start = space + 1
+        windows.append(text[start:start + size])
+    return windows
+
+
+#Use langdetect to guess the language from a bounded sample of the text. Returns None on error.
+def detect_language(text: str, sample_chars: int = LANG_SAMPLE_CHARS, regions: int = LANG_SAMPLE_REGIONS,
+                    min_confidence: float = LANG_MIN_CONFIDENCE) -> Optional[str]:
+    """
+    Windows are examined in order and their probabilities averaged; detection
+    stops early once LANG_MIN_WINDOWS windows have been examined and the
+    leading language reaches `min_confidence`.
+    """
+    if not text:
+        return None
+    totals = {}
+    examined = 0
+    for window in _sample_regions(text, sample_chars, regions):
+        try:
+            candidates = detect_langs(window)
+        except Exception:
+            continue  # window without usable features (digits, symbols)
+        examined += 1
+        for c in candidates:
+            totals[c.lang] = totals.get(c.lang, 0.0) + c.prob
+        lang, total = max(totals.items(), key=lambda kv: kv[1])
+        if examined >= LANG_MIN_WINDOWS and total / examined >= min_confidence:
+            return lang
+    if not totals:
         return None
+    return max(totals.items(), key=lambda kv: kv[1])[0]
 
 
 def extract_keywords_with_scores(text: str, max_ngram: int = 3, top_k: int = 40, lang_hint: Optional[str] = None) -> List[Tuple[str, float]]:
@@ -34,18 +122,180 @@ def extract_keywords_with_scores(text: str, max_ngram: int = 3, top_k: int = 40,
         return []
 
     try:
-        import yake
+        import yake  # noqa: F401
     except Exception:
         return []
 
     lang = lang_hint or detect_language(text) or DEFAULT_LANG
 
     try:
-        # Create a YAKE extractor with chosen language and n-gram size
-        kw_extractor = yake.KeywordExtractor(lan=lang, n=max_ngram, top=top_k)
-        raw = kw_extractor.extract_keywords(text)  # list of (kw, score)
-        # Lowercase and strip keywords for consistency
-        cleaned = [(kw.strip().lower(), float(score)) for kw, score in raw if kw and kw.strip()]
-        return cleaned
+        # Reuse a pooled YAKE extractor for this language and n-gram size
+        with _keyword_extractor(lang, max_ngram, top_k) as kw_extractor:
+            raw = kw_extractor.extract_keywords(text)  # list of (kw, score)
+        return _clean(raw)
     except Exception:
         return []
+
+
+def extract_keywords_batch(texts: Iterable[str], max_ngram: int = 3, top_k: int = 40,
+                           lang_hints: Optional[Iterable[Optional[str]]] = None) -> List[List[Tuple[str, float]]]:
+    """
+    extract_keywords_with_scores() for many texts at once.
+    Texts are grouped by language so each group runs on a single checked-out
+    extractor. `lang_hints` (same length as `texts`) skips detection where given.
+    Returns one keyword list per input text, in input order.
+    """
+    texts = list(texts)
+    hints = list(lang_hints) if lang_hints is not None else [None] * len(texts)
+    results: List[List[Tuple[str, float]]] = [[] for _ in texts]
+
+    try:
+        import yake  # noqa: F401
+    except Exception:
+        return results
+
+    by_lang = {}
+    for i, text in enumerate(texts):
+        if text:
+            lang = hints[i] or detect_language(text) or DEFAULT_LANG
+            by_lang.setdefault(lang, []).append(i)
+
+    for lang, indexes in by_lang.items():
+        with _keyword_extractor(lang, max_ngram, top_k) as kw_extractor:
+            for i in indexes:
+                try:
+                    results[i] = _clean(kw_extractor.extract_keywords(texts[i]))
+                except Exception:
+                    results[i] = []
+    return results
+
+
+# Streaming mode: text is cut into segments of about this many characters, so YAKE's
+# co-occurrence structures never cover more than one segment at a time.
+KEYWORD_SEGMENT_CHARS = 100_000
+
+
+class KeywordStream:
+    """
+    Incremental YAKE keyword extraction for very large documents.
+
+    Feed text in pieces (e.g. PDF pages straight from the extractor) with feed();
+    pieces are buffered into segments of ~segment_chars and YAKE runs on each full
+    segment, so peak memory is bounded by one segment. close() returns the global
+    top_k list.
+
+    Merge rule (YAKE scores: lower = more relevant). A candidate that appears in
+    m segments with per-segment scores s_1..s_m gets
+
+        merged = min(s_1..s_m) / m
+
+    i.e. its best local score, boosted by how many segments it recurs in. A
+    document that fits in one segment therefore gets exactly YAKE's one-shot
+    scores. Each segment contributes its best `candidates_per_segment`
+    candidates, and between segments only the best `max_candidates` merged
+    entries are kept.
+
+    Without lang_hint the language is detected on every segment (each time on a
+    bounded, spread-out sample, see detect_language) and the segments vote,
+    weighted by their length: `.language` is the current leader, used for the
+    next segment's stopwords, and None while no segment could be detected.
+    The time detection took is `.language_seconds`.
+    """
+
+    def __init__(self, max_ngram: int = 3, top_k: int = 40, lang_hint: Optional[str] = None,
+                 segment_chars: int = KEYWORD_SEGMENT_CHARS, candidates_per_segment: Optional[int] = None,
+                 max_candidates: Optional[int] = None):
+        self.max_ngram = max_ngram
+        self.top_k = top_k
+        self.language = lang_hint
+        self._detect = not lang_hint
+        self._lang_votes = {}  # language -> characters of the segments detected as it
+        self.language_seconds = 0.0
+        self.segment_chars = segment_chars
+        self.candidates_per_segment = candidates_per_segment or top_k * 2
+        self.max_candidates = max_candidates or top_k * 20
+        self._buffer: List[str] = []
+        self._buffered = 0
+        self._merged = {}  # keyword -> [best_score, segments_seen]
+
+    def feed(self, text: str) -> None:
+        if not text:
+            return
+        self._buffer.append(text)
+        self._buffered += len(text)
+        if self._buffered >= self.segment_chars:
+            self._flush()
+
+    def close(self) -> List[Tuple[str, float]]:
+        self._flush()
+        # stable sort: ties keep first-seen order, matching YAKE's own ranking
+        ranked = sorted(((kw, best / seen) for kw, (best, seen) in self._merged.items()), key=lambda x: x[1])
+        return ranked[:self.top_k]
+
+    def _flush(self) -> None:
+        if not self._buffer:
+            return
+        segment = "\n".join(self._buffer)
+        self._buffer = []
+        self._buffered = 0
+
+        if self._detect:
+            started = time.perf_counter()
+            lang = detect_language(segment)
+            if lang:
+                self._lang_votes[lang] = self._lang_votes.get(lang, 0) + len(segment)
+                self.language = max(self._lang_votes, key=self._lang_votes.get)
+            self.language_seconds += time.perf_counter() - started
+
+        candidates = extract_keywords_with_scores(segment, max_ngram=self.max_ngram,
+                                                  top_k=self.candidates_per_segment,
+                                                  lang_hint=self.language or DEFAULT_LANG)
+        seen_here = set()
+        for kw, score in candidates:
+            if kw in seen_here:
+                continue
+            seen_here.add(kw)
+            entry = self._merged.get(kw)
+            if entry is None:
+                self._merged[kw] = [score, 1]
+            else:
+                entry[0] = min(entry[0], score)
+                entry[1] += 1
+
+        if len(self._merged) > self.max_candidates:
+            keep = sorted(self._merged.items(), key=lambda item: item[1][0] / item[1][1])[:self.max_candidates]
+            self._merged = dict(keep)
+
+
+def extract_keywords_streaming(chunks: Iterable[str], max_ngram: int = 3, top_k: int = 40,
+                               lang_hint: Optional[str] = None,
+                               segment_chars: int = KEYWORD_SEGMENT_CHARS) -> List[Tuple[str, float]]:
+    """Run a KeywordStream over `chunks` and return the merged top_k (keyword, score) list."""
+    stream = KeywordStream(max_ngram=max_ngram, top_k=top_k, lang_hint=lang_hint, segment_chars=segment_chars)
+    for chunk in chunks:
+        stream.feed(chunk)
+    return stream.close()
+
+
+# small epsilon to prevent division by zero when converting scores to weights
+_STATS_EPS = 1e-12
+
+
+def keyword_stats(keyword_scores: dict) -> List[dict]:
+    """
+    Convert {keyword: YAKE score} into [{word, score, percent}] sorted by percent desc.
+    Uses inverse-score normalization (lower YAKE scores are more relevant):
+        weight_i = (1 / (score_i + eps)) / sum_j (1 / (score_j + eps))
+        percent = round(weight_i * 100, 1)
+    """
+    if not keyword_scores:
+        return []
+    invs = []
+    for kw, score in keyword_scores.items():
+        sc = float(score) if score is not None else 0.0
+        invs.append((kw, sc, 1.0 / (sc + _STATS_EPS)))
+
+    total_inv = sum(inv for (_, _, inv) in invs) or 1.0
+    result = [{'word': kw, 'score': sc, 'percent': round((inv / total_inv) * 100.0, 1)} for kw, sc, inv in invs]
+    result.sort(key=lambda x: x['percent'], reverse=True)
+    return result
@@ -1,156 +1,335 @@
 # documents/views.py
 """
 REST API for Document model. Uses DRF ModelViewSet to provide:
- - list()  -> GET /api/documents/
+ - list()  -> GET /api/documents/  (summaries; ?fields=a,b,... for specific full fields;
+             cursor-paginated newest first, follow `next`)
  - retrieve() -> GET /api/documents/<id>/
- - create() -> POST /api/documents/  (multipart form with 'file')
- - destroy() -> DELETE /api/documents/<id>/
+ - create() -> POST /api/documents/  (multipart form with 'file'; extraction runs in background)
+ - destroy() -> DELETE /api/documents/<id>/ (also deletes the stored file once unreferenced)
+ - bulk -> POST /api/documents/bulk/ (many files and/or zip/tar archives in one request)
 Additionally:
- - search -> GET /api/documents/search/?q=keyword
- - keyword-stats -> GET /api/documents/<id>/keyword-stats/
- - debug -> GET /api/documents/<id>/debug/ (diagnostic)
- - download -> GET /api/documents/<id>/download/
+ - search -> GET /api/documents/search/?q=keyword[&op=and|or] (inverted index, ranked, cursor-paginated)
+ - by-keyword -> GET /api/documents/by-keyword/?keyword=a&keyword=b (exact keywords, with facet counts)
+ - status -> GET /api/documents/<id>/status/ (extraction job state)
+ - keyword-stats -> GET /api/documents/<id>/keyword-stats/ (precomputed, ETag/Last-Modified)
+ - keyword-stats (batch) -> GET /api/documents/keyword-stats/?ids=<id1>,<id2>
+ - debug -> GET /api/documents/<id>/debug/ (stored extraction diagnostics; ?reextract=1 to run again)
+ - near-duplicates -> GET /api/documents/<id>/near-duplicates/ (MinHash/LSH, ?threshold=)
+ - similar -> GET /api/documents/<id>/similar/?k=10 (keyword TF-IDF cosine, top-k)
+ - download -> GET /api/documents/<id>/download/ (Range requests, ETag, optional X-Sendfile)
+Outside the viewset:
+ - metrics_view -> GET /api/metrics/ (Prometheus text format; bearer token or local clients only)
 """
 
+import hashlib
+import hmac
 import os
+import uuid
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from django.http import FileResponse, Http404
-from django.db.models import Q
+from django.db import transaction
+from django.db.models.functions import Coalesce, Length, Substr
+from django.conf import settings
+from django.http import Http404, HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
 
+from . import metrics
+from .downloads import file_download_response
+from .fuzzy_index import expand_terms
+from .keyword_index import DEFAULT_FACETS, documents_with_keywords, keyword_facets
+from .minhash import default_threshold, near_duplicates
+from .mixins import DocumentListFieldsMixin
 from .models import Document
+from .pagination import DocumentCursorPagination, RankedCursorPagination
 from .serializers import DocumentSerializer
-from .utils.extractors import extract_text_from_file
-from .utils.keywords import extract_keywords_with_scores, detect_language
+from .similarity import get_index as get_similarity_index
+from .pipeline import compute_document_fields, schedule_bulk_extraction, schedule_extraction
+from .search_index import rank_term_groups, search_documents, tokenize
+from .uploads import ArchiveLimitExceeded, is_archive, iter_archive_uploads, use_hashing_upload_handler, upload_sha256
 
-# small epsilon to prevent division by zero when converting scores to weights
-_EPS = 1e-12
+# characters of extracted text shown by the debug action
+_DEBUG_SAMPLE_CHARS = 2000
 
+# columns read by the keyword-stats endpoints
+_KEYWORD_STATS_COLUMNS = ('id', 'keywordStats', 'keywordsUpdated')
+# same bound as the largest list page, so the UI can fetch a page's stats at once
+_KEYWORD_STATS_MAX_IDS = 100
+# by-keyword: keywords combined in one filter, facet counts returned at most
+_KEYWORD_FILTER_MAX = 10
+_FACETS_MAX = 100
+# similar: default / largest k, and extra candidates fetched in case some were deleted
+_SIMILAR_DEFAULT_K = 10
+_SIMILAR_MAX_K = 100
+_SIMILAR_SLACK = 10
 
-class DocumentViewSet(viewsets.ModelViewSet):
+
+def _conditional_response(request, docs, body):
+    """
+    Response for data derived from the keyword stats of `docs`, with ETag and
+    Last-Modified validators. The ETag covers (id, keywordsUpdated) of every
+    document, so it changes whenever any of their stats are rewritten.
+    `body` is only called when the client's cached copy is stale.
+    """
+    stamps = [d.keywordsUpdated for d in docs if d.keywordsUpdated]
+    last_modified = max(stamps) if stamps else None
+    version = '|'.join(f"{d.id}:{d.keywordsUpdated.isoformat() if d.keywordsUpdated else ''}" for d in docs)
+    etag = quote_etag(hashlib.sha256(version.encode('utf-8')).hexdigest()[:32])
+    last_modified_ts = int(last_modified.timestamp()) if last_modified else None
+
+    not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified_ts)
+    response = not_modified if not_modified is not None else Response(body())
+    response['ETag'] = etag
+    if last_modified_ts is not None:
+        response['Last-Modified'] = http_date(last_modified_ts)
+    return response
+
+
+class DocumentViewSet(DocumentListFieldsMixin, viewsets.ModelViewSet):
     """
     Document viewset: handles all CRUD plus search and stats.
+    list/search return summaries; see documents/mixins.py for ?fields=.
     """
-    queryset = Document.objects.all().order_by('-creationDate')
+    queryset = Document.objects.all().order_by('-creationDate', '-id')
     serializer_class = DocumentSerializer
     lookup_field = 'id'
+    pagination_class = DocumentCursorPagination
+    summary_actions = ('list', 'search', 'by_keyword')
 
     def create(self, request, *args, **kwargs):
         """
         Handle file upload (multipart/form-data with key 'file'):
-         - save the uploaded file (Document.file)
-         - extract text from file (PDF selectable text or image OCR)
-         - detect language, extract keywords using YAKE
-         - store data, keywords, keyword_scores, language
-         - return created DocumentSerializer JSON
+         - save the uploaded file (Document.file) with status='pending'
+         - queue extraction on the background pool (see documents/pipeline.py):
+           text extraction, language detection, YAKE keywords
+         - return 202 with the DocumentSerializer JSON; poll status/ for progress
         """
+        # stream the upload to a temp file, hashing chunks as they are written
+        use_hashing_upload_handler(request)
         upload = request.FILES.get('file')
         if not upload:
             return Response({'detail': 'No file provided.'}, status=status.HTTP_400_BAD_REQUEST)
 
-        # create instance and save file
+        # create instance and save file (a rename of the temp file on local storage)
         doc = Document()
         doc.file = upload
         doc.fileName = upload.name
         doc.fileSize = upload.size
         doc.contentType = upload.content_type if hasattr(upload, 'content_type') else ''
-        doc.save()  # ensure file is written to disk
+        doc.contentHash = upload_sha256(upload)
+        doc.status = Document.STATUS_PENDING
+        content_type = metrics.content_type_label(doc.contentType)
+        metrics.FILE_BYTES.observe(doc.fileSize or 0, content_type=content_type)
+        with metrics.STAGE_DURATION.time(stage='store', content_type=content_type, language=''):
+            doc.save()  # ensure file is written to disk
 
-        # read file bytes (useful for extractor)
-        file_path = getattr(doc.file, 'path', None)
-        file_bytes = None
-        try:
-            if file_path:
-                with open(file_path, 'rb') as f:
-                    file_bytes = f.read()
-        except Exception:
-            file_bytes = None
-
-        # Use unified extractor (PDF selectable text + image OCR)
-        extracted_text = extract_text_from_file(file_path=file_path, file_bytes=file_bytes, content_type=doc.contentType) or ''
-
-        # detect language (optional) and extract keywords with YAKE
-        lang = detect_language(extracted_text) if extracted_text else None
-        kw_with_scores = extract_keywords_with_scores(extracted_text, max_ngram=3, top_k=40, lang_hint=lang)
-
-        # Build unique keywords list and scores mapping
-        keywords = []
-        keyword_scores = {}
-        for kw, score in kw_with_scores:
-            if kw not in keyword_scores:
-                keyword_scores[kw] = score
-                keywords.append(kw)
-
-        # Save fields back to DB
-        doc.data = extracted_text
-        doc.keywords = keywords
-        doc.keyword_scores = keyword_scores
-        doc.language = lang or ''
-        doc.save(update_fields=['data', 'keywords', 'keyword_scores', 'language'])
+        schedule_extraction(doc.id)
 
         serializer = self.get_serializer(doc, context={'request': request})
         headers = self.get_success_headers(serializer.data)
-        return Response(serializer.data, status=status.HTTP_201_CREATED, headers=headers)
+        return Response(serializer.data, status=status.HTTP_202_ACCEPTED, headers=headers)
+
+    def perform_destroy(self, instance):
+        # identical uploads share one stored file; it goes with its last document
+        instance.delete_with_file()
+
+    @action(detail=False, methods=['post'], url_path='bulk')
+    def bulk_upload(self, request):
+        """
+        Upload many files in one request (multipart/form-data):
+         - any number of 'files' (or 'file') parts, and/or
+         - zip / tar(.gz|.bz2|.xz) archives, whose members are stored as separate documents
+        Files are written to storage, inserted with one bulk_create and extracted on
+        a process pool (pipeline.schedule_bulk_extraction). At most
+        DOCUMENTS_BULK_MAX_FILES (default 1000) documents per request; Django's
+        DATA_UPLOAD_MAX_NUMBER_FILES also caps the number of multipart parts.
+        Archives are limited to DOCUMENTS_BULK_MAX_BYTES (default 1 GiB) unpacked in
+        total and DOCUMENTS_BULK_MAX_MEMBERS (default 10000) entries each; beyond
+        that the whole request is rejected with 400 and nothing is stored.
+        Returns 202 with one entry per file, in upload order:
+        {"id", "fileName", "status": "pending"} or {"fileName", "status": "rejected", "detail"}.
+        """
+        use_hashing_upload_handler(request)
+        uploads = request.FILES.getlist('files') + request.FILES.getlist('file')
+        if not uploads:
+            return Response({'detail': 'No files provided.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        max_files = getattr(settings, 'DOCUMENTS_BULK_MAX_FILES', 1000)
+        max_bytes = getattr(settings, 'DOCUMENTS_BULK_MAX_BYTES', 1 << 30)
+        max_members = getattr(settings, 'DOCUMENTS_BULK_MAX_MEMBERS', 10000)
+        unpacked = 0
+        docs = []
+        results = []
+        try:
+            for upload in uploads:
+                if len(docs) >= max_files:
+                    results.append({'fileName': upload.name, 'status': 'rejected',
+                                    'detail': f'At most {max_files} files per request.'})
+                    continue
+                if not is_archive(upload):
+                    docs.append(self._store_upload(upload))
+                    results.append({'id': str(docs[-1].id), 'fileName': upload.name, 'status': docs[-1].status})
+                    continue
+                try:
+                    for member in iter_archive_uploads(upload, max_files - len(docs),
+                                                       max_bytes - unpacked, max_members):
+                        try:
+                            docs.append(self._store_upload(member))
+                        finally:
+                            member.close()
+                        unpacked += member.size
+                        results.append({'id': str(docs[-1].id), 'fileName': member.name, 'status': docs[-1].status})
+                except ArchiveLimitExceeded:
+                    raise
+                except ValueError as exc:
+                    results.append({'fileName': upload.name, 'status': 'rejected', 'detail': str(exc)})
+
+            with transaction.atomic():
+                Document.objects.bulk_create(docs, batch_size=500)
+        except Exception as exc:
+            # nothing was inserted; remove the files this request left unreferenced,
+            # but not blobs that existing documents share
+            stored = {doc.file.name: doc for doc in docs if doc.file}
+            for name, doc in stored.items():
+                Document.release_file(doc.file.storage, name, doc.contentHash)
+            if isinstance(exc, ArchiveLimitExceeded):
+                return Response({'detail': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+            raise
+
+        schedule_bulk_extraction([doc.id for doc in docs])
+        return Response({'count': len(docs), 'results': results}, status=status.HTTP_202_ACCEPTED)
+
+    @staticmethod
+    def _store_upload(upload) -> Document:
+        """Write one upload to storage and return its unsaved, pending Document."""
+        doc = Document(
+            fileName=upload.name,
+            fileSize=upload.size,
+            contentType=getattr(upload, 'content_type', '') or '',
+            contentHash=upload_sha256(upload),
+            status=Document.STATUS_PENDING,
+        )
+        content_type = metrics.content_type_label(doc.contentType)
+        metrics.FILE_BYTES.observe(doc.fileSize or 0, content_type=content_type)
+        with metrics.STAGE_DURATION.time(stage='store', content_type=content_type, language=''):
+            doc.file.save(upload.name, upload, save=False)
+        return doc
+
+    @action(detail=True, methods=['get'], url_path='status')
+    def job_status(self, request, id=None):
+        """
+        Extraction job status for one document.
+        Example: GET /api/documents/<id>/status/ -> {"id": ..., "status": "running"}
+        """
+        try:
+            doc = self.get_object()
+        except Exception:
+            raise Http404("Document not found")
+        return Response({'id': str(doc.id), 'status': doc.status})
 
     @action(detail=False, methods=['get'], url_path='search')
     def search(self, request):
         """
-        Search endpoint: searches fileName, data (extracted text), and keywords list.
-        Example: GET /api/documents/search/?q=invoice
+        Search endpoint backed by the inverted index (documents/search_index.py).
+        Matches words of fileName and the extracted text; results are ranked by tf-idf.
+        Example: GET /api/documents/search/?q=invoice+tax&op=or
+         - op=and (default): every term must appear
+         - op=or: any term may appear
+         - fuzzy=1: terms also match close spellings of file name / keyword words
+           (documents/fuzzy_index.py); `terms` in the response lists what each
+           query term was matched as
+        Pages are keyed on (score, id) of the last result: follow `next`/`previous`.
         """
         q = request.GET.get('q', '').strip()
         if not q:
             return Response({'detail': 'Query param q is required.'}, status=status.HTTP_400_BAD_REQUEST)
 
-        # Simple icontains search across fields
-        qs = Document.objects.filter(
-            Q(fileName__icontains=q) |
-            Q(data__icontains=q) |
-            Q(keywords__icontains=q)
-        ).order_by('-creationDate')
+        op = request.GET.get('op', 'and').lower()
+        if op not in ('and', 'or'):
+            return Response({'detail': 'Query param op must be "and" or "or".'}, status=status.HTTP_400_BAD_REQUEST)
+
+        fuzzy = request.GET.get('fuzzy', '').lower() in ('1', 'true', 'yes')
+        if fuzzy:
+            words = list(dict.fromkeys(tokenize(q)))
+            groups = expand_terms(words)
+            ranked = rank_term_groups(groups, mode=op)
+        else:
+            ranked = search_documents(q, mode=op)
 
-        page = self.paginate_queryset(qs)
-        if page is not None:
-            serializer = self.get_serializer(page, many=True, context={'request': request})
-            return self.get_paginated_response(serializer.data)
+        # only the requested page of documents is loaded from the DB
+        paginator = RankedCursorPagination()
+        ids = paginator.paginate_ranked(ranked, request)
+        docs = self.get_queryset().in_bulk(ids)
+        results = [docs[doc_id] for doc_id in ids if doc_id in docs]
 
-        serializer = self.get_serializer(qs, many=True, context={'request': request})
-        return Response(serializer.data)
+        serializer = self.get_serializer(results, many=True, context={'request': request})
+        response = paginator.get_paginated_response(serializer.data)
+        if fuzzy:
+            response.data['terms'] = {word: list(group) for word, group in zip(words, groups)}
+        return response
+
+    @action(detail=False, methods=['get'], url_path='by-keyword')
+    def by_keyword(self, request):
+        """
+        Documents having every given keyword (exact match, case-insensitive), read
+        from the DocumentKeyword index (documents/keyword_index.py).
+        Example: GET /api/documents/by-keyword/?keyword=tax&keyword=invoice&facets=10
+        Results are newest first and cursor-paginated like list(); `facets` holds
+        the most frequent other keywords over the whole result set, with counts.
+        """
+        keywords = [k.strip() for raw in request.GET.getlist('keyword') for k in raw.split(',') if k.strip()]
+        if not keywords:
+            return Response({'detail': 'Query param keyword is required.'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(keywords) > _KEYWORD_FILTER_MAX:
+            return Response({'detail': f'At most {_KEYWORD_FILTER_MAX} keywords per request.'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        try:
+            facet_limit = max(0, min(int(request.GET.get('facets', DEFAULT_FACETS)), _FACETS_MAX))
+        except ValueError:
+            return Response({'detail': 'Query param facets must be a number.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        matching = documents_with_keywords(keywords)
+        page = self.paginate_queryset(self.get_queryset().filter(id__in=matching))
+        serializer = self.get_serializer(page, many=True, context={'request': request})
+        response = self.get_paginated_response(serializer.data)
+        response.data['facets'] = keyword_facets(matching, facet_limit, exclude=keywords) if facet_limit else []
+        return response
 
     @action(detail=True, methods=['get'], url_path='keyword-stats')
     def keyword_stats(self, request, id=None):
         """
-        Return keywords with score and normalized percent.
-        Conversion uses inverse-score normalization:
-            weight_i = (1 / (score_i + eps)) / sum_j (1 / (score_j + eps))
-            percent = round(weight_i * 100, 1)
-        This treats lower YAKE scores as more relevant.
+        Return keywords with score and normalized percent, strongest first.
+        The list is computed when keywords are written (utils/keywords.keyword_stats)
+        and served as stored. Responses carry ETag/Last-Modified; a matching
+        If-None-Match / If-Modified-Since gets 304 without a body.
         """
         try:
-            doc = self.get_object()
+            doc = self.get_queryset().only(*_KEYWORD_STATS_COLUMNS).get(id=id)
         except Exception:
             raise Http404("Document not found")
+        return _conditional_response(request, [doc], lambda: doc.keywordStats or [])
 
-        keyword_scores = doc.keyword_scores or {}
-        if not keyword_scores:
-            return Response([])
-
-        invs = []
-        for kw, score in keyword_scores.items():
-            sc = float(score) if score is not None else 0.0
-            inv = 1.0 / (sc + _EPS)
-            invs.append((kw, sc, inv))
-
-        total_inv = sum(inv for (_, _, inv) in invs) or 1.0
-        result = []
-        for kw, sc, inv in invs:
-            percent = round((inv / total_inv) * 100.0, 1)
-            result.append({'word': kw, 'score': sc, 'percent': percent})
+    @action(detail=False, methods=['get'], url_path='keyword-stats')
+    def keyword_stats_batch(self, request):
+        """
+        Keyword stats of several documents in one round trip.
+        Example: GET /api/documents/keyword-stats/?ids=<id1>,<id2>
+        -> {"<id1>": [{word, score, percent}, ...], ...}; unknown ids are left out.
+        """
+        raw = [i.strip() for i in request.GET.get('ids', '').split(',') if i.strip()]
+        if not raw:
+            return Response({'detail': 'Query param ids is required.'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(raw) > _KEYWORD_STATS_MAX_IDS:
+            return Response({'detail': f'At most {_KEYWORD_STATS_MAX_IDS} ids per request.'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        try:
+            ids = [uuid.UUID(i) for i in raw]
+        except ValueError:
+            return Response({'detail': 'Query param ids must be document ids.'}, status=status.HTTP_400_BAD_REQUEST)
 
-        # sort by percent desc so UI can show strongest keywords first
-        result.sort(key=lambda x: x['percent'], reverse=True)
-        return Response(result)
+        docs = list(self.get_queryset().only(*_KEYWORD_STATS_COLUMNS).filter(id__in=ids).order_by('id'))
+        return _conditional_response(request, docs, lambda: {str(d.id): d.keywordStats or [] for d in docs})
 
     @action(detail=True, methods=['get'], url_path='debug')
     def debug(self, request, id=None):
@@ -160,55 +339,122 @@ class DocumentViewSet(viewsets.ModelViewSet):
          - extracted_text_length
          - sample_text (first N chars)
          - stored keywords and their tokenized form (helps debug matches)
+         - diagnostics recorded at extraction time: extractor used, per-page
+           character counts, seconds per stage, OCR confidence
         Useful to see whether OCR / extraction produced text.
+        Reads the stored extraction result; ?reextract=1 runs extraction again
+        on the stored file (nothing is saved) and reports that run instead.
         """
+        reextract = request.GET.get('reextract', '').lower() in ('1', 'true', 'yes')
         try:
-            doc = self.get_object()
+            if reextract:
+                doc = self.get_object()
+            else:
+                # the database cuts the sample; the full text is not loaded (unless stored compressed)
+                doc = (self.get_queryset()
+                       .only('id', 'file', 'contentType', 'keywords', 'diagnostics', 'textCompressed')
+                       .annotate(sample=Substr('inlineData', 1, _DEBUG_SAMPLE_CHARS),
+                                 data_length=Coalesce('compressedText__chars', Length('inlineData')))
+                       .get(id=id))
         except Exception:
             raise Http404("Document not found")
 
-        file_path = getattr(doc.file, 'path', None)
-        if not file_path or not os.path.exists(file_path):
-            return Response({'detail': 'File missing on server.'}, status=status.HTTP_404_NOT_FOUND)
-
-        extracted = extract_text_from_file(file_path=file_path, content_type=doc.contentType) or ''
-        sample = extracted[:2000]
-        token_sample = []
-        try:
-            import re
-            tokens = re.findall(r"[^\W_]+", (extracted or '').lower(), flags=re.UNICODE)
-            token_sample = tokens[:200]
-        except Exception:
-            token_sample = []
+        if reextract:
+            file_path = getattr(doc.file, 'path', None)
+            if not file_path or not os.path.exists(file_path):
+                return Response({'detail': 'File missing on server.'}, status=status.HTTP_404_NOT_FOUND)
+            fields = compute_document_fields(file_path=file_path, content_type=doc.contentType)
+            extracted_length = len(fields['data'])
+            sample = fields['data'][:_DEBUG_SAMPLE_CHARS]
+            diagnostics = fields['diagnostics']
+        else:
+            extracted_length = doc.data_length or 0
+            sample = doc.data[:_DEBUG_SAMPLE_CHARS] if doc.textCompressed else (doc.sample or '')
+            diagnostics = doc.diagnostics or {}
 
+        token_sample = tokenize(sample)[:200]
         stored_keywords = doc.keywords or []
-        keyword_details = []
-        for kw in stored_keywords:
-            # show keyword tokens and an attempt count (re-counting here is optional)
-            kw_tokens = []
-            try:
-                import re
-                kw_tokens = re.findall(r"[^\W_]+", kw.lower(), flags=re.UNICODE)
-            except Exception:
-                kw_tokens = []
-            keyword_details.append({'word': kw, 'tokens': kw_tokens})
+        keyword_details = [{'word': kw, 'tokens': tokenize(kw)} for kw in stored_keywords]
 
         return Response({
-            'extracted_text_length': len(extracted),
+            'extracted_text_length': extracted_length,
             'sample_text': sample,
             'token_count': len(token_sample),
             'tokens_sample': token_sample,
             'stored_keywords': stored_keywords,
             'keyword_details': keyword_details,
+            'diagnostics': diagnostics,
+            'reextracted': reextract,
         })
 
+    @action(detail=True, methods=['get'], url_path='near-duplicates')
+    def near_duplicates(self, request, id=None):
+        """
+        Documents whose extracted text nearly matches this one (re-scans, edited
+        copies), found through the MinHash/LSH index (documents/minhash.py).
+        Example: GET /api/documents/<id>/near-duplicates/?threshold=0.9
+        -> {"id", "threshold", "indexed", "results": [{id, fileName, similarity}, ...]}
+        `similarity` estimates the Jaccard similarity of word shingles; `indexed`
+        is false while the document has no signature (no text extracted yet).
+        """
+        try:
+            doc = self.get_queryset().only('id').get(id=id)
+        except Exception:
+            raise Http404("Document not found")
+        try:
+            threshold = float(request.GET.get('threshold', default_threshold()))
+        except ValueError:
+            return Response({'detail': 'Query param threshold must be a number.'}, status=status.HTTP_400_BAD_REQUEST)
+        if not 0.0 < threshold <= 1.0:
+            return Response({'detail': 'Query param threshold must be in (0, 1].'}, status=status.HTTP_400_BAD_REQUEST)
+
+        matches = near_duplicates(doc.id, threshold)
+        names = Document.objects.only('id', 'fileName').in_bulk([doc_id for doc_id, _ in matches or []])
+        results = [{'id': str(doc_id), 'fileName': names[doc_id].fileName, 'similarity': similarity}
+                   for doc_id, similarity in matches or [] if doc_id in names]
+        return Response({'id': str(doc.id), 'threshold': threshold, 'indexed': matches is not None,
+                         'results': results})
+
+    @action(detail=True, methods=['get'], url_path='similar')
+    def similar(self, request, id=None):
+        """
+        "More like this": the k documents whose keyword TF-IDF vectors are closest
+        (cosine) to this one's, from the process-wide matrix in documents/similarity.py.
+        Example: GET /api/documents/<id>/similar/?k=10
+        -> {"id", "indexed", "results": [{id, fileName, similarity}, ...]}
+        `indexed` is false while the document has no vector (no keywords yet).
+        """
+        try:
+            doc = self.get_queryset().only('id').get(id=id)
+        except Exception:
+            raise Http404("Document not found")
+        try:
+            k = int(request.GET.get('k', _SIMILAR_DEFAULT_K))
+        except ValueError:
+            return Response({'detail': 'Query param k must be a number.'}, status=status.HTTP_400_BAD_REQUEST)
+        k = max(1, min(k, _SIMILAR_MAX_K))
+
+        index = get_similarity_index()
+        # a few extra candidates cover documents deleted since the index last saw them
+        matches = index.most_similar(doc.id, k + _SIMILAR_SLACK)
+        names = Document.objects.only('id', 'fileName').in_bulk([doc_id for doc_id, _ in matches or []])
+        results = []
+        for doc_id, score in matches or []:
+            if doc_id not in names:
+                index.discard(doc_id)
+            elif len(results) < k:
+                results.append({'id': str(doc_id), 'fileName': names[doc_id].fileName, 'similarity': score})
+        return Response({'id': str(doc.id), 'indexed': matches is not None, 'results': results})
+
     @action(detail=True, methods=['get'], url_path='download')
     def download(self, request, id=None):
         """
         Serve the uploaded file as an attachment (download).
+        Supports Range/If-Range (206), ETag from the content hash and an
+        X-Sendfile / X-Accel-Redirect hand-off; see documents/downloads.py.
         """
         try:
-            doc = self.get_object()
+            doc = self.get_queryset().only('id', 'file', 'fileName', 'contentType', 'contentHash').get(id=id)
         except Exception:
             raise Http404("Document not found")
 
@@ -219,8 +465,25 @@ class DocumentViewSet(viewsets.ModelViewSet):
         if not os.path.exists(file_path):
             return Response({'detail': 'File missing on server.'}, status=status.HTTP_404_NOT_FOUND)
 
-        response = FileResponse(open(file_path, 'rb'), as_attachment=True, filename=doc.fileName)
-        if doc.contentType:
-            response['Content-Type'] = doc.contentType
-        response['Content-Length'] = str(doc.fileSize or '')
-        return response
+        return file_download_response(request, doc, file_path)
+
+
+def metrics_view(request):
+    """
+    Pipeline metrics (documents/metrics.py) in the Prometheus text format.
+    With DOCUMENTS_METRICS_TOKEN set, only answered for requests carrying
+    `Authorization: Bearer <token>`. Otherwise only for clients whose
+    REMOTE_ADDR is in DOCUMENTS_METRICS_ALLOWED_IPS (default: localhost). Behind
+    a reverse proxy on the same host every request comes from the proxy's
+    address, so such deployments should set the token instead.
+    """
+    token = getattr(settings, 'DOCUMENTS_METRICS_TOKEN', None)
+    if token:
+        scheme, _, given = request.META.get('HTTP_AUTHORIZATION', '').partition(' ')
+        if scheme.lower() != 'bearer' or not hmac.compare_digest(given.strip().encode(), str(token).encode()):
+            raise Http404()
+    else:
+        allowed = getattr(settings, 'DOCUMENTS_METRICS_ALLOWED_IPS', ('127.0.0.1', '::1'))
+        if request.META.get('REMOTE_ADDR') not in allowed:
+            raise Http404()
+    return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
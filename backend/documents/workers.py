@@ -0,0 +1,61 @@
+# documents/workers.py
+"""
+Entry points for the spawn process pools (bulk uploads, backfill_keywords).
+
+A spawned worker unpickles its initializer and tasks by importing the module
+that defines them, before anything has called django.setup(). This module
+therefore imports no models at load time: init_django() is the pool
+initializer, and the tasks import the pipeline lazily.
+"""
+
+import django
+
+
+def init_django():
+    # pool workers run the same production code, including the DB-backed extraction cache
+    django.setup()
+
+
+def extract_file(task) -> dict:
+    """
+    Bulk-upload task: extract one stored file, (file_path, content_type, content_hash),
+    and compute its MinHash signature. One document per process, so PDFs are not
+    split over a page pool as well.
+    """
+    from django.db import close_old_connections
+    from .minhash import signature
+    from .pipeline import extract_document_fields
+
+    file_path, content_type, content_hash = task
+    try:
+        fields = extract_document_fields(file_path=file_path, content_type=content_type,
+                                         content_hash=content_hash, pdf_workers=1)
+        # NumPy work stays in the worker process too
+        fields['minhash'] = signature(fields['data'])
+        return fields
+    finally:
+        close_old_connections()
+
+
+def backfill_file(task):
+    """
+    backfill_keywords task: hash the stored file and, unless it is unchanged since
+    the last run, extract it and compute its MinHash signature. Returns (doc_id, outcome, content_hash, fields)
+    with outcome one of 'processed', 'skipped', 'failed'.
+    """
+    from .minhash import signature
+    from .pipeline import EXTRACTOR_VERSION, extract_document_fields
+    from .utils.hashing import sha256_of_file
+
+    doc_id, path, content_type, known_hash, known_version, force, use_cache, pdf_workers = task
+    try:
+        content_hash = sha256_of_file(path)
+        if not force and content_hash == known_hash and known_version == EXTRACTOR_VERSION:
+            return doc_id, 'skipped', content_hash, None
+        fields = extract_document_fields(file_path=path, content_type=content_type,
+                                         content_hash=content_hash if use_cache else None,
+                                         pdf_workers=pdf_workers)
+        fields['minhash'] = signature(fields['data'])
+        return doc_id, 'processed', content_hash, fields
+    except Exception as exc:
+        return doc_id, 'failed', None, {'error': str(exc)}
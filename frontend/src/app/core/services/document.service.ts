@@ -32,6 +32,16 @@ export interface DocumentDto {
   fileUrl?: string | null;
   fileSize?: number | null;
   contentType?: string | null;
+  // background extraction state: pending | running | done | failed
+  status?: string | null;
+  // list/search responses: first characters of the extracted text (full `data` only on get())
+  snippet?: string | null;
+}
+
+// one page of the document list; `next` is the url of the following page (null on the last)
+export interface DocumentPage {
+  results: DocumentDto[];
+  next: string | null;
 }
 
 @Injectable({ providedIn: 'root' })
@@ -41,20 +51,22 @@ export class DocumentService {
 
   constructor(private http: HttpClient) {}
 
-  // List documents. Handles paginated or non-paginated responses.
-  list(): Observable<DocumentDto[]> {
-    return this.http.get<any>(this.base).pipe(
+  // One page of documents (newest first). The list endpoint is cursor-paginated:
+  // pass a page's `next` url as `pageUrl` to fetch the following page.
+  // Handles paginated or non-paginated responses.
+  list(pageUrl?: string): Observable<DocumentPage> {
+    return this.http.get<any>(pageUrl || this.base).pipe(
       map(res => {
         // If DRF Page results format
-        if (res && Array.isArray(res.results)) return res.results as DocumentDto[];
+        if (res && Array.isArray(res.results)) return { results: res.results as DocumentDto[], next: res.next || null };
         // If API returns an array directly
-        if (Array.isArray(res)) return res as DocumentDto[];
-        // Unexpected shape -> empty array
-        return [] as DocumentDto[];
+        if (Array.isArray(res)) return { results: res as DocumentDto[], next: null };
+        // Unexpected shape -> empty page
+        return { results: [] as DocumentDto[], next: null };
       }),
       catchError(err => {
         console.error('DocumentService.list error', err);
-        return of([] as DocumentDto[]);
+        return of({ results: [] as DocumentDto[], next: null });
       })
     );
   }
@@ -81,6 +93,11 @@ export class DocumentService {
     return this.http.post<DocumentDto>(this.base, fd, { reportProgress: true, observe: 'events' as any });
   }
 
+  // Extraction job status (uploads return 202 and extract in the background)
+  getStatus(id: string): Observable<{ id: string; status: string }> {
+    return this.http.get<{ id: string; status: string }>(`${this.base}${id}/status/`);
+  }
+
   // New: fetch keyword statistics (word, score, percent) from backend
   getKeywordStats(id: string): Observable<KeywordStat[]> {
     return this.http.get<KeywordStat[]>(`${this.base}${id}/keyword-stats/`);
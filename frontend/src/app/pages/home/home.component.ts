@@ -2,9 +2,11 @@
 // Home view: loads documents, supports search/filters, viewer and a styled confirm dialog.
 // This file includes a safe `confirmMessage` getter used by the template.
 
-import { Component, OnInit } from '@angular/core';
+import { Component, OnDestroy, OnInit } from '@angular/core';
 import { CommonModule } from '@angular/common';
 import { FormsModule } from '@angular/forms';
+import { Subject, timer } from 'rxjs';
+import { filter, finalize, switchMap, take, takeUntil } from 'rxjs/operators';
 
 import { DocumentService, DocumentDto } from '../../core/services/document.service';
 import { HeaderComponent } from '../../shared/components/header/header.component';
@@ -19,8 +21,14 @@ import { ConfirmDialogComponent } from '../../shared/components/confirm-dialog/c
   templateUrl: './home.component.html',
   styleUrls: ['./home.component.scss']
 })
-export class HomeComponent implements OnInit {
+export class HomeComponent implements OnInit, OnDestroy {
+  // how often documents still being extracted ask for their status
+  static readonly STATUS_POLL_MS = 2000;
+
+  // documents loaded so far (server pages are fetched on demand, see loadMore)
   docs: DocumentDto[] = [];
+  nextUrl: string | null = null;
+  loadingMore = false;
   pageDocs: DocumentDto[] = [];
   pageIndex = 0;
   pageSize = 12;
@@ -42,22 +50,76 @@ export class HomeComponent implements OnInit {
   appliedDate = '';
   appliedType = '';
 
+  // ids whose extraction status is being polled; destroy$ stops every poll
+  private polling = new Set<string>();
+  private destroy$ = new Subject<void>();
+
   constructor(private svc: DocumentService) {}
 
   ngOnInit(): void { this.load(); }
 
+  ngOnDestroy(): void { this.destroy$.next(); this.destroy$.complete(); }
+
   load(): void {
     this.svc.list().subscribe({
-      next: (ds) => {
-        this.docs = Array.isArray(ds) ? ds : [];
+      next: (page) => {
+        this.docs = page.results;
+        this.nextUrl = page.next;
         this.populateFilterLists();
         this.pageIndex = 0;
         this.applyFilters();
+        this.watchPending();
       },
-      error: (err) => { console.error(err); this.docs = []; }
+      error: (err) => { console.error(err); this.docs = []; this.nextUrl = null; }
     });
   }
 
+  // fetch the next server page and append it; `then` runs once it is in
+  loadMore(then?: () => void): void {
+    if (!this.nextUrl || this.loadingMore) return;
+    this.loadingMore = true;
+    this.svc.list(this.nextUrl).subscribe({
+      next: (page) => {
+        this.docs = this.docs.concat(page.results);
+        this.nextUrl = page.next;
+        this.populateFilterLists();
+        this.loadingMore = false;
+        this.watchPending();
+        if (then) then();
+      },
+      error: (err) => { console.error(err); this.loadingMore = false; }
+    });
+  }
+
+  // uploads answer 202 and extract in the background: poll every document still
+  // pending/running until it is done or failed, then reload its row (keywords etc.)
+  private watchPending(): void {
+    for (const d of this.docs) {
+      if ((d.status === 'pending' || d.status === 'running') && !this.polling.has(d.id)) this.pollStatus(d.id);
+    }
+  }
+
+  private pollStatus(id: string): void {
+    this.polling.add(id);
+    timer(HomeComponent.STATUS_POLL_MS, HomeComponent.STATUS_POLL_MS).pipe(
+      switchMap(() => this.svc.getStatus(id)),
+      filter(s => s.status === 'done' || s.status === 'failed'),
+      take(1),
+      switchMap(() => this.svc.get(id)),
+      takeUntil(this.destroy$),
+      finalize(() => this.polling.delete(id))
+    ).subscribe({
+      next: (doc) => this.replaceDoc(doc),
+      // e.g. 404 once the document was deleted: stop polling it
+      error: (err) => console.error('status poll error', err)
+    });
+  }
+
+  private replaceDoc(doc: DocumentDto): void {
+    this.docs = this.docs.map(d => d.id === doc.id ? doc : d);
+    this.pageDocs = this.pageDocs.map(d => d.id === doc.id ? doc : d);
+  }
+
   populateFilterLists(){
     const dset = new Set<string>();
     const tset = new Set<string>();
@@ -82,11 +144,12 @@ export class HomeComponent implements OnInit {
 
   /**
    * Normalize Document.data to a single string used for searching.
-   * Handles KeywordDto[] or string safely.
+   * Handles KeywordDto[] or string safely; summaries without data use snippet + keywords.
    */
   private dataText(d: DocumentDto): string {
     const raw = (d as any).data;
-    if (!raw) return '';
+    // list responses are summaries: fall back to the snippet plus top keywords
+    if (!raw) return [d.snippet || '', ...(d.keywords || [])].join(' ');
 
     if (Array.isArray(raw)) {
       try {
@@ -179,7 +242,11 @@ export class HomeComponent implements OnInit {
   openViewer(doc: DocumentDto){ this.viewerDoc = doc; this.viewerVisible = true; }
   closeViewer(){ this.viewerVisible = false; this.viewerDoc = undefined; }
 
-  pageNext(){ if(this.pageIndex < this.totalPages - 1){ this.pageIndex++; this.updatePage(); } }
+  pageNext(){
+    if(this.pageIndex < this.totalPages - 1){ this.pageIndex++; this.updatePage(); return; }
+    // past the loaded documents: ask the server for the next page first
+    if(this.nextUrl){ this.loadMore(() => this.pageNext()); }
+  }
   pagePrev(){ if(this.pageIndex > 0){ this.pageIndex--; this.updatePage(); } }
   get totalPages(){ return Math.max(1, Math.ceil((this.docs?.length || 0)/this.pageSize)); }
 }